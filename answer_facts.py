@@ -0,0 +1,106 @@
+import re
+import unicodedata
+
+from pregrade import ZERO_WIDTH
+
+# Language assumed for text in each script, by the first word of its characters' Unicode names
+SCRIPT_LANGUAGES = {
+    "LATIN": "English",
+    "DEVANAGARI": "Hindi",
+    "BENGALI": "Bengali",
+    "GURMUKHI": "Punjabi",
+    "GUJARATI": "Gujarati",
+    "ORIYA": "Odia",
+    "TAMIL": "Tamil",
+    "TELUGU": "Telugu",
+    "KANNADA": "Kannada",
+    "MALAYALAM": "Malayalam",
+    "ARABIC": "Urdu",
+}
+# Common words of Hindi written in Latin letters
+ROMAN_HINDI = {
+    "hai", "hain", "ka", "ki", "ke", "ko", "se", "mein", "aur", "nahi", "nahin", "kya", "yah", "yeh",
+    "vah", "woh", "bhi", "tha", "thi", "hota", "hoti", "hote", "karta", "karte", "liye", "jata", "jati",
+}
+FIRST_NUMBER = re.compile(r"\d+")
+
+
+def words(text):
+    """
+    Split text into words: runs of letters, combining marks and digits, so Devanagari
+    vowel signs and viramas stay inside their word. Apostrophes and hyphens inside a word
+    ("don't", "well-known") do not split it.
+    """
+    text = unicodedata.normalize("NFKC", str(text)).translate(ZERO_WIDTH)
+    found = []
+    current = []
+    for char in text:
+        if unicodedata.category(char)[0] in "LMN":
+            current.append(char)
+        elif char in "'’-" and current:
+            current.append(char)
+        elif current:
+            found.append("".join(current).rstrip("'’-"))
+            current = []
+    if current:
+        found.append("".join(current).rstrip("'’-"))
+    return found
+
+
+def language(text, tokens=None):
+    """
+    Best guess at the language of a text from the script most of its letters are in.
+    Latin text with many common Hindi words is reported as Hindi (Roman script).
+    """
+    counts = {}
+    for char in str(text):
+        if unicodedata.category(char)[0] == "L":
+            script = unicodedata.name(char, "UNKNOWN").split(" ")[0]
+            counts[script] = counts.get(script, 0) + 1
+    if not counts:
+        return None
+    script = max(counts, key=counts.get)
+    if script == "LATIN":
+        tokens = tokens if tokens is not None else words(text)
+        if tokens and sum(token.casefold() in ROMAN_HINDI for token in tokens) * 5 >= len(tokens):
+            return "Hindi (Roman script)"
+    return SCRIPT_LANGUAGES.get(script, script.title())
+
+
+def expected_words(word_count):
+    """
+    Word count asked for by the request ("50", "50 words", "40-60"), or None when it names no number.
+    Ranges count from their lower end.
+    """
+    match = FIRST_NUMBER.search(str(word_count or ""))
+    return int(match.group()) if match else None
+
+
+def analyze(answer, word_count=None):
+    """
+    Facts about an answer worked out locally: word count, the expected word count and
+    the shortfall against it, and language.
+    """
+    tokens = words(answer)
+    expected = expected_words(word_count)
+    return {
+        "words": len(tokens),
+        "expected_words": expected,
+        "shortfall": max(0, expected - len(tokens)) if expected else 0,
+        "language": language(answer, tokens),
+    }
+
+
+def describe(facts):
+    """
+    One line stating the facts for the prompt, e.g. "37 words (13 fewer than the expected 50), in Hindi".
+    """
+    line = f"{facts['words']} word" if facts["words"] == 1 else f"{facts['words']} words"
+    if facts["expected_words"]:
+        if facts["shortfall"]:
+            line += f" ({facts['shortfall']} fewer than the expected {facts['expected_words']})"
+        else:
+            line += f" (meets the expected {facts['expected_words']})"
+    if facts["language"]:
+        line += f", in {facts['language']}"
+    return line
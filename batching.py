@@ -0,0 +1,144 @@
+import json
+import os
+import re
+
+import deadline
+import llm
+from evaluators import error_evaluation
+
+# Rough prompt size limit for one batched call, in tokens
+BATCH_TOKEN_BUDGET = int(os.environ.get("EVAL_BATCH_TOKEN_BUDGET", "6000"))
+# Upper bound on pairs packed into one call, whatever their size
+BATCH_MAX_PAIRS = int(os.environ.get("EVAL_BATCH_MAX_PAIRS", "25"))
+# Tokens reserved in the reply for every pair's score and feedback
+REPLY_TOKENS_PER_PAIR = 120
+
+
+def estimate_tokens(text):
+    """
+    Cheap token estimate (about four characters per token) used for packing batches.
+    """
+    return len(str(text)) // 4 + 1
+
+
+def plan_batches(items, fixed_tokens, budget=None, max_pairs=None):
+    """
+    Split items into batches that fit the token budget.
+    Each item is a (key, question, answer) tuple; fixed_tokens is the size of the shared
+    instruction block that every batch carries once.
+    """
+    budget = budget or BATCH_TOKEN_BUDGET
+    max_pairs = max_pairs or BATCH_MAX_PAIRS
+    batches = []
+    current = []
+    used = fixed_tokens
+    for item in items:
+        cost = estimate_tokens(item[1]) + estimate_tokens(item[2]) + REPLY_TOKENS_PER_PAIR
+        if current and (used + cost > budget or len(current) >= max_pairs):
+            batches.append(current)
+            current = []
+            used = fixed_tokens
+        current.append(item)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def build_batch_prompt(instructions, batch, feedback_sentences="2-3 sentences", pair_facts=None):
+    """
+    Pack several question-answer pairs behind one copy of the shared instructions.
+    pair_facts(question, answer), when given, returns a line of locally measured facts
+    stated under each answer.
+    """
+    pairs = []
+    for key, question, answer in batch:
+        facts = pair_facts(question, answer) if pair_facts else None
+        pairs.append(
+            f"[{key}]\nQuestion: {question}\nUser's Answer: {answer}\n"
+            + (f"Answer facts: {facts}\n" if facts else "")
+        )
+    pairs_text = "\n".join(pairs)
+    return f"""
+Evaluate each of the following question and user's answer pairs based on the following context:
+
+{instructions}
+{pairs_text}
+Apply the instructions to every pair on its own.
+Reply with only a JSON array and nothing else, one object per pair, keys in this order:
+[{{"ID": "<pair id in square brackets>", "Score": <numerical score out of 100>, "Feedback": "<{feedback_sentences} highlighting the strengths and areas for improvement, in the language of the question>"}}]
+"""
+
+
+def parse_batch_reply(text, keys):
+    """
+    Read the model's JSON array back into {key: {"Score", "Feedback"}}.
+    Entries that are missing, duplicated or malformed are left out so the caller can re-run them.
+    """
+    text = text.strip()
+    # Models often wrap JSON in a markdown code fence
+    fence = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
+    if fence:
+        text = fence.group(1)
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end == -1:
+        return {}
+    try:
+        entries = json.loads(text[start:end + 1])
+    except ValueError:
+        return {}
+
+    wanted = set(keys)
+    parsed = {}
+    seen = set()
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        key = str(entry.get("ID", "")).strip("[] ")
+        if key not in wanted:
+            continue
+        if key in seen:
+            # Two answers for the same pair, trust neither
+            parsed.pop(key, None)
+            continue
+        seen.add(key)
+        try:
+            score = int(entry.get("Score"))
+        except (TypeError, ValueError):
+            continue
+        feedback = entry.get("Feedback")
+        if not 0 <= score <= 100 or not isinstance(feedback, str) or not feedback.strip():
+            continue
+        parsed[key] = {"Score": score, "Feedback": feedback.strip()}
+    return parsed
+
+
+def evaluate_batch(instructions, batch, generate, evaluate_single, feedback_sentences="2-3 sentences",
+                   pair_facts=None):
+    """
+    Evaluate one batch with a single model call.
+    generate(prompt, pairs) returns the model text; evaluate_single(question, answer) grades one
+    pair on its own and is used for anything the batched reply dropped or garbled.
+    When the call itself fails (quota, model unavailable, deadline) every pair of the batch
+    gets an error evaluation: grading the pairs one by one would only multiply the failing calls.
+    Returns a list of evaluations in batch order.
+    """
+    keys = [key for key, _, _ in batch]
+    prompt = build_batch_prompt(instructions, batch, feedback_sentences, pair_facts)
+    try:
+        reply = generate(prompt, len(batch))
+    except llm.ModelUnavailable as e:
+        return [error_evaluation(str(e), "model_unavailable") for _ in batch]
+    except deadline.DeadlineExceeded as e:
+        return [error_evaluation(str(e), "deadline_exceeded") for _ in batch]
+    except Exception as e:
+        return [error_evaluation(str(e)) for _ in batch]
+    parsed = parse_batch_reply(reply, keys)
+
+    results = []
+    for key, question, answer in batch:
+        evaluation = parsed.get(key)
+        if evaluation is None:
+            evaluation = evaluate_single(question, answer)
+        results.append(evaluation)
+    return results
@@ -0,0 +1,225 @@
+"""
+Load benchmark for /evaluate.
+
+Drives the service at fixed concurrency levels and payload sizes and reports
+throughput, p50/p95/p99 latency and the mean time per pipeline stage (from the
+Server-Timing header). By default the app runs in-process against the local
+stub model, so no Gemini quota is used and only the service's own overhead
+and the configured fake latency are measured; --url targets a running server.
+
+    python benchmarks/bench_evaluate.py --concurrency 1 8 32 --sizes 1 10 30 --save
+    python benchmarks/bench_evaluate.py --compare benchmarks/results/<commit>.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+sys.path.insert(0, ROOT)
+
+# Keep benchmark state out of the working tree and off the persistent caches
+_scratch = tempfile.mkdtemp(prefix="bench-")
+os.environ.setdefault("EVAL_CACHE_PATH", "")
+os.environ.setdefault("JOB_DB", os.path.join(_scratch, "jobs.sqlite3"))
+os.environ.setdefault("REFERENCE_DB", os.path.join(_scratch, "reference_docs.sqlite3"))
+os.environ.setdefault("CONTEXT_CACHE_DB", os.path.join(_scratch, "context_cache.sqlite3"))
+os.environ.setdefault("SUBMISSION_DB", os.path.join(_scratch, "submissions.sqlite3"))
+os.environ.setdefault("SEARCH_PROVIDER", "stub")
+os.environ.setdefault("JOB_WORKERS", "0")
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[position]
+
+
+def parse_server_timing(header):
+    stages = {}
+    for part in filter(None, (item.strip() for item in (header or "").split(","))):
+        fields = part.split(";")
+        for field in fields[1:]:
+            if field.startswith("dur="):
+                stages[fields[0]] = float(field[4:])
+    return stages
+
+
+def make_payload(size, mode, serial):
+    # Every request is unique so the evaluation cache does not hide the model stage
+    return {
+        "mode": mode,
+        "Class": "10th",
+        "Board": "CBSE",
+        "word_count": 30,
+        "questions": [{"ID": str(i), "Text": f"Explain topic {i} of request {serial}."} for i in range(size)],
+        "answers": [{"ID": str(i), "Text": f"Answer {i} for request {serial} " * 5} for i in range(size)],
+    }
+
+
+class InProcessClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def post(self, payload):
+        response = self.client.post("/evaluate", json=payload)
+        return response.status_code, response.headers.get("Server-Timing")
+
+
+class HTTPClient:
+    def __init__(self, url):
+        self.url = url.rstrip("/") + "/evaluate"
+
+    def post(self, payload):
+        request = urllib.request.Request(
+            self.url, data=json.dumps(payload).encode("utf-8"), headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=300) as response:
+                response.read()
+                return response.status, response.headers.get("Server-Timing")
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+
+def run_level(make_client, concurrency, size, requests, mode):
+    latencies = []
+    stage_totals = {}
+    errors = 0
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        nonlocal errors
+        client = make_client()
+        while True:
+            with lock:
+                serial = next(counter, None)
+            if serial is None:
+                return
+            payload = make_payload(size, mode, f"{concurrency}-{size}-{serial}-{time.time()}")
+            started = time.perf_counter()
+            status, timing = client.post(payload)
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(elapsed)
+                if status != 200:
+                    errors += 1
+                for name, duration in parse_server_timing(timing).items():
+                    stage_totals[name] = stage_totals.get(name, 0.0) + duration
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "size": size,
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / wall, 3),
+        "pairs_per_second": round(requests * size / wall, 3),
+        "p50_ms": round(percentile(latencies, 0.50), 1),
+        "p95_ms": round(percentile(latencies, 0.95), 1),
+        "p99_ms": round(percentile(latencies, 0.99), 1),
+        "stages_ms": {name: round(total / requests, 2) for name, total in sorted(stage_totals.items())},
+    }
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(report, baseline_path, threshold):
+    """
+    Print the change against a saved report; returns False when any level regressed
+    by more than threshold (a fraction) in throughput or p95 latency.
+    """
+    with open(baseline_path, encoding="utf-8") as handle:
+        baseline = json.load(handle)
+    previous = {(row["concurrency"], row["size"]): row for row in baseline["results"]}
+    ok = True
+    print(f"\nCompared with {baseline['commit']}:")
+    for row in report["results"]:
+        old = previous.get((row["concurrency"], row["size"]))
+        if old is None:
+            continue
+        throughput = row["throughput_rps"] / old["throughput_rps"] - 1 if old["throughput_rps"] else 0.0
+        p95 = row["p95_ms"] / old["p95_ms"] - 1 if old["p95_ms"] else 0.0
+        regressed = throughput < -threshold or p95 > threshold
+        ok = ok and not regressed
+        print(f"  c={row['concurrency']:<4} n={row['size']:<4} throughput {throughput:+.1%}  p95 {p95:+.1%}"
+              f"{'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark /evaluate throughput and latency.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="concurrent clients")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 30], help="question-answer pairs per request")
+    parser.add_argument("--requests", type=int, default=40, help="requests per level")
+    parser.add_argument("--mode", default="class_board", help="evaluation mode")
+    parser.add_argument("--url", default=None, help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--latency-ms", type=float, default=200, help="stub model median latency")
+    parser.add_argument("--jitter", type=float, default=0.5, help="stub model latency spread")
+    parser.add_argument("--distribution", default="lognormal", choices=["fixed", "uniform", "lognormal"])
+    parser.add_argument("--error-rate", type=float, default=0.0, help="stub model failure rate")
+    parser.add_argument("--save", action="store_true", help="save the report under benchmarks/results/<commit>.json")
+    parser.add_argument("--output", default=None, help="save the report to this file")
+    parser.add_argument("--compare", default=None, help="saved report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed regression before failing")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        make_client = lambda: HTTPClient(args.url)
+    else:
+        import llm
+        from service import create_app
+
+        llm.set_backend(llm.StubBackend(args.latency_ms, args.jitter, args.distribution, args.error_rate, seed=1))
+        app = create_app(args.mode)
+        make_client = lambda: InProcessClient(app)
+
+    report = {
+        "commit": current_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {key: value for key, value in vars(args).items() if key not in ("save", "output", "compare")},
+        "results": [],
+    }
+    print(f"{'conc':>5} {'size':>5} {'rps':>8} {'pairs/s':>9} {'p50':>8} {'p95':>8} {'p99':>8} {'err':>4}  stages (mean ms)")
+    for concurrency in args.concurrency:
+        for size in args.sizes:
+            row = run_level(make_client, concurrency, size, args.requests, args.mode)
+            report["results"].append(row)
+            stages = " ".join(f"{name}={value}" for name, value in row["stages_ms"].items())
+            print(f"{concurrency:>5} {size:>5} {row['throughput_rps']:>8} {row['pairs_per_second']:>9} "
+                  f"{row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8} {row['errors']:>4}  {stages}")
+
+    output = args.output or (os.path.join(RESULTS_DIR, f"{report['commit']}.json") if args.save else None)
+    if output:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+        print(f"\nSaved {output}")
+
+    if args.compare and not compare(report, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Startup benchmark for the service.
+
+Starts fresh Python processes and measures how long importing an entry point (which
+builds the app) takes, which heavy SDKs that import pulled in, and how long until
+/ready answers 200. The processes share one state directory, so the first run is a
+cold start and the others are restarts that reuse what the first one persisted. Importing must stay free of network calls and heavy SDKs;
+--max-import-ms and --max-ready-ms turn the measurements into a check that fails
+(exit 1) when startup regresses.
+
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --module context_based --max-import-ms 600
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must only be loaded on first use, never by importing an entry point
+HEAVY_MODULES = ["google.generativeai", "langchain_community", "pypdf", "grpc"]
+
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+module = __import__({module!r})
+imported = time.perf_counter()
+heavy = [name for name in {heavy!r} if name in sys.modules]
+client = module.app.test_client()
+while client.get("/ready").status_code != 200:
+    time.sleep(0.005)
+ready = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - started) * 1000,
+    "ready_ms": (ready - started) * 1000,
+    "heavy_modules": heavy,
+}}))
+"""
+
+
+def run_once(module, backend, scratch):
+    env = dict(
+        os.environ,
+        LLM_BACKEND=backend,
+        SEARCH_PROVIDER="stub",
+        EVAL_CACHE_PATH=os.path.join(scratch, "eval_cache.sqlite3"),
+        JOB_DB=os.path.join(scratch, "jobs.sqlite3"),
+        REFERENCE_DB=os.path.join(scratch, "reference_docs.sqlite3"),
+        CONTEXT_CACHE_DB=os.path.join(scratch, "context_cache.sqlite3"),
+        SUBMISSION_DB=os.path.join(scratch, "submissions.sqlite3"),
+        PYTHONDONTWRITEBYTECODE="1",
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark service import and time to ready.")
+    parser.add_argument("--module", default="both_mcq", help="entry point to import, e.g. both_mcq or context_based")
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes to start")
+    parser.add_argument("--backend", default="stub", choices=["stub", "gemini"], help="LLM backend warmed up")
+    parser.add_argument("--max-import-ms", type=float, default=None, help="fail if the median import is slower")
+    parser.add_argument("--max-ready-ms", type=float, default=None, help="fail if the median time to ready is slower")
+    parser.add_argument("--output", default=None, help="save the report to this file")
+    args = parser.parse_args(argv)
+
+    scratch = tempfile.mkdtemp(prefix="bench-startup-")
+    runs = [run_once(args.module, args.backend, scratch) for _ in range(args.runs)]
+    report = {
+        "module": args.module,
+        "backend": args.backend,
+        "runs": args.runs,
+        "cold_ready_ms": round(runs[0]["ready_ms"], 1),
+        "import_ms": round(statistics.median(run["import_ms"] for run in runs), 1),
+        "import_ms_max": round(max(run["import_ms"] for run in runs), 1),
+        "ready_ms": round(statistics.median(run["ready_ms"] for run in runs), 1),
+        "ready_ms_max": round(max(run["ready_ms"] for run in runs), 1),
+        "heavy_modules": sorted({name for run in runs for name in run["heavy_modules"]}),
+    }
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+
+    failed = False
+    if report["heavy_modules"]:
+        print(f"FAIL: importing {args.module} loaded {', '.join(report['heavy_modules'])}")
+        failed = True
+    if args.max_import_ms is not None and report["import_ms"] > args.max_import_ms:
+        print(f"FAIL: median import {report['import_ms']} ms > {args.max_import_ms} ms")
+        failed = True
+    if args.max_ready_ms is not None and report["ready_ms"] > args.max_ready_ms:
+        print(f"FAIL: median time to ready {report['ready_ms']} ms > {args.max_ready_ms} ms")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Golden prompt check.
+
+Rebuilds the prompt of every case in benchmarks/golden_prompts.json and compares it
+with the prompt stored there, so a template or compaction change cannot alter what
+the model is asked without showing up here. Also prints each prompt's estimated token
+count with and without compaction (PROMPT_COMPACTION=0). No model is called.
+
+    python benchmarks/check_prompts.py            # exit status 1 on any difference
+    python benchmarks/check_prompts.py --update   # accept the current prompts as golden
+"""
+import argparse
+import difflib
+import json
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GOLDEN_PATH = os.path.join(ROOT, "benchmarks", "golden_prompts.json")
+sys.path.insert(0, ROOT)
+
+# Keep state out of the working tree; building prompts touches no cache, but importing does
+_scratch = tempfile.mkdtemp(prefix="prompts-")
+os.environ.setdefault("EVAL_CACHE_PATH", "")
+os.environ.setdefault("REFERENCE_DB", os.path.join(_scratch, "reference_docs.sqlite3"))
+os.environ.setdefault("CONTEXT_CACHE_DB", os.path.join(_scratch, "context_cache.sqlite3"))
+os.environ.setdefault("SEARCH_PROVIDER", "stub")
+os.environ.setdefault("LLM_BACKEND", "stub")
+
+import batching  # noqa: E402
+import llm  # noqa: E402
+import prompts  # noqa: E402
+from evaluators import EVALUATORS  # noqa: E402
+
+# Every prompt must still hold these, whatever the compaction does
+REPLY_FORMATS = ("Reply with only a JSON object", "Reply with only a JSON array")
+
+
+def build(case):
+    """
+    The prompt the service would send for a case: one pair, or a batch when the case has "pairs".
+    """
+    evaluator = EVALUATORS[case["mode"]]
+    data = case.get("data", {})
+    if "pairs" in case:
+        batch = [(str(number), question, answer) for number, (question, answer) in enumerate(case["pairs"], 1)]
+        return batching.build_batch_prompt(
+            evaluator.build_instructions(data), batch, llm.FEEDBACK_TIERS[evaluator.feedback_length(data)][0],
+            lambda question, answer: evaluator.pair_facts(question, answer, data),
+        )
+    prompt = evaluator.build_prompt(case.get("question"), case["answer"], data, case.get("extra"))
+    return prompt if isinstance(prompt, str) else "".join(map(str, prompt))
+
+
+def build_verbose(case):
+    prompts.PROMPT_COMPACTION = False
+    prompts.compact.cache_clear()
+    try:
+        return build(case)
+    finally:
+        prompts.PROMPT_COMPACTION = True
+        prompts.compact.cache_clear()
+
+
+def missing_content(case, prompt):
+    texts = [answer for _, answer in case["pairs"]] if "pairs" in case else [case["answer"]]
+    texts += [question for question, _ in case["pairs"]] if "pairs" in case else [case.get("question") or ""]
+    problems = [f"missing {text!r}" for text in texts if text not in prompt]
+    if not any(reply_format in prompt for reply_format in REPLY_FORMATS):
+        problems.append("missing the reply format")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--update", action="store_true", help="store the current prompts as the golden ones")
+    parser.add_argument("--golden", default=GOLDEN_PATH)
+    args = parser.parse_args()
+
+    with open(args.golden, encoding="utf-8") as handle:
+        golden = json.load(handle)
+
+    failures = 0
+    totals = [0, 0]
+    print(f"{'case':<28} {'mode':<12} {'tokens':>7} {'verbose':>8} {'saved':>6}")
+    for case in golden["cases"]:
+        prompt = build(case)
+        compact_tokens = batching.estimate_tokens(prompt)
+        verbose_tokens = batching.estimate_tokens(build_verbose(case))
+        totals[0] += compact_tokens
+        totals[1] += verbose_tokens
+        saved = 1 - compact_tokens / verbose_tokens
+        print(f"{case['name']:<28} {case['mode']:<12} {compact_tokens:>7} {verbose_tokens:>8} {saved:>6.0%}")
+
+        for problem in missing_content(case, prompt):
+            print(f"  {problem}")
+            failures += 1
+        if args.update:
+            case["prompt"] = prompt
+        elif prompt != case.get("prompt"):
+            failures += 1
+            diff = difflib.unified_diff(
+                (case.get("prompt") or "").splitlines(), prompt.splitlines(), "golden", "current", lineterm="",
+            )
+            print("\n".join(f"  {line}" for line in diff))
+    print(f"{'total':<41} {totals[0]:>7} {totals[1]:>8} {1 - totals[0] / totals[1]:>6.0%}")
+
+    if args.update:
+        with open(args.golden, "w", encoding="utf-8") as handle:
+            json.dump(golden, handle, ensure_ascii=False, indent=2)
+            handle.write("\n")
+        print(f"Updated {args.golden}")
+        return 0
+    if failures:
+        print(f"{failures} problem(s); run with --update if the new prompts are intended")
+        return 1
+    print("All prompts match")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""
+Offline bulk grader.
+
+Reads a JSONL file with one /evaluate payload per line (optionally carrying a
+"submission_id"), grades the submissions on a worker pool and appends one result
+line per submission to the output JSONL as soon as it is finished. Progress is
+checkpointed, so an interrupted run started again with the same arguments skips
+the submissions that are already graded. Input is streamed, so memory use does
+not grow with the size of the file.
+
+By default every submission is graded on its own. With --dedupe-window N,
+submissions are read in windows of N and, within a window, near-identical answers
+to the same question are graded once and share the evaluation, so model calls drop
+with the amount of copying.
+
+    python bulk_grade.py submissions.jsonl results.jsonl --workers 8
+    python bulk_grade.py submissions.jsonl results.jsonl --dedupe-window 200 --own-feedback
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import dedupe
+from executor import REQUEST_CONCURRENCY
+from grading import DEFAULT_MODE, grade_submission, grade_submissions, personal_feedback
+
+# Submissions read and deduplicated together; 0 (the default) grades every submission on its own
+DEDUPE_WINDOW = int(os.environ.get("BULK_DEDUPE_WINDOW", "0"))
+
+
+def grade_line(number, line, mode=DEFAULT_MODE, concurrency=None):
+    """
+    Turn one input line into one output record.
+    """
+    try:
+        data = json.loads(line)
+    except ValueError as e:
+        return {"line": number, "error": f"Invalid JSON: {e}"}
+    submission_id = data.get("submission_id", data.get("ID")) if isinstance(data, dict) else None
+    try:
+        evaluations = grade_submission(data, mode, concurrency)
+    except Exception as e:
+        # InvalidRequest for payloads that cannot be graded, or an unexpected failure
+        return {"line": number, "submission_id": submission_id, "error": str(e)}
+    return {"line": number, "submission_id": submission_id, "evaluations": evaluations}
+
+
+def grade_window(lines, mode=DEFAULT_MODE, concurrency=None, threshold=dedupe.DEDUPE_THRESHOLD, feedback_hook=None):
+    """
+    Turn a window of (number, line) input lines into their output records, in order,
+    grading near-identical answers across the window once.
+    """
+    records = [None] * len(lines)
+    payloads = []
+    positions = []
+    for position, (number, line) in enumerate(lines):
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            records[position] = {"line": number, "error": f"Invalid JSON: {e}"}
+            continue
+        payloads.append(data)
+        positions.append(position)
+
+    results = grade_submissions(payloads, mode, concurrency, threshold, feedback_hook)
+    for position, data, result in zip(positions, payloads, results):
+        number = lines[position][0]
+        submission_id = data.get("submission_id", data.get("ID")) if isinstance(data, dict) else None
+        if isinstance(result, Exception):
+            records[position] = {"line": number, "submission_id": submission_id, "error": str(result)}
+        else:
+            records[position] = {"line": number, "submission_id": submission_id, "evaluations": result}
+    return records
+
+
+class Checkpoint:
+    """
+    Records which input lines are finished.
+    Lines below the watermark are all done; the few finished out of order above it
+    are kept in a small set bounded by the number of submissions in flight.
+    """
+
+    def __init__(self, path, output_path):
+        self.path = path
+        self.watermark = 0
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as handle:
+                state = json.load(handle)
+            self.watermark = state.get("watermark", 0)
+            self.done = set(state.get("done", []))
+        # A result may have been written just before the process died, without its checkpoint
+        if os.path.exists(output_path):
+            with open(output_path, encoding="utf-8") as handle:
+                for line in handle:
+                    try:
+                        number = json.loads(line).get("line")
+                    except ValueError:
+                        continue
+                    if isinstance(number, int) and number >= self.watermark:
+                        self.done.add(number)
+        self._advance()
+
+    def _advance(self):
+        while self.watermark in self.done:
+            self.done.remove(self.watermark)
+            self.watermark += 1
+
+    def is_done(self, number):
+        return number < self.watermark or number in self.done
+
+    def skip(self, number):
+        """
+        Count a line with nothing to grade as done; saved with the next mark().
+        """
+        self.done.add(number)
+        self._advance()
+
+    def mark(self, number):
+        self.done.add(number)
+        self._advance()
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as handle:
+            json.dump({"watermark": self.watermark, "done": sorted(self.done)}, handle)
+        os.replace(temporary, self.path)
+
+
+def run(input_path, output_path, workers=4, concurrency=None, checkpoint_path=None, mode=DEFAULT_MODE,
+        dedupe_window=DEDUPE_WINDOW, threshold=dedupe.DEDUPE_THRESHOLD, own_feedback=False):
+    """
+    Grade every unfinished submission in input_path, appending results to output_path.
+    Returns the number of submissions graded in this run.
+    """
+    checkpoint = Checkpoint(checkpoint_path or output_path + ".checkpoint", output_path)
+    if dedupe_window > 0:
+        return run_windows(input_path, output_path, checkpoint, workers, concurrency, mode,
+                           dedupe_window, threshold, personal_feedback if own_feedback else None)
+    lock = threading.Lock()
+    graded = 0
+
+    with open(input_path, encoding="utf-8") as source, \
+            open(output_path, "a", encoding="utf-8") as sink, \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk") as pool:
+
+        def finish(future):
+            record = future.result()
+            with lock:
+                write_record(sink, checkpoint, record)
+
+        in_flight = set()
+        for number, line in enumerate(source):
+            if checkpoint.is_done(number):
+                continue
+            if not line.strip():
+                # Blank lines would otherwise hold the watermark back for the rest of the file
+                with lock:
+                    checkpoint.skip(number)
+                continue
+            # Keep only a couple of submissions per worker in memory
+            while len(in_flight) >= workers * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(future)
+                    graded += 1
+            in_flight.add(pool.submit(grade_line, number, line, mode, concurrency))
+
+        for future in in_flight:
+            future.result()
+        for future in in_flight:
+            finish(future)
+            graded += 1
+
+    return graded
+
+
+def run_windows(input_path, output_path, checkpoint, workers, concurrency, mode, window, threshold, feedback_hook):
+    """
+    run() with deduplication: the unfinished submissions are graded window by window,
+    every window's answers sharing the pool the workers would have used.
+    """
+    pairs_in_flight = workers * (concurrency or REQUEST_CONCURRENCY)
+    graded = 0
+    with open(input_path, encoding="utf-8") as source, open(output_path, "a", encoding="utf-8") as sink:
+        lines = []
+        for number, line in enumerate(source):
+            if checkpoint.is_done(number):
+                continue
+            if not line.strip():
+                checkpoint.skip(number)
+                continue
+            lines.append((number, line))
+            if len(lines) >= window:
+                for record in grade_window(lines, mode, pairs_in_flight, threshold, feedback_hook):
+                    write_record(sink, checkpoint, record)
+                graded += len(lines)
+                lines = []
+        if lines:
+            for record in grade_window(lines, mode, pairs_in_flight, threshold, feedback_hook):
+                write_record(sink, checkpoint, record)
+            graded += len(lines)
+    return graded
+
+
+def write_record(sink, checkpoint, record):
+    sink.write(json.dumps(record, ensure_ascii=False) + "\n")
+    sink.flush()
+    os.fsync(sink.fileno())
+    checkpoint.mark(record["line"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grade a JSONL file of /evaluate submissions.")
+    parser.add_argument("input", help="JSONL file, one /evaluate payload per line")
+    parser.add_argument("output", help="JSONL file results are appended to")
+    parser.add_argument("--workers", type=int, default=4, help="submissions graded at the same time")
+    parser.add_argument("--concurrency", type=int, default=None, help="questions per submission graded at the same time")
+    parser.add_argument("--mode", default=DEFAULT_MODE, help="evaluation mode for payloads that do not name one")
+    parser.add_argument("--checkpoint", default=None, help="checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument("--dedupe-window", type=int, default=DEDUPE_WINDOW,
+                        help="submissions whose near-identical answers are graded once (default 0, off)")
+    parser.add_argument("--threshold", type=float, default=dedupe.DEDUPE_THRESHOLD,
+                        help="similarity (0-1) from which two answers share an evaluation")
+    parser.add_argument("--own-feedback", action="store_true",
+                        help="write short feedback for every shared answer (one small model call each)")
+    args = parser.parse_args(argv)
+
+    graded = run(args.input, args.output, args.workers, args.concurrency, args.checkpoint, args.mode,
+                 args.dedupe_window, args.threshold, args.own_feedback)
+    print(f"Graded {graded} submissions into {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
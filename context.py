@@ -1,7 +1,10 @@
-import google.generativeai as genai
-import os
-genai.configure(api_key=os.environ.get("GOOGLE_AI_API_KEY"))
-model = genai.GenerativeModel("gemini-1.5-flash")
-sample_pdf = genai.upload_file( "Written Assessment (With Answers) - Build Passive Income with Proven Affiliate Marketing Strategies (1).pdf")
-response = model.generate_content(["Give me a summary of this pdf file in 50 words.", sample_pdf])
-print(response.text)
+import sys
+
+from summarize import summarize_file
+
+# Summarize a document in 50 words, the assessment PDF unless another path is given.
+# The app serves the same summaries, cached, on /summarize.
+DOCUMENT = "Written Assessment (With Answers) - Build Passive Income with Proven Affiliate Marketing Strategies (1).pdf"
+
+if __name__ == '__main__':
+    print(summarize_file(sys.argv[1] if len(sys.argv) > 1 else DOCUMENT)["summary"])
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from eventlog import log_event
+from storage import LazyConnection
+
+# "1" turns server-side context caching on. Off by default: Gemini only caches prefixes of
+# at least CONTEXT_CACHE_MIN_TOKENS for a pinned model version, and the instructions of most
+# modes are a few hundred tokens. Worth enabling with a pinned GEMINI_MODEL (e.g.
+# gemini-1.5-flash-002) when long answer keys are attached whole.
+CONTEXT_CACHE_ENABLED = os.environ.get("CONTEXT_CACHE_ENABLED", "0") != "0"
+# SQLite file recording live cached contexts so other workers and restarts reuse them
+CONTEXT_CACHE_DB = os.environ.get("CONTEXT_CACHE_DB", "context_cache.sqlite3")
+# Lifetime of a cached context; each use close to expiry extends it by this much again
+CONTEXT_CACHE_TTL = int(os.environ.get("CONTEXT_CACHE_TTL", "3600"))
+# Extend a context when less than this many seconds remain
+CONTEXT_CACHE_REFRESH_MARGIN = int(os.environ.get("CONTEXT_CACHE_REFRESH_MARGIN", "300"))
+# Prefixes smaller than this are sent inline; Gemini 1.5 rejects caches under 32,768 tokens
+CONTEXT_CACHE_MIN_TOKENS = int(os.environ.get("CONTEXT_CACHE_MIN_TOKENS", "32768"))
+# After a failed create, the prefix is sent inline for this many seconds before trying again
+CONTEXT_CACHE_RETRY_SECONDS = int(os.environ.get("CONTEXT_CACHE_RETRY_SECONDS", "600"))
+
+# Contexts can only be cached for a pinned model version, e.g. gemini-1.5-flash-002
+PINNED_MODEL = re.compile(r"-\d{3}$")
+
+
+def estimate_tokens(parts, attachment_tokens):
+    """
+    attachment_tokens(part) gives the size of a non-text part such as an uploaded file.
+    """
+    return sum(len(part) // 4 + 1 if isinstance(part, str) else attachment_tokens(part) for part in parts)
+
+
+def context_key(model_name, parts):
+    """
+    Content address of a prompt prefix: its text, and the names of the attached files.
+    """
+    described = [part if isinstance(part, str) else f"file:{getattr(part, 'name', repr(part))}" for part in parts]
+    return hashlib.sha256(json.dumps([model_name, described], ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class ContextCache:
+    """
+    Registry of prompt prefixes (static instructions and attached answer keys) cached on
+    the model backend. A prefix is created once and reused by every question of every
+    request until it ages out; contexts still in use are extended before they expire and
+    idle ones are left to expire on the backend and dropped here.
+
+    get() returns the backend's context name, or None when the prefix should be sent inline.
+    attachment_tokens(part) estimates the tokens of an attached file.
+    """
+
+    def __init__(self, backend_getter, attachment_tokens, db_path=CONTEXT_CACHE_DB, ttl=CONTEXT_CACHE_TTL,
+                 min_tokens=CONTEXT_CACHE_MIN_TOKENS):
+        self.backend_getter = backend_getter
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self.attachment_tokens = attachment_tokens
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._create_locks = {}
+        self._last_sweep = 0.0
+        self.stats = {
+            "hits": 0, "created": 0, "refreshed": 0, "inline": 0, "unpinned": 0, "errors": 0, "evicted": 0,
+        }
+        self._connection = LazyConnection(db_path, self._create_tables, timeout=30)
+        self._db_lock = threading.Lock()
+
+    @staticmethod
+    def _create_tables(db):
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS contexts ("
+            "key TEXT PRIMARY KEY, name TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        db.commit()
+
+    @property
+    def _db(self):
+        return self._connection.get()
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get(self, model_name, parts):
+        """
+        Return the name of a live cached context holding parts, creating or extending it as needed.
+        """
+        backend = self.backend_getter()
+        if not CONTEXT_CACHE_ENABLED or not hasattr(backend, "create_context") or \
+                estimate_tokens(parts, self.attachment_tokens) < self.min_tokens:
+            self._count("inline")
+            return None
+        if not PINNED_MODEL.search(model_name):
+            # The backend would refuse; an alias such as gemini-1.5-flash has no caches
+            self._count("unpinned")
+            return None
+        self._sweep()
+        key = context_key(model_name, parts)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] - now > CONTEXT_CACHE_REFRESH_MARGIN:
+                self.stats["hits" if entry[0] else "inline"] += 1
+                return entry[0]
+            create_lock = self._create_locks.setdefault(key, threading.Lock())
+
+        with create_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None and entry[1] - time.time() > CONTEXT_CACHE_REFRESH_MARGIN:
+                self._count("hits" if entry[0] else "inline")
+                return entry[0]
+
+            if entry is None:
+                # Another worker or an earlier run may already have created this context
+                with self._db_lock:
+                    row = self._db.execute("SELECT name, expires FROM contexts WHERE key = ?", (key,)).fetchone()
+                if row is not None and row[1] > time.time():
+                    entry = row
+
+            name = None
+            expires = time.time() + CONTEXT_CACHE_RETRY_SECONDS
+            try:
+                if entry is not None and entry[0] and entry[1] > time.time():
+                    # Still alive on the backend: push the expiry back instead of re-uploading
+                    name = entry[0]
+                    if entry[1] - time.time() > CONTEXT_CACHE_REFRESH_MARGIN:
+                        expires = entry[1]
+                    else:
+                        expires = backend.extend_context(name, self.ttl)
+                        self._count("refreshed")
+                else:
+                    name, expires = backend.create_context(model_name, parts, self.ttl)
+                    self._count("created")
+            except Exception as e:
+                log_event("context_cache_unavailable", logging.WARNING, model=model_name, error=str(e))
+                self._count("errors")
+                name = None
+                expires = time.time() + CONTEXT_CACHE_RETRY_SECONDS
+
+            with self._lock:
+                self._entries[key] = (name, expires)
+            if name:
+                with self._db_lock:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO contexts (key, name, expires) VALUES (?, ?, ?)", (key, name, expires)
+                    )
+                    self._db.commit()
+            return name
+
+    def _sweep(self):
+        """
+        Drop contexts that have expired, at most once a minute.
+        """
+        now = time.time()
+        with self._lock:
+            if now - self._last_sweep < 60:
+                return
+            self._last_sweep = now
+            expired = [key for key, (_, expires) in self._entries.items() if expires <= now]
+            names = [self._entries[key][0] for key in expired if self._entries[key][0]]
+            for key in expired:
+                del self._entries[key]
+                self._create_locks.pop(key, None)
+            self.stats["evicted"] += len(names)
+        backend = self.backend_getter()
+        for name in names:
+            if hasattr(backend, "forget_context"):
+                backend.forget_context(name)
+        with self._db_lock:
+            self._db.execute("DELETE FROM contexts WHERE expires <= ?", (now,))
+            self._db.commit()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = sum(1 for name, _ in self._entries.values() if name)
+        return stats
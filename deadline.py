@@ -0,0 +1,69 @@
+import contextvars
+import os
+import time
+
+# Wall-clock budget of one /evaluate request, shared by all of its model calls
+REQUEST_DEADLINE_SECONDS = float(os.environ.get("REQUEST_DEADLINE_SECONDS", "60"))
+
+# Deadline of the request being handled; worker threads see it through the copied context
+_current = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when the request's time budget ran out before the work could be done.
+    """
+
+
+class Deadline:
+    """
+    A point in time (monotonic clock) by which a request must answer.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.expires
+
+
+def start(seconds=None):
+    """
+    Give the current request a deadline and return it. A client may ask for a shorter
+    budget than REQUEST_DEADLINE_SECONDS, never a longer one.
+    """
+    try:
+        seconds = min(float(seconds), REQUEST_DEADLINE_SECONDS) if seconds is not None else REQUEST_DEADLINE_SECONDS
+    except (TypeError, ValueError):
+        seconds = REQUEST_DEADLINE_SECONDS
+    deadline = Deadline(max(0.0, seconds))
+    _current.set(deadline)
+    return deadline
+
+
+def current():
+    """
+    The current request's deadline, or None outside a request (jobs, bulk grading).
+    """
+    return _current.get()
+
+
+def remaining(default=None):
+    """
+    Seconds left for the current request, or default when it has no deadline.
+    """
+    deadline = _current.get()
+    return deadline.remaining() if deadline is not None else default
+
+
+def check():
+    """
+    Raise DeadlineExceeded if the current request is out of time.
+    """
+    deadline = _current.get()
+    if deadline is not None and deadline.expired():
+        raise DeadlineExceeded(f"Request deadline of {deadline.seconds:g}s passed")
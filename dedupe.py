@@ -0,0 +1,128 @@
+import hashlib
+import os
+import random
+import re
+from collections import Counter
+
+from pregrade import normalize
+
+# Answers at least this similar (Jaccard similarity of their character shingles) share one
+# grading, if they also say the same thing (see same_sense)
+DEDUPE_THRESHOLD = float(os.environ.get("DEDUPE_THRESHOLD", "0.95"))
+# Characters per shingle
+SHINGLE_SIZE = int(os.environ.get("DEDUPE_SHINGLE_SIZE", "4"))
+# MinHash signature length, split into LSH bands of BAND_ROWS values
+NUM_PERMUTATIONS = 64
+BAND_ROWS = 4
+
+_PRIME = (1 << 61) - 1
+_random = random.Random(20240601)
+_PERMUTATIONS = [(_random.randrange(1, _PRIME), _random.randrange(0, _PRIME)) for _ in range(NUM_PERMUTATIONS)]
+NUMBER = re.compile(r"\d+(?:\.\d+)*")
+CONTRACTED_NOT = re.compile(r"n['’]t\b", re.IGNORECASE)
+# Words that turn a statement around, compared after normalize()
+NEGATIONS = {
+    "not", "no", "never", "none", "nothing", "neither", "nor", "cannot", "without",
+    "nahi", "nahin", "mat", "na", "नहीं", "नही", "न", "मत", "बिना",
+}
+
+
+def words(text):
+    return normalize(CONTRACTED_NOT.sub(" not", str(text))).split()
+
+
+def same_sense(first, second):
+    """
+    Whether two similar answers can share a score: they hold the same negations, and the
+    words they have in common come in the same order ("light into chemical" is not
+    "chemical into light"). Typos only change words the answers do not share.
+    """
+    first, second = words(first), words(second)
+    if sorted(word for word in first if word in NEGATIONS) != sorted(word for word in second if word in NEGATIONS):
+        return False
+    shared = sum((Counter(first) & Counter(second)).values())
+    return common_subsequence(first, second) == shared
+
+
+def common_subsequence(first, second):
+    """
+    Length of the longest run of words found in both lists in the same order.
+    """
+    previous = [0] * (len(second) + 1)
+    for word in first:
+        current = [0]
+        for position, other in enumerate(second):
+            current.append(previous[position] + 1 if word == other else max(previous[position + 1], current[-1]))
+        previous = current
+    return previous[-1]
+
+
+def shingles(text):
+    """
+    Set of overlapping character n-grams of the normalized text.
+    Characters rather than words, so short and non-Latin answers have enough shingles.
+    """
+    text = normalize(text)
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[position:position + SHINGLE_SIZE] for position in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def signature(shingle_set):
+    """
+    MinHash signature: for each permutation, the smallest permuted shingle hash.
+    """
+    hashes = [int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "big")
+              for item in shingle_set]
+    return [min((a * value + b) % _PRIME for value in hashes) for a, b in _PERMUTATIONS]
+
+
+def jaccard(first, second):
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+def cluster(texts, threshold=DEDUPE_THRESHOLD):
+    """
+    Group near-identical texts. Returns a list of clusters, each a list of
+    (index, similarity to the representative); the representative comes first with 1.0.
+
+    Texts are taken in order and each joins the first cluster whose representative is at
+    least `threshold` similar, otherwise it starts a new cluster, so every member is close
+    to its representative (no chaining). Candidate representatives come from MinHash LSH
+    buckets; the similarity itself is the exact shingle Jaccard. Texts containing different
+    numbers, different negations or shared words in a different order never share a
+    cluster, whatever their similarity.
+    """
+    buckets = {}
+    clusters = []
+    leaders = []
+    for index, text in enumerate(texts):
+        shingle_set = shingles(text)
+        numbers = sorted(NUMBER.findall(normalize(text)))
+        values = signature(shingle_set)
+        bands = [
+            (band, tuple(values[band * BAND_ROWS:(band + 1) * BAND_ROWS]))
+            for band in range(NUM_PERMUTATIONS // BAND_ROWS)
+        ]
+
+        best, best_similarity = None, 0.0
+        candidates = {position for key in bands for position in buckets.get(key, ())}
+        for position in sorted(candidates):
+            leader_text, leader_shingles, leader_numbers = leaders[position]
+            if leader_numbers != numbers:
+                continue
+            similarity = jaccard(shingle_set, leader_shingles)
+            if similarity >= threshold and similarity > best_similarity and same_sense(text, leader_text):
+                best, best_similarity = position, similarity
+
+        if best is not None:
+            clusters[best].append((index, round(best_similarity, 4)))
+            continue
+        position = len(clusters)
+        clusters.append([(index, 1.0)])
+        leaders.append((text, shingle_set, numbers))
+        for key in bands:
+            buckets.setdefault(key, []).append(position)
+    return clusters
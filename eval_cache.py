@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import deadline
+from storage import LazyConnection
+
+# Entries kept in process memory
+CACHE_MEMORY_SIZE = int(os.environ.get("EVAL_CACHE_MEMORY_SIZE", "2048"))
+# SQLite file shared by every worker on the host, empty string disables the disk tier
+CACHE_PATH = os.environ.get("EVAL_CACHE_PATH", "eval_cache.sqlite3")
+# Seconds an evaluation stays valid, 0 keeps it forever
+CACHE_TTL = int(os.environ.get("EVAL_CACHE_TTL", str(30 * 24 * 3600)))
+# Rows kept on disk before the least recently used ones are dropped
+CACHE_MAX_ROWS = int(os.environ.get("EVAL_CACHE_MAX_ROWS", "200000"))
+
+
+def normalize_text(text):
+    """
+    Normalize text so answers that differ only in case, width or spacing share a key.
+    """
+    text = unicodedata.normalize("NFKC", str(text))
+    return " ".join(text.casefold().split())
+
+
+def make_key(question, answer, class_name, board, word_count, prompt_version, model_name):
+    """
+    Content address of one evaluation.
+    """
+    parts = [
+        normalize_text(question),
+        normalize_text(answer),
+        normalize_text(class_name),
+        normalize_text(board),
+        normalize_text(word_count),
+        prompt_version,
+        model_name,
+    ]
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class EvaluationCache:
+    """
+    Two tier cache of evaluations: a bounded in-memory LRU in front of a SQLite table.
+    Concurrent misses on the same key are coalesced so only one model call is made.
+    """
+
+    def __init__(self, path=CACHE_PATH, memory_size=CACHE_MEMORY_SIZE, ttl=CACHE_TTL, max_rows=CACHE_MAX_ROWS):
+        self.memory_size = memory_size
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+
+        self._connection = LazyConnection(path, self._create_tables) if path else None
+        self._db_lock = threading.Lock()
+        self._writes = 0
+
+    @staticmethod
+    def _create_tables(db):
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS evaluations ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS evaluations_accessed ON evaluations (accessed)")
+        db.commit()
+
+    @property
+    def _db(self):
+        # The disk tier is opened on first use; None when it is disabled
+        return self._connection.get() if self._connection is not None else None
+
+    def _expired(self, created):
+        return self.ttl and time.time() - created > self.ttl
+
+    def _remember(self, key, value, created):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def lookup(self, key):
+        """
+        Return the cached evaluation for key, or None.
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[1]):
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return entry[0]
+                del self._memory[key]
+
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute("SELECT value, created FROM evaluations WHERE key = ?", (key,)).fetchone()
+                if row is not None and self._expired(row[1]):
+                    self._db.execute("DELETE FROM evaluations WHERE key = ?", (key,))
+                    self._db.commit()
+                    row = None
+                elif row is not None:
+                    self._db.execute("UPDATE evaluations SET accessed = ? WHERE key = ?", (time.time(), key))
+                    self._db.commit()
+            if row is not None:
+                value = json.loads(row[0])
+                with self._lock:
+                    self._remember(key, value, row[1])
+                    self.stats["disk_hits"] += 1
+                return value
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def store(self, key, value):
+        """
+        Save an evaluation in both tiers.
+        """
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO evaluations (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            self._writes += 1
+            # Trim the table now and then rather than on every write
+            if self._writes % 500 == 0:
+                self._trim()
+            self._db.commit()
+
+    def _trim(self):
+        if self.ttl:
+            self._db.execute("DELETE FROM evaluations WHERE created < ?", (time.time() - self.ttl,))
+        count = self._db.execute("SELECT COUNT(*) FROM evaluations").fetchone()[0]
+        if count > self.max_rows:
+            self._db.execute(
+                "DELETE FROM evaluations WHERE key IN "
+                "(SELECT key FROM evaluations ORDER BY accessed LIMIT ?)",
+                (count - self.max_rows,),
+            )
+            self.stats["evictions"] += count - self.max_rows
+
+    def get_or_compute(self, key, compute, cacheable=lambda value: True):
+        """
+        Return the cached evaluation for key, calling compute() on a miss.
+        If the same key is already being computed by another thread, wait for that
+        result instead of calling the model again, but no longer than the current
+        request's deadline allows (DeadlineExceeded). Values rejected by cacheable()
+        (e.g. error results) are returned but not stored.
+        """
+        value = self.lookup(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            waiter = self._inflight.get(key)
+            if waiter is None:
+                waiter = {"event": threading.Event(), "value": None}
+                self._inflight[key] = waiter
+                owner = True
+            else:
+                self.stats["coalesced"] += 1
+                owner = False
+
+        if not owner:
+            if not waiter["event"].wait(timeout=deadline.remaining()):
+                raise deadline.DeadlineExceeded("Request deadline passed while waiting for the same evaluation")
+            if waiter["value"] is not None:
+                return waiter["value"]
+            # The owner failed or produced an uncacheable result, try on our own
+            return compute()
+
+        try:
+            value = compute()
+            if cacheable(value):
+                self.store(key, value)
+                waiter["value"] = value
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            waiter["event"].set()
+
+    def get_stats(self):
+        """
+        Hit/miss counters plus the current size of each tier.
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        if self._db is not None:
+            with self._db_lock:
+                stats["disk_entries"] = self._db.execute("SELECT COUNT(*) FROM evaluations").fetchone()[0]
+        return stats
@@ -0,0 +1,521 @@
+import logging
+import time
+
+import answer_facts
+import deadline
+import llm
+import prompts
+import retrieval
+import routing
+from eval_cache import EvaluationCache, make_key
+from eventlog import log_event
+from reference_docs import ReferenceRegistry, UnknownAnswerKey
+from search_cache import SearchCache
+from timing import stage
+
+# Resources shared by every mode and request in the process
+evaluation_cache = EvaluationCache()
+# Search results are cached and fetched before the LLM stage.
+# SEARCH_PROVIDER=stub swaps SerpAPI for a local provider in tests.
+search = SearchCache()
+# Answer keys are uploaded on first use and shared across requests, workers and restarts
+references = ReferenceRegistry(llm.get_backend)
+
+
+class InvalidRequest(ValueError):
+    """
+    Raised by an evaluator when the request cannot be graded in its mode (HTTP 400).
+    """
+
+
+# Function to report an answer that could not be graded
+def error_evaluation(message, error="model_error"):
+    """
+    An ungraded result: "Score" is None rather than 0 so a failure on our side is never
+    counted as a zero mark. "Error" says why, so clients can retry the answer later.
+    """
+    return {
+        "Score": None,
+        "Feedback": f"Error processing answer: {message}",
+        "Error": error,
+    }
+
+
+# Errors are returned to the client but never cached
+def is_cacheable(evaluation):
+    return "Error" not in evaluation
+
+
+class Evaluator:
+    """
+    One grading style. Subclasses build the prompt; caching, error handling and the
+    shared model client are handled here.
+
+    prepare() runs once per request and returns one extra value per pair (search
+    results, answer key excerpts, ...) that is passed back to build_prompt().
+
+    Modes whose prompt starts with a long part that is the same for every pair return it
+    from build_context() and the rest from build_pair_prompt(); the shared part is then
+    cached on the model backend and only the pair part is sent with each call.
+
+    Each pair is graded by the model of the tier routing.router picks for it; model_name
+    is the model used for calls outside routing.
+    """
+
+    name = ""
+    # Bump whenever the prompt changes so cached evaluations from the old prompt are not reused
+    prompt_version = ""
+    model_name = llm.MODEL_NAME
+    # Modes that grade answers on their own accept payloads without "questions"
+    requires_questions = True
+    cacheable = True
+    supports_batch = False
+    # Modes with a shorter prompt for short-answer question types (see prompts.is_short_type)
+    short_variant = False
+
+    def validate(self, data):
+        """
+        Reject a payload this mode cannot grade with InvalidRequest. Runs before any
+        response is started or job queued; prepare() runs later, once grading begins.
+        """
+
+    def prepare(self, data, questions, answers):
+        return [None] * len(answers)
+
+    def feedback_length(self, data):
+        return data.get("feedback_length") or llm.FEEDBACK_LENGTH
+
+    def cache_version(self, data, extra):
+        version = f"{self.prompt_version}:{self.feedback_length(data)}"
+        return f"{version}:short" if self.short_variant and prompts.is_short_type(data) else version
+
+    def build_context(self, data, extra):
+        """
+        Prompt parts (text and attached files) shared by every pair of the request, or None.
+        """
+        return None
+
+    def build_pair_prompt(self, question, user_answer, data, extra):
+        raise NotImplementedError
+
+    def pair_facts(self, question, user_answer, data):
+        """
+        Facts about the answer measured locally and stated in the prompt, or None.
+        """
+        return None
+
+    def build_prompt(self, question, user_answer, data, extra):
+        context = self.build_context(data, extra)
+        pair_prompt = self.build_pair_prompt(question, user_answer, data, extra)
+        if all(isinstance(part, str) for part in context):
+            return "".join(context) + pair_prompt
+        return context + [pair_prompt]
+
+    def evaluate(self, question, user_answer, data, extra=None):
+        """
+        Evaluate a question-answer pair, reusing an earlier evaluation of the same content.
+        """
+        tier = routing.router.tier_for(self.name, question, user_answer, data)
+        if not self.cacheable:
+            return self.evaluate_llm(question, user_answer, data, extra, routing.router.admit(tier))
+        key = make_key(
+            question, user_answer, data.get("Class", ""), data.get("Board", ""), data.get("word_count", ""),
+            self.cache_version(data, extra), routing.router.model(tier),
+        )
+        try:
+            return evaluation_cache.get_or_compute(
+                key,
+                lambda: self.evaluate_llm(question, user_answer, data, extra, routing.router.admit(tier)),
+                cacheable=is_cacheable,
+            )
+        except deadline.DeadlineExceeded as e:
+            # Ran out of time waiting for another request grading the same answer
+            return error_evaluation(str(e), "deadline_exceeded")
+
+    def generate(self, contents, data, response_schema=llm.EVALUATION_SCHEMA, pairs=1, context=None, tier=None,
+                 headroom=1):
+        """
+        Ask the model of `tier` for a JSON reply, capped at the feedback length's token
+        budget per pair, times headroom. The call's latency and outcome count towards the
+        tier's circuit breaker.
+        """
+        max_output_tokens = llm.FEEDBACK_TIERS[self.feedback_length(data)][1] * pairs * headroom
+        if tier is None:
+            with llm.charge(self.name, pairs):
+                return llm.generate(contents, self.model_name, response_schema, max_output_tokens, context)
+        started = time.perf_counter()
+        settled = False
+        try:
+            with llm.charge(self.name, pairs):
+                text = llm.generate(
+                    contents, routing.router.model(tier), response_schema, max_output_tokens, context,
+                )
+        except deadline.DeadlineExceeded:
+            # Out of request time, which says nothing about the tier
+            raise
+        except Exception as e:
+            routing.router.record(tier, time.perf_counter() - started, e)
+            settled = True
+            raise
+        else:
+            routing.router.record(tier, time.perf_counter() - started)
+            settled = True
+        finally:
+            if not settled:
+                # A trial pair of a half-open tier must not be left pending
+                routing.router.abandon(tier)
+        return text
+
+    def evaluate_llm(self, question, user_answer, data, extra=None, tier=None):
+        """
+        Evaluate a question-answer pair and return a score and feedback extracted from the model's response.
+        """
+        try:
+            with stage("prompt_build"):
+                context_parts = self.build_context(data, extra)
+            context = None
+            if context_parts is not None:
+                with stage("context_cache"):
+                    context = llm.contexts.get(
+                        routing.router.model(tier) if tier else self.model_name, context_parts,
+                    )
+            with stage("prompt_build"):
+                if context is not None:
+                    contents = self.build_pair_prompt(question, user_answer, data, extra)
+                else:
+                    contents = self.build_prompt(question, user_answer, data, extra)
+            reply = self.generate(contents, data, context=context, tier=tier)
+            try:
+                return llm.parse_evaluation(reply)
+            except llm.ResponseParseError:
+                # One more attempt before giving up on the answer, with room for a reply
+                # that was cut off by the token cap before it reached the score
+                return llm.parse_evaluation(self.generate(contents, data, context=context, tier=tier, headroom=2))
+        except llm.ResponseParseError as e:
+            return error_evaluation(str(e), "parse_error")
+        except llm.ModelUnavailable as e:
+            return error_evaluation(str(e), "model_unavailable")
+        except deadline.DeadlineExceeded as e:
+            return error_evaluation(str(e), "deadline_exceeded")
+        except Exception as e:
+            return error_evaluation(str(e))
+
+
+class ClassBoardEvaluator(Evaluator):
+    """
+    Class, board and word count aware grading (formerly both_mcq.py).
+    """
+
+    name = "class_board"
+    prompt_version = "both_mcq-5"
+    supports_batch = True
+    short_variant = True
+
+    def build_instructions(self, data):
+        """
+        Build the instruction block that is the same for every question in a request.
+        """
+        return build_instructions(data)
+
+    def build_context(self, data, extra):
+        return [prompts.fill(
+            CLASS_BOARD_CONTEXT,
+            instructions=self.build_instructions(data),
+            reply_format=output_format(class_board_score(data), CLASS_BOARD_FEEDBACK, self.feedback_length(data)),
+        ) + "\n\n"]
+
+    def build_pair_prompt(self, question, user_answer, data, extra):
+        return f"""Question: {question}
+User's Answer: {user_answer}
+Answer facts: {self.pair_facts(question, user_answer, data)}
+"""
+
+    def pair_facts(self, question, user_answer, data):
+        return measured_facts(user_answer, data)
+
+
+# Reply format shared by every single-pair prompt
+def output_format(score_rule, feedback_rule, feedback_length):
+    sentences = llm.FEEDBACK_TIERS[feedback_length][0]
+    # The schema cannot fix the key order; a reply cut off by the token cap keeps its score
+    # only when "Score" comes first
+    return f"""Reply with only a JSON object in this format, "Score" first:
+{{"Score": <{score_rule}>, "Feedback": "<{sentences} {feedback_rule}>"}}"""
+
+
+CLASS_BOARD_SCORE = (
+    "numerical score out of 100, calculated based on adherence to word count, accuracy, clarity, "
+    "and completeness. Minor mistakes (0-10%) should not heavily impact the score"
+)
+SHORT_ANSWER_SCORE = "numerical score out of 100 for correctness"
+CLASS_BOARD_FEEDBACK = (
+    "highlighting the strengths and areas for improvement. If the question is in a specific language, "
+    "give the feedback in the same language"
+)
+SAME_LANGUAGE_FEEDBACK = (
+    "on clarity or mistakes, in the language of the question (in Hindi if the question is in Hindi)"
+)
+
+
+CLASS_BOARD_CONTEXT = """
+Evaluate the given question and user's answer based on the following context:
+
+{instructions}
+
+{reply_format}
+"""
+
+CLASS_BOARD_INSTRUCTIONS = """
+Class: {class_name}
+Board: {board}
+Expected Word Count: {word_count}
+
+Instructions:
+1. Every answer comes with facts measured for you: its word count against the expected word count, and its language. Use them as given and do not count words yourself. Evaluate the answer on its correctness, clarity, and completeness.
+2. If the facts show fewer words than expected, deduct marks in proportion to the shortfall and mention it in the feedback.
+3. If there are minor mistakes in the user's answer (0-10% of the content), do not penalize the score but in maths not use this. Focus instead on constructive feedback to address the minor inaccuracies.
+4. If the question or answer is correct in one word and matches the expected accuracy, assign a score of 100 instead of 95.
+5. For mathematical answers:
+   - Penalize minor errors (0-10%) by reducing the score based on the level of accuracy. Even small inaccuracies (e.g., in calculations or results) should impact the score.
+   - Provide feedback explaining where the mistake occurred and how to correct it.
+"""
+
+# One-mark, MCQ and fill-in questions: length and style do not matter, only correctness
+SHORT_ANSWER_INSTRUCTIONS = """
+Class: {class_name}
+Board: {board}
+
+Instructions:
+1. The answer is expected to be a word, a line or a choice. Grade only whether it is correct; ignore its length.
+2. A correct answer scores 100 and a wrong one 0; give partial marks only for a partly correct answer.
+"""
+
+
+# Shared context and grading rules, used by single and batched prompts
+def build_instructions(data):
+    template = SHORT_ANSWER_INSTRUCTIONS if prompts.is_short_type(data) else CLASS_BOARD_INSTRUCTIONS
+    return prompts.fill(
+        template, class_name=data.get("Class", ""), board=data.get("Board", ""), word_count=data.get("word_count", ""),
+    )
+
+
+# Counted here rather than by the model, which miscounts Hindi text. Short-answer types
+# are not held to the word count.
+def measured_facts(user_answer, data):
+    word_count = None if prompts.is_short_type(data) else data.get("word_count")
+    return answer_facts.describe(answer_facts.analyze(user_answer, word_count))
+
+
+def class_board_score(data):
+    return SHORT_ANSWER_SCORE if prompts.is_short_type(data) else CLASS_BOARD_SCORE
+
+
+PLAIN_PROMPT = """
+    Evaluate the following user's answer:
+
+    User's Answer: {user_answer}
+
+{reply_format}
+    """
+
+PLAIN_QUESTION_PROMPT = """
+    Evaluate the following question and user's answer:
+
+    Question: {question}
+    User's Answer: {user_answer} answer should be in technically solve and breif answer is not mcq based.
+
+{reply_format}
+    """
+
+
+class PlainEvaluator(Evaluator):
+    """
+    Grading from the model's own knowledge (formerly postman1.py, and real_time1.py
+    when questions are given).
+    """
+
+    name = "plain"
+    prompt_version = "plain-3"
+    requires_questions = False
+
+    def build_prompt(self, question, user_answer, data, extra):
+        if not question:
+            return prompts.fill(
+                PLAIN_PROMPT, user_answer=user_answer,
+                reply_format=output_format("numerical score out of 100", "of feedback", self.feedback_length(data)),
+            )
+        return prompts.fill(
+            PLAIN_QUESTION_PROMPT, question=question, user_answer=user_answer,
+            reply_format=output_format("numerical score out of 100", SAME_LANGUAGE_FEEDBACK, self.feedback_length(data)),
+        )
+
+
+SEARCH_PROMPT = """
+    Evaluate the following user's answer:
+
+    User's Answer: {user_answer}
+    serp_API :{serp_result} (if you have not real time knowledge so use this serp api result data)
+{reply_format}
+    """
+
+
+class SearchEvaluator(Evaluator):
+    """
+    Grading backed by live search results (formerly real_time.py).
+    Results change over time, so evaluations are not cached; the searches are.
+    """
+
+    name = "search"
+    prompt_version = "real_time-3"
+    requires_questions = False
+    cacheable = False
+
+    def prepare(self, data, questions, answers):
+        # Run every search for the request at once, before the LLM stage
+        return search.prefetch([answer["Text"] for answer in answers], data.get("concurrency"))
+
+    def build_prompt(self, question, user_answer, data, serp_result):
+        if serp_result is None:
+            serp_result = search.search(user_answer)
+        return prompts.fill(
+            SEARCH_PROMPT, user_answer=user_answer, serp_result=serp_result,
+            reply_format=output_format("numerical score out of 100", "of feedback", self.feedback_length(data)),
+        )
+
+
+REFERENCE_CONTEXT = """
+    Evaluate the question and user's answer given below against the {source}.
+
+    Instructions:
+    1. Compare the user's answer with the information in the {source}.
+    2. Assign a score based in {source} mention. If the user's answer is completely correct and aligns perfectly with the {source}, assign full marks; otherwise, the score should reflect the degree of correctness.
+    3. Provide feedback concisely, why you are cut some marks like user answer is correct or accurate.
+    4. If the question language is Hindi, provide feedback in Hindi; otherwise, use the language of the question.
+
+{reply_format}
+"""
+
+REFERENCE_CLASS_BOARD_CONTEXT = """
+Evaluate the question and user's answer given below against {answer_key}, based on the following context:
+
+{instructions}
+
+{reply_format}
+"""
+
+
+class ReferenceEvaluator(Evaluator):
+    """
+    Grading against an answer key document (formerly context_based.py, and
+    last_context.py when Class, Board or word_count are given).
+    Only the answer key passages relevant to each question are sent; answer keys
+    without extractable text are attached whole.
+    """
+
+    name = "reference"
+    prompt_version = "reference-4"
+    short_variant = True
+
+    def validate(self, data):
+        try:
+            references.resolve(data.get("answer_key"))
+        except UnknownAnswerKey as e:
+            raise InvalidRequest(f"Unknown answer key: {e.args[0]}")
+
+    def prepare(self, data, questions, answers):
+        answer_key = data.get("answer_key")
+        try:
+            index = retrieval.get_index(references, answer_key)
+            digest = references.content_hash(answer_key)
+        except UnknownAnswerKey as e:
+            raise InvalidRequest(f"Unknown answer key: {e.args[0]}")
+
+        if index is not None:
+            return [
+                {"hash": digest, "excerpts": retrieval.format_excerpts(index.search(question["Text"]))}
+                for question in questions
+            ]
+
+        # No extractable text (e.g. a scanned PDF), attach the whole document
+        try:
+            sample_pdf = references.get_handle(answer_key)
+            llm.note_file(sample_pdf, references.resolve(answer_key))
+        except Exception as e:
+            log_event("answer_key_upload_failed", logging.WARNING, answer_key=answer_key, error=str(e))
+            sample_pdf = None
+        return [{"hash": digest, "file": sample_pdf} for _ in questions]
+
+    def cache_version(self, data, extra):
+        # The same answer graded against a different answer key is a different evaluation
+        return f"{super().cache_version(data, extra)}:{extra['hash']}"
+
+    def evaluate_llm(self, question, user_answer, data, extra=None, tier=None):
+        if extra.get("excerpts") is None and extra.get("file") is None:
+            return error_evaluation("PDF upload failed, cannot evaluate", "reference_unavailable")
+        return super().evaluate_llm(question, user_answer, data, extra, tier)
+
+    def build_context(self, data, extra):
+        attached = extra.get("excerpts") is None
+        if self.class_board(data):
+            text = self.build_class_board_context(data, attached)
+        else:
+            text = self.build_plain_context(data, attached)
+        return [text, extra["file"]] if attached else [text]
+
+    @staticmethod
+    def class_board(data):
+        return any(data.get(field) for field in ("Class", "Board", "word_count"))
+
+    def pair_facts(self, question, user_answer, data):
+        # The class/board instructions are the class_board mode's, which expect measured facts
+        if not self.class_board(data):
+            return None
+        return measured_facts(user_answer, data)
+
+    def build_pair_prompt(self, question, user_answer, data, extra):
+        excerpts = extra.get("excerpts")
+        if excerpts is None:
+            reference = ""
+        elif self.class_board(data):
+            reference = f"correct answer :{excerpts}\n"
+        else:
+            reference = f"Answer key excerpts:\n{excerpts}\n"
+        facts = self.pair_facts(question, user_answer, data)
+        if facts:
+            reference += f"Answer facts: {facts}\n"
+        return f"""
+Question: {question}
+User's Answer: {user_answer}
+{reference}"""
+
+    def build_plain_context(self, data, attached):
+        source = "provided PDF" if attached else "answer key excerpts"
+        return prompts.fill(
+            REFERENCE_CONTEXT, source=source,
+            reply_format=output_format(
+                f"score out of 100 based on accurate {source} mention", SAME_LANGUAGE_FEEDBACK, self.feedback_length(data),
+            ),
+        ) + "\n"
+
+    def build_class_board_context(self, data, attached):
+        # Same grading rules as the class_board mode, graded against the answer key
+        return prompts.fill(
+            REFERENCE_CLASS_BOARD_CONTEXT,
+            answer_key="the attached answer key PDF" if attached else "the correct answer given with it",
+            instructions=build_instructions(data),
+            reply_format=output_format(class_board_score(data), CLASS_BOARD_FEEDBACK, self.feedback_length(data)),
+        ) + "\n"
+
+
+# Evaluation modes selectable per request with "mode"
+EVALUATORS = {
+    evaluator.name: evaluator
+    for evaluator in (ClassBoardEvaluator(), PlainEvaluator(), SearchEvaluator(), ReferenceEvaluator())
+}
+
+
+def get_evaluator(mode):
+    evaluator = EVALUATORS.get(mode)
+    if evaluator is None:
+        raise InvalidRequest(f"Unknown mode: {mode}. Expected one of: {', '.join(sorted(EVALUATORS))}")
+    return evaluator
@@ -0,0 +1,69 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+from timing import current_request_id
+
+# Share of requests whose full evaluations are logged; slow requests and errors are always logged
+LOG_SAMPLE_RATE = float(os.environ.get("EVAL_LOG_SAMPLE_RATE", "0.01"))
+# Requests slower than this many seconds are logged with their stage timings
+SLOW_REQUEST_SECONDS = float(os.environ.get("SLOW_REQUEST_SECONDS", "5"))
+
+logger = logging.getLogger("evaluation")
+_listener = None
+_listener_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, event name and the event's fields.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def start():
+    """
+    Route the evaluation logger through a queue so request threads never wait on stderr.
+    A background listener thread does the formatting and writing.
+    """
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return
+        records = queue.Queue(-1)
+        output = logging.StreamHandler(sys.stderr)
+        output.setFormatter(JsonFormatter())
+        logger.addHandler(logging.handlers.QueueHandler(records))
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        _listener = logging.handlers.QueueListener(records, output)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+def log_event(event, level=logging.INFO, sample_rate=1.0, **fields):
+    """
+    Log a structured event tagged with the current request's correlation ID.
+    With sample_rate below 1 only that share of calls is logged.
+    """
+    if sample_rate < 1 and random.random() >= sample_rate:
+        return
+    if _listener is None:
+        start()
+    fields.setdefault("request_id", current_request_id())
+    logger.log(level, event, extra={"fields": fields})
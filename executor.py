@@ -0,0 +1,90 @@
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Maximum number of worker threads shared by every request in the process
+MAX_WORKERS = int(os.environ.get("EVAL_MAX_WORKERS", "16"))
+# Default number of pairs a single request may evaluate at the same time
+REQUEST_CONCURRENCY = int(os.environ.get("EVAL_REQUEST_CONCURRENCY", "8"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Return the process-wide thread pool, creating it on first use.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="evaluate")
+    return _executor
+
+
+def request_concurrency(requested=None):
+    """
+    Work out how many pairs one request may run at once.
+    A client supplied value is honoured but never exceeds the pool size.
+    """
+    try:
+        limit = int(requested) if requested is not None else REQUEST_CONCURRENCY
+    except (TypeError, ValueError):
+        limit = REQUEST_CONCURRENCY
+    return max(1, min(limit, MAX_WORKERS))
+
+
+def map_ordered(func, items, concurrency=None):
+    """
+    Call func(*item) for every item on the shared pool and return the results in input order.
+    At most `concurrency` calls from this request are in flight at any time, so one large
+    answer sheet cannot take over every worker.
+    """
+    items = list(items)
+    limit = request_concurrency(concurrency)
+
+    if limit == 1 or len(items) <= 1:
+        return [func(*item) for item in items]
+
+    results = [None] * len(items)
+    for index, result in iter_completed(func, items, limit):
+        results[index] = result
+    return results
+
+
+def iter_completed(func, items, concurrency=None):
+    """
+    Like map_ordered, but yield (index, result) pairs as soon as each call finishes.
+    Items are taken from the iterable only as calls are started, so a generator's items
+    are never all held in memory at once.
+    Closing the generator early (e.g. the client went away) cancels the calls that have
+    not started yet.
+    """
+    items = iter(items)
+    limit = request_concurrency(concurrency)
+    executor = get_executor()
+    pending = {}
+    next_index = 0
+    exhausted = False
+    try:
+        while not exhausted or pending:
+            while not exhausted and len(pending) < limit:
+                item = next(items, None)
+                if item is None:
+                    exhausted = True
+                    break
+                # Run in a copy of the caller's context so request-scoped state (stage timings) follows
+                future = executor.submit(contextvars.copy_context().run, func, *item)
+                pending[future] = next_index
+                next_index += 1
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+    finally:
+        for future in pending:
+            future.cancel()
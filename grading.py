@@ -0,0 +1,318 @@
+import batching
+import dedupe
+import llm
+import metrics
+import prompts
+import routing
+from eval_cache import make_key
+from evaluators import InvalidRequest, evaluation_cache, get_evaluator, is_cacheable, output_format
+from executor import iter_completed
+from pregrade import parse_tolerance, pregrade
+from timing import stage
+
+# Mode used when neither the request nor the entry point names one
+DEFAULT_MODE = "class_board"
+
+PERSONAL_FEEDBACK_PROMPT = """
+This answer has already been graded {score}/100. Write feedback on this exact answer that explains the score.
+
+Question: {question}
+User's Answer: {answer}
+
+{reply_format}
+"""
+
+
+# Function to read and check the question/answer lists of a payload
+def read_payload(data, default_mode=DEFAULT_MODE):
+    """
+    Return (evaluator, questions, answers) for an /evaluate payload.
+    Modes that grade answers on their own accept payloads without "questions".
+    Raises InvalidRequest with a client-facing message when the payload is unusable.
+    """
+    if not isinstance(data, dict):
+        raise InvalidRequest("Invalid JSON payload.")
+    evaluator = get_evaluator(data.get("mode") or default_mode)
+    if evaluator.feedback_length(data) not in llm.FEEDBACK_TIERS:
+        raise InvalidRequest(f"Unknown feedback_length. Use one of: {', '.join(llm.FEEDBACK_TIERS)}.")
+    evaluator.validate(data)
+    questions = data.get("questions", [])
+    answers = data.get("answers", [])
+
+    if not evaluator.requires_questions and "questions" not in data:
+        if not answers or not isinstance(answers, list):
+            raise InvalidRequest("Invalid input. Expected a list of answers.")
+        for answer in answers:
+            if not isinstance(answer, dict) or "ID" not in answer or "Text" not in answer:
+                raise InvalidRequest(f"Missing 'ID' or 'Text' in answer: {answer}")
+        questions = [{"ID": answer["ID"], "Text": ""} for answer in answers]
+        return evaluator, questions, answers
+
+    if not isinstance(questions, list) or not isinstance(answers, list) or \
+            not questions or not answers or len(questions) != len(answers):
+        raise InvalidRequest("Invalid input. Ensure matching lists of questions and answers.")
+    for question, answer in zip(questions, answers):
+        if not isinstance(question, dict) or "ID" not in question or "Text" not in question or \
+                not isinstance(answer, dict) or "ID" not in answer or "Text" not in answer:
+            raise InvalidRequest("Missing 'ID' or 'Text' in question/answer.")
+        if question.get("Tolerance") is not None and parse_tolerance(question["Tolerance"]) is None:
+            raise InvalidRequest(f"Invalid 'Tolerance' in question {question['ID']}: expected a number.")
+    return evaluator, questions, answers
+
+
+# Function to evaluate many question-answer pairs with one LLM call per batch
+def iter_pairs_batched(evaluator, data, pairs, concurrency=None):
+    """
+    Pack the pairs into token-budgeted batches and evaluate each batch with a single prompt.
+    Yields (index, evaluation) as batches finish. Pairs the model drops or garbles are
+    re-run one at a time. Pairs routed to different model tiers go in different batches.
+    """
+    instructions = evaluator.build_instructions(data)
+    feedback_sentences = llm.FEEDBACK_TIERS[evaluator.feedback_length(data)][0]
+    tiers = [routing.router.tier_for(evaluator.name, question, answer, data) for question, answer in pairs]
+    keys = [
+        make_key(question, answer, data.get("Class", ""), data.get("Board", ""), data.get("word_count", ""),
+                 evaluator.cache_version(data, None), routing.router.model(tier))
+        for (question, answer), tier in zip(pairs, tiers)
+    ]
+    # Only pairs that are not cached go to the model
+    items = {}
+    for index, (question, answer) in enumerate(pairs):
+        cached = evaluation_cache.lookup(keys[index])
+        if cached is not None:
+            yield index, cached
+        else:
+            items.setdefault(tiers[index], []).append((str(index + 1), question, answer))
+    batches = [
+        (tier, batch)
+        for tier, tier_items in items.items()
+        for batch in batching.plan_batches(tier_items, batching.estimate_tokens(instructions))
+    ]
+
+    def generate_with(tier):
+        def generate(prompt, pair_count):
+            admitted = routing.router.admit(tier, pair_count)
+            return evaluator.generate(prompt, data, llm.BATCH_SCHEMA, pair_count, tier=admitted)
+        return generate
+
+    def evaluate_single(question, answer):
+        return evaluator.evaluate(question, answer, data)
+
+    def pair_facts(question, answer):
+        return evaluator.pair_facts(question, answer, data)
+
+    results = iter_completed(
+        batching.evaluate_batch,
+        [
+            (instructions, batch, generate_with(tier), evaluate_single, feedback_sentences, pair_facts)
+            for tier, batch in batches
+        ],
+        concurrency=concurrency,
+    )
+    try:
+        for batch_index, evaluations in results:
+            for (item_key, _, _), evaluation in zip(batches[batch_index][1], evaluations):
+                index = int(item_key) - 1
+                if is_cacheable(evaluation):
+                    evaluation_cache.store(keys[index], evaluation)
+                yield index, evaluation
+    finally:
+        results.close()
+
+
+# Function to evaluate a whole request, yielding results as they complete
+def iter_evaluations(evaluator, data, questions, answers, batch_mode=False, concurrency=None):
+    """
+    Yield (index, evaluation) for every question-answer pair, in completion order.
+    Objective answers with a reference answer or option key are graded locally and come first.
+    """
+    remaining = []
+    for index, (question, answer) in enumerate(zip(questions, answers)):
+        with stage("pregrade"):
+            evaluation = pregrade(question["Text"], answer["Text"], question.get("Answer"),
+                                  question.get("Options"), question.get("Tolerance"))
+        if evaluation is not None:
+            metrics.EVALUATIONS.inc(mode=evaluator.name, outcome="pregraded")
+            yield index, evaluation
+        else:
+            remaining.append(index)
+
+    if not remaining:
+        return
+    pending_questions = [questions[index] for index in remaining]
+    pending_answers = [answers[index] for index in remaining]
+    with stage("prepare"):
+        extras = evaluator.prepare(data, pending_questions, pending_answers)
+    pairs = [(question["Text"], answer["Text"]) for question, answer in zip(pending_questions, pending_answers)]
+
+    if batch_mode and evaluator.supports_batch:
+        # Several pairs per model call, opt-in
+        results = iter_pairs_batched(evaluator, data, pairs, concurrency)
+    else:
+        results = iter_completed(
+            evaluator.evaluate,
+            [(question, answer, data, extra) for (question, answer), extra in zip(pairs, extras)],
+            concurrency=concurrency,
+        )
+    try:
+        for pair_index, evaluation in results:
+            metrics.EVALUATIONS.inc(mode=evaluator.name, outcome=evaluation.get("Error", "graded"))
+            yield remaining[pair_index], evaluation
+    finally:
+        # Stops the remaining model calls when the caller stops listening
+        results.close()
+
+
+# Function to grade one payload and return its evaluations in question order
+def grade_submission(data, default_mode=DEFAULT_MODE, concurrency=None):
+    evaluator, questions, answers = read_payload(data, default_mode)
+    results = [None] * len(questions)
+    for index, evaluation in iter_evaluations(
+        evaluator, data, questions, answers, data.get("batch", False), concurrency or data.get("concurrency"),
+    ):
+        results[index] = evaluation
+    return [
+        {"ID": question["ID"], "Evaluation": evaluation}
+        for question, evaluation in zip(questions, results)
+    ]
+
+
+# Function run by the background job workers for one queued submission
+def run_job(data, done):
+    """
+    Evaluate the pairs of a queued payload that are not yet in done, yielding
+    (index, {"ID", "Evaluation"}) as each one finishes.
+    """
+    evaluator, questions, answers = read_payload(data)
+    pending = [index for index in range(len(questions)) if index not in done]
+    events = iter_evaluations(
+        evaluator, data,
+        [questions[index] for index in pending],
+        [answers[index] for index in pending],
+        data.get("batch", False), data.get("concurrency"),
+    )
+    for pending_index, evaluation in events:
+        index = pending[pending_index]
+        yield index, {"ID": questions[index]["ID"], "Evaluation": evaluation}
+
+
+# Function giving an answer graded through its cluster's representative feedback of its own
+def personal_feedback(evaluator, data, question, answer, evaluation):
+    """
+    Ask for short feedback on this answer with the shared score fixed, which costs far
+    fewer output tokens than grading it. Keeps the shared feedback if the call fails.
+    """
+    prompt = prompts.fill(
+        PERSONAL_FEEDBACK_PROMPT,
+        score=evaluation["Score"], question=question, answer=answer,
+        reply_format=output_format(str(evaluation["Score"]), "of feedback", "short"),
+    )
+    try:
+        with llm.charge("feedback"):
+            reply = llm.generate(prompt, evaluator.model_name, llm.EVALUATION_SCHEMA, llm.FEEDBACK_TIERS["short"][1])
+        feedback = llm.parse_evaluation(reply)["Feedback"]
+    except Exception:
+        return evaluation
+    return dict(evaluation, Feedback=feedback)
+
+
+# Function to grade many submissions together, grading near-identical answers once
+def grade_submissions(payloads, default_mode=DEFAULT_MODE, concurrency=None,
+                      threshold=dedupe.DEDUPE_THRESHOLD, feedback_hook=None):
+    """
+    Grade a batch of payloads and return one result per payload, in order: the list
+    grade_submission would return, or the exception (usually InvalidRequest) that made
+    the payload unusable.
+
+    Answers to the same question under the same grading settings are clustered by
+    similarity (dedupe.cluster); only the first answer of each cluster goes to the model
+    and the others share its evaluation, marked with "Duplicate" (which answer it was
+    taken from and how similar they are). feedback_hook(evaluator, data, question, answer,
+    evaluation) may return a copy with feedback written for the duplicate itself, e.g.
+    personal_feedback.
+    """
+    results = [None] * len(payloads)
+    groups = {}
+    for position, data in enumerate(payloads):
+        try:
+            evaluator, questions, answers = read_payload(data, default_mode)
+        except Exception as e:
+            results[position] = e
+            continue
+        evaluations = [None] * len(questions)
+        results[position] = (questions, evaluations)
+        remaining = []
+        for index, (question, answer) in enumerate(zip(questions, answers)):
+            with stage("pregrade"):
+                evaluation = pregrade(question["Text"], answer["Text"], question.get("Answer"),
+                                      question.get("Options"), question.get("Tolerance"))
+            if evaluation is not None:
+                metrics.EVALUATIONS.inc(mode=evaluator.name, outcome="pregraded")
+                evaluations[index] = evaluation
+            else:
+                remaining.append(index)
+        if not remaining:
+            continue
+        try:
+            with stage("prepare"):
+                extras = evaluator.prepare(
+                    data, [questions[index] for index in remaining], [answers[index] for index in remaining],
+                )
+        except Exception as e:
+            results[position] = e
+            continue
+        for index, extra in zip(remaining, extras):
+            question = questions[index]["Text"]
+            # Everything that makes up an evaluation except the answer itself
+            group = (evaluator.name, make_key(
+                question, "", data.get("Class", ""), data.get("Board", ""), data.get("word_count", ""),
+                evaluator.cache_version(data, extra), evaluator.model_name,
+            ))
+            groups.setdefault(group, []).append(
+                (position, index, evaluator, data, question, answers[index]["Text"], extra)
+            )
+
+    with stage("dedupe"):
+        clusters = []
+        for items in groups.values():
+            for members in dedupe.cluster([item[5] for item in items], threshold):
+                clusters.append([(items[member], similarity) for member, similarity in members])
+
+    def evaluate(item):
+        _, _, evaluator, data, question, answer, extra = item
+        return evaluator.evaluate(question, answer, data, extra)
+
+    duplicates = []
+    graded = iter_completed(evaluate, [(members[0][0],) for members in clusters], concurrency=concurrency)
+    try:
+        for cluster_index, evaluation in graded:
+            (position, index, evaluator, _, _, _, _), _ = clusters[cluster_index][0]
+            metrics.EVALUATIONS.inc(mode=evaluator.name, outcome=evaluation.get("Error", "graded"))
+            questions, evaluations = results[position]
+            evaluations[index] = evaluation
+            source = {"submission_id": payloads[position].get("submission_id", position), "ID": questions[index]["ID"]}
+            for item, similarity in clusters[cluster_index][1:]:
+                metrics.EVALUATIONS.inc(mode=item[2].name, outcome="duplicate")
+                shared = dict(evaluation, Duplicate=dict(source, similarity=similarity))
+                results[item[0]][1][item[1]] = shared
+                if feedback_hook is not None and evaluation.get("Score") is not None:
+                    duplicates.append((item, shared))
+    finally:
+        graded.close()
+
+    if duplicates:
+        def own_feedback(item, shared):
+            _, _, evaluator, data, question, answer, _ = item
+            return feedback_hook(evaluator, data, question, answer, shared)
+
+        for duplicate_index, evaluation in iter_completed(own_feedback, duplicates, concurrency=concurrency):
+            item = duplicates[duplicate_index][0]
+            results[item[0]][1][item[1]] = evaluation
+
+    return [
+        result if isinstance(result, Exception) else [
+            {"ID": question["ID"], "Evaluation": evaluation}
+            for question, evaluation in zip(*result)
+        ]
+        for result in results
+    ]
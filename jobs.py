@@ -0,0 +1,229 @@
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+
+from eventlog import log_event
+from storage import LazyConnection
+
+# SQLite file holding queued jobs and their partial results
+JOB_DB = os.environ.get("JOB_DB", "jobs.sqlite3")
+# Background worker threads processing jobs
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+# A running job not updated for this many seconds is assumed dead and picked up again
+JOB_STALE_SECONDS = int(os.environ.get("JOB_STALE_SECONDS", "120"))
+# A worker touches its running job this often, so slow grading never looks abandoned
+JOB_HEARTBEAT_SECONDS = max(1, JOB_STALE_SECONDS // 4)
+# Attempts made to deliver a completion callback
+CALLBACK_ATTEMPTS = int(os.environ.get("JOB_CALLBACK_ATTEMPTS", "3"))
+
+
+def is_callback_url(url):
+    """
+    True for an absolute http or https URL; anything else (file:, ftp:, relative) is refused.
+    """
+    if not isinstance(url, str):
+        return False
+    parts = urllib.parse.urlsplit(url)
+    return parts.scheme in ("http", "https") and bool(parts.netloc)
+
+
+class JobQueue:
+    """
+    Durable local job queue for grading whole answer sheets in the background.
+    Jobs and every finished evaluation are written to SQLite as they happen, so a
+    restart resumes unfinished jobs without re-grading the questions already done.
+
+    handler(payload, done_indices) must yield (index, record) pairs for the items of the
+    payload that are not in done_indices.
+    """
+
+    def __init__(self, handler, path=JOB_DB, workers=JOB_WORKERS):
+        self.handler = handler
+        self.workers = workers
+        self._threads = []
+        self._started_pid = None
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._connection = LazyConnection(path, self._create_tables, timeout=30)
+
+    @staticmethod
+    def _create_tables(db):
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                callback_url TEXT,
+                total INTEGER NOT NULL,
+                completed INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+            CREATE TABLE IF NOT EXISTS job_results (
+                job_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                record TEXT NOT NULL,
+                PRIMARY KEY (job_id, idx)
+            );
+            """
+        )
+        db.commit()
+
+    @property
+    def _db(self):
+        return self._connection.get()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            cursor = self._db.execute(sql, params)
+            self._db.commit()
+            return cursor
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def start(self):
+        """
+        Start the worker threads. Safe to call more than once; a forked child starts its own.
+        """
+        if self._started_pid == os.getpid():
+            return
+        self._started_pid = os.getpid()
+        self._threads = []
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, payload, total, callback_url=None):
+        """
+        Queue a job and return its ID straight away.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, status, payload, callback_url, total, created, updated) "
+            "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+            (job_id, json.dumps(payload, ensure_ascii=False), callback_url, total, now, now),
+        )
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        """
+        Return the job's status, progress and the evaluations finished so far, or None.
+        """
+        rows = self._query(
+            "SELECT status, total, completed, error, created, updated FROM jobs WHERE id = ?", (job_id,)
+        )
+        if not rows:
+            return None
+        status, total, completed, error, created, updated = rows[0]
+        results = self._query("SELECT record FROM job_results WHERE job_id = ? ORDER BY idx", (job_id,))
+        job = {
+            "id": job_id,
+            "status": status,
+            "total": total,
+            "completed": completed,
+            "progress": round(completed / total, 4) if total else 1.0,
+            "evaluations": [json.loads(row[0]) for row in results],
+            "created": created,
+            "updated": updated,
+        }
+        if error:
+            job["error"] = error
+        return job
+
+    def _claim(self):
+        """
+        Mark the oldest queued (or abandoned running) job as running and return it.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            row = self._db.execute(
+                "SELECT id, payload, callback_url FROM jobs "
+                "WHERE status = 'queued' OR (status = 'running' AND updated < ?) "
+                "ORDER BY created LIMIT 1",
+                (now - JOB_STALE_SECONDS,),
+            ).fetchone()
+            if row is not None:
+                self._db.execute("UPDATE jobs SET status = 'running', updated = ? WHERE id = ?", (now, row[0]))
+            self._db.commit()
+        return row
+
+    def _work(self):
+        while True:
+            job = self._claim()
+            if job is None:
+                self._wakeup.wait(timeout=5)
+                self._wakeup.clear()
+                continue
+            self._run(*job)
+
+    def _heartbeat(self, job_id, stop):
+        """
+        Refresh a running job's updated time until stop is set. Model calls waiting on the
+        rate limiter or retrying can go longer than JOB_STALE_SECONDS without a result,
+        and another worker must not take the job over meanwhile.
+        """
+        while not stop.wait(JOB_HEARTBEAT_SECONDS):
+            try:
+                self._execute("UPDATE jobs SET updated = ? WHERE id = ? AND status = 'running'", (time.time(), job_id))
+            except Exception as e:
+                log_event("job_heartbeat_failed", logging.WARNING, job_id=job_id, error=str(e))
+
+    def _run(self, job_id, payload, callback_url):
+        done = {row[0] for row in self._query("SELECT idx FROM job_results WHERE job_id = ?", (job_id,))}
+        stop = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(job_id, stop), name=f"job-heartbeat-{job_id[:8]}",
+                         daemon=True).start()
+        try:
+            for index, record in self.handler(json.loads(payload), done):
+                with self._lock:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO job_results (job_id, idx, record) VALUES (?, ?, ?)",
+                        (job_id, index, json.dumps(record, ensure_ascii=False)),
+                    )
+                    self._db.execute(
+                        "UPDATE jobs SET completed = (SELECT COUNT(*) FROM job_results WHERE job_id = ?), "
+                        "updated = ? WHERE id = ?",
+                        (job_id, time.time(), job_id),
+                    )
+                    self._db.commit()
+            self._execute("UPDATE jobs SET status = 'done', updated = ? WHERE id = ?", (time.time(), job_id))
+        except Exception as e:
+            self._execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated = ? WHERE id = ?",
+                (str(e), time.time(), job_id),
+            )
+        finally:
+            stop.set()
+        # Jobs queued before callback URLs were checked may still hold another scheme
+        if callback_url and is_callback_url(callback_url):
+            self._notify(callback_url, self.get(job_id))
+
+    def _notify(self, url, job):
+        """
+        POST the finished job to the client's callback URL, retrying a few times.
+        """
+        body = json.dumps(job, ensure_ascii=False).encode("utf-8")
+        for attempt in range(CALLBACK_ATTEMPTS):
+            try:
+                callback = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+                with urllib.request.urlopen(callback, timeout=10):
+                    return
+            except Exception as e:
+                log_event("job_callback_failed", logging.WARNING, job_id=job["id"], url=url,
+                          attempt=attempt + 1, error=str(e))
+                time.sleep(2 ** attempt)
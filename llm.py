@@ -0,0 +1,595 @@
+import datetime
+import hashlib
+import json
+import os
+import random
+import contextvars
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+
+import deadline
+import metrics
+import ratelimit
+from context_cache import ContextCache
+from timing import stage
+
+# Model used by every evaluation mode unless a mode asks for another one
+MODEL_NAME = os.environ.get("GEMINI_MODEL", "gemini-1.5-flash")
+# Which backend answers model calls: "gemini" for the real API, "stub" for a local fake
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "gemini")
+# How much feedback the model writes: "short", "standard" or "detailed"; requests may
+# override it with "feedback_length"
+FEEDBACK_LENGTH = os.environ.get("FEEDBACK_LENGTH", "standard")
+# Feedback instruction and reply token cap for each feedback length
+FEEDBACK_TIERS = {
+    "short": ("one sentence", 96),
+    "standard": ("2-3 sentences", 256),
+    "detailed": ("a short paragraph of at most 5 sentences", 512),
+}
+
+# Reply shape the model is constrained to, for one pair and for a batch of pairs
+EVALUATION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {"Score": {"type": "INTEGER"}, "Feedback": {"type": "STRING"}},
+    "required": ["Score", "Feedback"],
+}
+BATCH_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {"ID": {"type": "STRING"}, "Score": {"type": "INTEGER"}, "Feedback": {"type": "STRING"}},
+        "required": ["ID", "Score", "Feedback"],
+    },
+}
+
+# Token charge for a non-text prompt part of unknown size
+ATTACHMENT_TOKENS = int(os.environ.get("LLM_ATTACHMENT_TOKENS", "2000"))
+# Gemini reads each page of an attached PDF as an image of this many tokens
+PDF_PAGE_TOKENS = 258
+# Uploaded files are deleted by the backend after 48 hours
+FILE_LIFETIME = 48 * 3600
+
+
+class ModelUnavailable(Exception):
+    """
+    Raised when the model keeps failing with transient errors (quota, overload, timeouts)
+    after every retry. The answer was not graded; it must not be given a score.
+    """
+
+
+class StubBackendError(RuntimeError):
+    """
+    Failure injected by StubBackend, carrying an HTTP-like status code (503 by default,
+    STUB_ERROR_CODE=429 to simulate quota errors).
+    """
+
+    def __init__(self, code):
+        super().__init__(f"Stub backend error ({code})")
+        self.code = code
+
+
+class ResponseParseError(ValueError):
+    """
+    Raised when a model reply holds no usable score and feedback.
+    """
+
+
+# Evaluation mode (and the number of answers) that the current model call is made for
+_charged_to = contextvars.ContextVar("charged_to", default=("other", 1))
+
+
+@contextmanager
+def charge(mode, pairs=1):
+    """
+    Count the tokens of model calls made in this block, hedges and retries included,
+    towards `mode`, as the cost of grading `pairs` answers.
+    """
+    token = _charged_to.set((mode, pairs))
+    try:
+        yield
+    finally:
+        _charged_to.reset(token)
+
+
+class TokenUsage:
+    """
+    Prompt and reply tokens per evaluation mode, taken from the response's usage metadata,
+    or estimated locally (about four characters per token) when it has none, as with the stub.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.modes = {}
+
+    def record(self, model_name, input_tokens, output_tokens, cached_tokens=0, estimated=False):
+        mode, pairs = _charged_to.get()
+        metrics.TOKENS.inc(input_tokens, direction="in", model=model_name, mode=mode)
+        metrics.TOKENS.inc(output_tokens, direction="out", model=model_name, mode=mode)
+        metrics.TOKENS.inc(cached_tokens, direction="cached", model=model_name, mode=mode)
+        with self._lock:
+            stats = self.modes.setdefault(mode, {
+                "calls": 0, "pairs": 0, "input_tokens": 0, "output_tokens": 0, "cached_tokens": 0,
+                "estimated_calls": 0,
+            })
+            stats["calls"] += 1
+            stats["pairs"] += pairs
+            stats["input_tokens"] += input_tokens
+            stats["output_tokens"] += output_tokens
+            stats["cached_tokens"] += cached_tokens
+            stats["estimated_calls"] += int(estimated)
+
+    def get_stats(self):
+        with self._lock:
+            modes = {mode: dict(stats) for mode, stats in self.modes.items()}
+        for stats in modes.values():
+            for direction in ("input", "output"):
+                stats[f"{direction}_tokens_per_call"] = round(stats[f"{direction}_tokens"] / stats["calls"], 1)
+                stats[f"{direction}_tokens_per_pair"] = round(stats[f"{direction}_tokens"] / stats["pairs"], 1)
+        return modes
+
+
+# Token use of every model call in the process, by evaluation mode
+token_usage = TokenUsage()
+
+
+class GeminiBackend:
+    """
+    Google Generative AI backend. One model client per model name is shared by
+    every mode and request, and with it the same connection pool.
+    """
+
+    def __init__(self, api_key=None):
+        import google.generativeai as genai
+
+        self.genai = genai
+        # Configure the Google Generative AI API key
+        genai.configure(api_key=api_key or os.environ.get("GOOGLE_AI_API_KEY"))
+        self._models = {}
+        self._context_models = {}
+        self._lock = threading.Lock()
+
+    def get_model(self, name):
+        model = self._models.get(name)
+        if model is None:
+            with self._lock:
+                model = self._models.get(name)
+                if model is None:
+                    model = self.genai.GenerativeModel(name)
+                    self._models[name] = model
+        return model
+
+    def create_context(self, model_name, parts, ttl):
+        """
+        Cache a prompt prefix on the server; returns (name, expiry timestamp).
+        Context caching needs a versioned model name, e.g. gemini-1.5-flash-002.
+        """
+        from google.generativeai import caching
+
+        cached = caching.CachedContent.create(
+            model=model_name, contents=parts, ttl=datetime.timedelta(seconds=ttl),
+        )
+        return cached.name, cached.expire_time.timestamp()
+
+    def extend_context(self, name, ttl):
+        from google.generativeai import caching
+
+        cached = caching.CachedContent.get(name)
+        cached.update(ttl=datetime.timedelta(seconds=ttl))
+        return cached.expire_time.timestamp()
+
+    def forget_context(self, name):
+        with self._lock:
+            self._context_models.pop(name, None)
+
+    def upload_file(self, path, display_name):
+        """
+        Upload a document for prompts to attach; returns (handle, expiry timestamp).
+        """
+        handle = self.genai.upload_file(path, display_name=display_name)
+        expiration = getattr(handle, "expiration_time", None)
+        return handle, expiration.timestamp() if expiration else time.time() + FILE_LIFETIME
+
+    def get_file(self, name):
+        """
+        Handle of a file uploaded earlier, by any worker; raises if it is gone.
+        """
+        return self.genai.get_file(name)
+
+    def get_context_model(self, name):
+        model = self._context_models.get(name)
+        if model is None:
+            with self._lock:
+                model = self._context_models.get(name)
+                if model is None:
+                    model = self.genai.GenerativeModel.from_cached_content(name)
+                    self._context_models[name] = model
+        return model
+
+    def generate(self, contents, model_name, response_schema=None, max_output_tokens=None, context=None,
+                 timeout=None):
+        config = {}
+        if response_schema is not None:
+            config["response_mime_type"] = "application/json"
+            config["response_schema"] = response_schema
+        if max_output_tokens:
+            config["max_output_tokens"] = max_output_tokens
+        model = self.get_context_model(context) if context else self.get_model(model_name)
+        response = model.generate_content(
+            contents, generation_config=config or None,
+            request_options={"timeout": timeout} if timeout else None,
+        )
+        text = response.text.strip()
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            token_usage.record(
+                model_name, usage.prompt_token_count, usage.candidates_token_count,
+                getattr(usage, "cached_content_token_count", 0) or 0,
+            )
+        else:
+            token_usage.record(model_name, estimate_tokens(contents), len(text) // 4 + 1, estimated=True)
+        return text
+
+
+class StubFile:
+    """
+    Handle of a document "uploaded" to the stub backend.
+    """
+
+    def __init__(self, name, display_name=""):
+        self.name = name
+        self.display_name = display_name
+
+    def __repr__(self):
+        return f"<stub file {self.name}>"
+
+
+class StubBackend:
+    """
+    Local fake model for load tests and development. It sleeps for a configurable
+    latency, fails at a configurable rate and replies like the real model: JSON when a
+    response schema is given (an array for batched prompts), a line of text for summaries,
+    **Score**/**Feedback** text otherwise.
+    The score is derived from the prompt, so the same prompt always gets the same score.
+
+    latency: "fixed", "uniform" (mean +/- jitter) or "lognormal" (median mean, sigma jitter).
+    """
+
+    def __init__(self, latency_ms=None, jitter=None, distribution=None, error_rate=None, seed=None):
+        self.latency_ms = float(latency_ms if latency_ms is not None else os.environ.get("STUB_LATENCY_MS", "200"))
+        self.jitter = float(jitter if jitter is not None else os.environ.get("STUB_LATENCY_JITTER", "0.5"))
+        self.distribution = distribution or os.environ.get("STUB_LATENCY_DIST", "lognormal")
+        self.error_rate = float(error_rate if error_rate is not None else os.environ.get("STUB_ERROR_RATE", "0"))
+        self.error_code = int(os.environ.get("STUB_ERROR_CODE", "503"))
+        self._random = random.Random(seed if seed is not None else os.environ.get("STUB_SEED"))
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.contexts = 0
+        self.uploads = 0
+
+    def _latency(self):
+        with self._lock:
+            if self.distribution == "fixed":
+                return self.latency_ms / 1000
+            if self.distribution == "uniform":
+                spread = self.latency_ms * self.jitter
+                return max(0.0, self._random.uniform(self.latency_ms - spread, self.latency_ms + spread)) / 1000
+            return self.latency_ms * self._random.lognormvariate(0, self.jitter) / 1000
+
+    def create_context(self, model_name, parts, ttl):
+        with self._lock:
+            self.contexts += 1
+            return f"stub-contexts/{self.contexts}", time.time() + ttl
+
+    def extend_context(self, name, ttl):
+        return time.time() + ttl
+
+    def upload_file(self, path, display_name):
+        with self._lock:
+            self.uploads += 1
+            return StubFile(f"stub-files/{self.uploads}", display_name), time.time() + FILE_LIFETIME
+
+    def get_file(self, name):
+        if not name.startswith("stub-files/"):
+            raise LookupError(f"No such stub file: {name}")
+        return StubFile(name)
+
+    def generate(self, contents, model_name, response_schema=None, max_output_tokens=None, context=None,
+                 timeout=None):
+        with self._lock:
+            self.calls += 1
+            failed = self._random.random() < self.error_rate
+        latency = self._latency()
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Stub call timed out after {timeout:.2f}s")
+        time.sleep(latency)
+        if failed:
+            raise StubBackendError(self.error_code)
+
+        prompt = contents if isinstance(contents, str) else str(contents[0])
+        if "Reply with only a JSON array" in prompt:
+            keys = re.findall(r"^\[(\d+)\]$", prompt, re.MULTILINE)
+            reply = json.dumps([
+                {"ID": key, "Score": self._score(prompt + key), "Feedback": "Stub feedback."} for key in keys
+            ])
+        elif "Reply with only the summary" in prompt:
+            reply = f"Stub summary of a {len(prompt)} character prompt."
+        elif response_schema is not None:
+            reply = json.dumps({"Score": self._score(prompt), "Feedback": f"Stub feedback for a {len(prompt)} character prompt."})
+        else:
+            reply = f"1. **Score**: {self._score(prompt)}\n2. **Feedback**: Stub feedback for a {len(prompt)} character prompt."
+        # Token counts estimated the way the real backend would report them
+        token_usage.record(model_name, estimate_tokens(contents), len(reply) // 4 + 1, estimated=True)
+        return reply
+
+    @staticmethod
+    def _score(text):
+        return 40 + int(hashlib.sha256(text.encode("utf-8")).hexdigest(), 16) % 61
+
+
+BACKENDS = {"gemini": GeminiBackend, "stub": StubBackend}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    Return the process-wide backend, created on first use from LLM_BACKEND.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if LLM_BACKEND not in BACKENDS:
+                    raise ValueError(f"Unknown LLM backend: {LLM_BACKEND}")
+                _backend = BACKENDS[LLM_BACKEND]()
+    return _backend
+
+
+def set_backend(backend):
+    """
+    Replace the backend, e.g. with a configured StubBackend in benchmarks.
+    """
+    global _backend
+    _backend = backend
+
+
+# Process-wide request/token quota and adaptive concurrency for model calls
+limiter = ratelimit.RateLimiter()
+
+
+# Estimated tokens of uploaded files, by file name
+_file_tokens = {}
+
+
+def file_tokens(path):
+    """
+    Estimated prompt tokens of a local document: its page count for a PDF, its size for text.
+    """
+    if not path.lower().endswith(".pdf"):
+        return os.path.getsize(path) // 4 + 1
+    try:
+        from pypdf import PdfReader
+
+        return len(PdfReader(path).pages) * PDF_PAGE_TOKENS
+    except Exception:
+        return ATTACHMENT_TOKENS
+
+
+def note_file(handle, path):
+    """
+    Remember the size of an uploaded file, measured on the local copy it was uploaded from.
+    """
+    name = getattr(handle, "name", None)
+    if name is not None and name not in _file_tokens:
+        _file_tokens[name] = file_tokens(path)
+
+
+def attachment_tokens(part):
+    return _file_tokens.get(getattr(part, "name", None), ATTACHMENT_TOKENS)
+
+
+# Prompt prefixes cached on the backend, shared by every mode and request
+contexts = ContextCache(get_backend, attachment_tokens)
+
+
+def estimate_tokens(contents):
+    parts = [contents] if isinstance(contents, str) else contents
+    return sum(len(part) // 4 + 1 if isinstance(part, str) else attachment_tokens(part) for part in parts)
+
+
+_hedge_executor = None
+_hedge_lock = threading.Lock()
+
+
+def get_hedge_executor():
+    """
+    Threads that run model calls while their caller waits, so a hedge can race the first call.
+    """
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _hedge_lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(
+                    max_workers=ratelimit.MAX_CONCURRENCY * 2, thread_name_prefix="model-call",
+                )
+    return _hedge_executor
+
+
+def call_timeout():
+    """
+    Timeout for the next model call: the per-call limit, or less if the request's deadline is closer.
+    """
+    deadline.check()
+    return min(ratelimit.CALL_TIMEOUT_SECONDS, deadline.remaining(ratelimit.CALL_TIMEOUT_SECONDS))
+
+
+def call_once(backend, arguments, timeout):
+    """
+    One model call that the limiter has already admitted; gives the slot back when it ends.
+    """
+    started = time.perf_counter()
+    try:
+        text = backend.generate(*arguments, timeout=timeout)
+    except Exception as e:
+        limiter.release(error=e)
+        if type(e).__name__ in ("TimeoutError", "DeadlineExceeded"):
+            limiter.count("timeouts")
+        raise
+    limiter.release(latency=time.perf_counter() - started, output_tokens=len(text) // 4 + 1)
+    return text
+
+
+def call_hedged(backend, arguments, input_tokens, timeout):
+    """
+    Run a model call; if it is still going when recent calls at the hedge percentile had
+    finished, start a duplicate and return whichever succeeds first. The slower call is
+    left to finish (or time out) on its own. No duplicate is sent when the limiter has no
+    spare quota or concurrency, so hedging never adds to an overload.
+    """
+    hedge_after = ratelimit.HEDGE_PERCENTILE and limiter.latencies.percentile(ratelimit.HEDGE_PERCENTILE)
+    if not hedge_after or hedge_after >= timeout:
+        return call_once(backend, arguments, timeout)
+
+    executor = get_hedge_executor()
+    started = time.monotonic()
+    first = executor.submit(contextvars.copy_context().run, call_once, backend, arguments, timeout)
+    done, _ = wait([first], timeout=hedge_after)
+    if done or not limiter.acquire(input_tokens, timeout=0):
+        return first.result()
+
+    limiter.count("hedges")
+    second = executor.submit(
+        contextvars.copy_context().run, call_once, backend, arguments, timeout - (time.monotonic() - started),
+    )
+    pending = {first, second}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                text = future.result()
+            except Exception as e:
+                error = e
+                continue
+            if future is second:
+                limiter.count("hedge_wins")
+            return text
+    raise error
+
+
+def generate(contents, model_name=MODEL_NAME, response_schema=None, max_output_tokens=None, context=None):
+    """
+    Send a prompt (or a list of prompt parts, e.g. a prompt and an uploaded file) and
+    return the model's text. With a response_schema the model replies in JSON of that shape;
+    max_output_tokens caps the reply length. context names a cached prompt prefix
+    (see context_cache) that the contents continue.
+    Every call goes through the rate limiter and has a timeout, shortened to fit the
+    request's deadline. Transient errors (timeouts included) are retried with jittered
+    exponential backoff; when the retries run out ModelUnavailable is raised, and
+    deadline.DeadlineExceeded when the request runs out of time first.
+    """
+    backend = get_backend()
+    input_tokens = estimate_tokens(contents)
+    arguments = (contents, model_name, response_schema, max_output_tokens, context)
+    try:
+        for attempt in range(ratelimit.RETRY_ATTEMPTS + 1):
+            deadline.check()
+            with stage("rate_limit_wait"):
+                if not limiter.acquire(input_tokens, deadline.remaining()):
+                    raise deadline.DeadlineExceeded("Request deadline passed while waiting for model quota")
+            try:
+                timeout = call_timeout()
+            except deadline.DeadlineExceeded:
+                limiter.release()
+                raise
+            try:
+                with stage("model_call"):
+                    return call_hedged(backend, arguments, input_tokens, timeout)
+            except Exception as e:
+                if not ratelimit.is_transient(e):
+                    raise
+                if attempt == ratelimit.RETRY_ATTEMPTS:
+                    limiter.count("failures")
+                    raise ModelUnavailable(f"Model unavailable after {attempt + 1} attempts: {e}") from e
+                delay = ratelimit.backoff_delay(attempt)
+                if delay >= deadline.remaining(delay + 1):
+                    raise deadline.DeadlineExceeded(f"No time left to retry the model call: {e}") from e
+                limiter.count("retries")
+                with stage("retry_backoff"):
+                    time.sleep(delay)
+    except deadline.DeadlineExceeded:
+        limiter.count("deadline_exceeded")
+        raise
+
+
+# Score and feedback fields of a JSON reply, also found in replies cut off by the token cap
+SCORE_FIELD = re.compile(r'"Score"\s*:\s*"?(\d{1,3})')
+FEEDBACK_FIELD = re.compile(r'"Feedback"\s*:\s*"((?:[^"\\]|\\.)*)')
+
+
+def validate_evaluation(score, feedback):
+    """
+    Return {"Score", "Feedback"} if score is a whole number from 0 to 100 and feedback
+    is non-empty text, otherwise None.
+    """
+    try:
+        score = int(score)
+    except (TypeError, ValueError):
+        return None
+    if not 0 <= score <= 100 or not isinstance(feedback, str) or not feedback.strip():
+        return None
+    return {"Score": score, "Feedback": feedback.strip()}
+
+
+def parse_json_evaluation(text):
+    text = text.strip()
+    if text.startswith("```"):
+        # Models sometimes wrap JSON in a markdown code fence
+        text = text.strip("`").removeprefix("json").strip()
+    try:
+        reply = json.loads(text)
+    except ValueError:
+        reply = None
+    if isinstance(reply, dict):
+        return validate_evaluation(reply.get("Score"), reply.get("Feedback"))
+
+    # A reply truncated by the token cap: keep the score and the feedback written so far
+    score_match = SCORE_FIELD.search(text)
+    feedback_match = FEEDBACK_FIELD.search(text)
+    if not score_match or not feedback_match:
+        return None
+    # Drop a dangling escape character left by the cut
+    partial = feedback_match.group(1).rstrip("\\")
+    try:
+        feedback = json.loads(f'"{partial}"')
+    except ValueError:
+        return None
+    return validate_evaluation(score_match.group(1), feedback)
+
+
+def parse_text_evaluation(text):
+    score_match = re.search(r"\*\*Score\*\*:\s*(\d+)", text)
+    feedback_match = re.search(r"\*\*Feedback\*\*:\s*(.+)", text, re.DOTALL)
+    if not score_match:
+        return None
+    feedback = feedback_match.group(1) if feedback_match else "No feedback provided."
+    return validate_evaluation(score_match.group(1), feedback)
+
+
+def parse_evaluation(evaluation_text):
+    """
+    Read a model reply into {"Score", "Feedback"}. JSON replies are expected; the older
+    **Score**/**Feedback** text format is still understood.
+    Raises ResponseParseError instead of guessing a score when neither is found.
+    """
+    with stage("response_parse"):
+        evaluation = parse_json_evaluation(evaluation_text) or parse_text_evaluation(evaluation_text)
+    if evaluation is None:
+        metrics.PARSE_FAILURES.inc()
+        raise ResponseParseError(f"Unreadable model reply: {evaluation_text[:200]!r}")
+    return evaluation
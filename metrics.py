@@ -0,0 +1,124 @@
+import threading
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Every metric of the process, rendered in this order by render()
+REGISTRY = []
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """
+    Monotonic count, optionally split by labels.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def lines(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{format_labels(self.labelnames, key)} {value}"
+
+
+class Histogram:
+    """
+    Distribution of observed values over fixed buckets, optionally split by labels.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = list(counts)
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[position] += 1
+                    break
+            self._values[key] = (counts, total + value, count + 1)
+
+    def lines(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{format_labels(self.labelnames, key, [('le', bound)])} {cumulative}"
+            yield f"{self.name}_bucket{format_labels(self.labelnames, key, [('le', '+Inf')])} {count}"
+            yield f"{self.name}_sum{format_labels(self.labelnames, key)} {total}"
+            yield f"{self.name}_count{format_labels(self.labelnames, key)} {count}"
+
+
+class Collected:
+    """
+    Values read at scrape time from an existing stats dict, e.g. a cache's hit counts.
+    collect() returns {label value: number} for the single label labelname.
+    """
+
+    def __init__(self, name, documentation, labelname, collect, kind="counter"):
+        self.name = name
+        self.documentation = documentation
+        self.labelname = labelname
+        self.collect = collect
+        self.kind = kind
+        REGISTRY.append(self)
+
+    def lines(self):
+        for label, value in sorted(self.collect().items()):
+            yield f"{self.name}{format_labels([self.labelname], [label])} {value}"
+
+
+def render():
+    """
+    All metrics in the Prometheus text exposition format.
+    """
+    output = []
+    for metric in REGISTRY:
+        output.append(f"# HELP {metric.name} {metric.documentation}")
+        output.append(f"# TYPE {metric.name} {metric.kind}")
+        output.extend(metric.lines())
+    return "\n".join(output) + "\n"
+
+
+STAGE_SECONDS = Histogram("eval_stage_seconds", "Time spent in each pipeline stage.", ["stage"])
+REQUEST_SECONDS = Histogram("eval_request_seconds", "HTTP request latency.", ["route", "method"])
+REQUESTS = Counter("eval_requests_total", "HTTP requests by route and status code.", ["route", "method", "status"])
+TOKENS = Counter("eval_llm_tokens_total", "Model tokens sent and received, by evaluation mode.", ["direction", "model", "mode"])
+PARSE_FAILURES = Counter("eval_parse_failures_total", "Model replies without a usable score.")
+EVALUATIONS = Counter("eval_evaluations_total", "Evaluations returned, by outcome.", ["mode", "outcome"])
+MODEL_TIER_SECONDS = Histogram("eval_model_tier_seconds", "Model call latency per routing tier.", ["tier"])
+MODEL_TIER_PAIRS = Counter("eval_model_tier_pairs_total", "Question-answer pairs routed to each model tier.", ["tier"])
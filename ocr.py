@@ -0,0 +1,293 @@
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import llm
+from evaluators import InvalidRequest, error_evaluation, get_evaluator
+from executor import map_ordered
+from grading import grade_submission
+from timing import stage
+
+# Which OCR backend reads the pages: "gemini" for the vision model, "stub" for local testing
+OCR_BACKEND = os.environ.get("OCR_BACKEND", "gemini")
+# Vision model used by the gemini OCR backend
+OCR_MODEL = os.environ.get("OCR_MODEL", llm.MODEL_NAME)
+# Uploads are written here while they are processed, never held in memory
+OCR_SPOOL_DIR = os.environ.get("OCR_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "ocr_spool"))
+# Largest accepted upload, in bytes (all files together)
+OCR_MAX_UPLOAD_BYTES = int(os.environ.get("OCR_MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+# Largest number of pages read from one submission
+OCR_MAX_PAGES = int(os.environ.get("OCR_MAX_PAGES", "60"))
+# Pages of one submission transcribed at the same time
+OCR_PAGE_CONCURRENCY = int(os.environ.get("OCR_PAGE_CONCURRENCY", "8"))
+
+MIME_TYPES = {
+    ".pdf": "application/pdf",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+    ".heic": "image/heic",
+    ".heif": "image/heif",
+    ".txt": "text/plain",
+}
+EXTENSIONS = {mime: extension for extension, mime in reversed(list(MIME_TYPES.items()))}
+
+# Answer markers with their number, e.g. "Q1.", "Ans 3:", "4)", "प्रश्न 2", "उत्तर २"
+ANSWER_MARKER = re.compile(
+    r"^[ \t]*(?:(?:q|que|ques|question|ans|answer|प्रश्न|उत्तर)[ \t]*[\.:]?[ \t]*(\d+)[ \t]*[\.\):\-]?|(\d+)[ \t]*[\.\)])",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+TRANSCRIBE_PROMPT = """
+Transcribe all handwritten and printed text on this answer sheet page exactly as written.
+Keep the line breaks and every question number or label (e.g. "Q1.", "Ans 2", "3)", "प्रश्न 4") at the start of its line.
+Do not correct, translate or summarise anything. Reply with only the text.
+"""
+
+
+class Spool:
+    """
+    Temporary directory for one submission's files, removed when the block exits.
+    """
+
+    def __init__(self, directory=OCR_SPOOL_DIR, max_bytes=OCR_MAX_UPLOAD_BYTES):
+        self.max_bytes = max_bytes
+        self.written = 0
+        os.makedirs(directory, exist_ok=True)
+        self.path = tempfile.mkdtemp(dir=directory)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def save(self, stream, mime_type, filename=None):
+        """
+        Copy an upload stream to a file in blocks and return its path.
+        The file name's extension is used when the client sent no usable content type.
+        """
+        if mime_type not in EXTENSIONS and filename:
+            mime_type = MIME_TYPES.get(os.path.splitext(filename)[1].lower(), mime_type)
+        extension = EXTENSIONS.get(mime_type)
+        if extension is None:
+            raise InvalidRequest(f"Unsupported file type: {mime_type}. Expected a PDF or page images.")
+        fd, path = tempfile.mkstemp(suffix=extension, dir=self.path)
+        with os.fdopen(fd, "wb") as handle:
+            for block in iter(lambda: stream.read(1024 * 1024), b""):
+                self.written += len(block)
+                if self.written > self.max_bytes:
+                    raise InvalidRequest(f"Upload too large, the limit is {self.max_bytes} bytes.")
+                handle.write(block)
+        return path
+
+    def split_pages(self, paths):
+        """
+        Return one (path, mime type) per page: every page of a PDF becomes its own file,
+        other files are single pages.
+        """
+        pages = []
+        for path in paths:
+            mime_type = MIME_TYPES[os.path.splitext(path)[1]]
+            if mime_type == "application/pdf":
+                pages.extend((page, mime_type) for page in self._split_pdf(path))
+            else:
+                pages.append((path, mime_type))
+            if len(pages) > OCR_MAX_PAGES:
+                raise InvalidRequest(f"Too many pages, the limit is {OCR_MAX_PAGES}.")
+        return pages
+
+    def _split_pdf(self, path):
+        try:
+            from pypdf import PdfReader, PdfWriter
+        except ImportError:
+            # Without pypdf the document is read in one piece
+            return [path]
+        try:
+            reader = PdfReader(path)
+        except Exception:
+            raise InvalidRequest("The uploaded PDF could not be read.")
+        if len(reader.pages) > OCR_MAX_PAGES:
+            raise InvalidRequest(f"Too many pages, the limit is {OCR_MAX_PAGES}.")
+        pages = []
+        for number, page in enumerate(reader.pages, 1):
+            writer = PdfWriter()
+            writer.add_page(page)
+            page_path = f"{path[:-4]}-page{number:04d}.pdf"
+            with open(page_path, "wb") as handle:
+                writer.write(handle)
+            pages.append(page_path)
+        return pages
+
+
+class VisionOCRBackend:
+    """
+    Transcribes a page with the Gemini vision model, through the shared rate limiter.
+    """
+
+    def __init__(self, model_name=OCR_MODEL):
+        self.model_name = model_name
+
+    def transcribe(self, path, mime_type):
+        with open(path, "rb") as handle:
+            page = {"mime_type": mime_type, "data": handle.read()}
+        with llm.charge("ocr"):
+            return llm.generate([TRANSCRIBE_PROMPT, page], self.model_name)
+
+
+class StubOCRBackend:
+    """
+    Offline OCR for tests: returns the embedded text of PDF pages and the content of
+    text files, and nothing for images.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def transcribe(self, path, mime_type):
+        if self.delay:
+            time.sleep(self.delay)
+        if mime_type == "text/plain":
+            with open(path, encoding="utf-8", errors="replace") as handle:
+                return handle.read()
+        if mime_type == "application/pdf":
+            from pypdf import PdfReader
+
+            return "\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+        return ""
+
+
+def make_backend(name=OCR_BACKEND):
+    if name == "stub":
+        return StubOCRBackend(float(os.environ.get("OCR_STUB_DELAY", "0")))
+    if name == "gemini":
+        return VisionOCRBackend()
+    raise ValueError(f"Unknown OCR backend: {name}")
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = make_backend()
+    return _backend
+
+
+def set_backend(backend):
+    global _backend
+    _backend = backend
+
+
+def transcribe_pages(pages, concurrency=None):
+    """
+    Transcribe every (path, mime type) page concurrently and return the texts in page order.
+    """
+    backend = get_backend()
+
+    def transcribe(path, mime_type):
+        with stage("ocr"):
+            return backend.transcribe(path, mime_type)
+
+    return map_ordered(transcribe, pages, concurrency=concurrency or OCR_PAGE_CONCURRENCY)
+
+
+def split_answers(text, question_ids=None):
+    """
+    Split a transcribed answer sheet into {question ID: answer text}.
+    An answer starts at a line beginning with its question ID (e.g. "S1_Q3") or with a
+    marker carrying the ID's number ("Q3.", "Ans 3", "3)", "प्रश्न 3") and runs to the
+    next answer. Without question IDs every numbered marker starts an answer with that number as ID.
+    Only the first marker of each question is used, so numbered lists inside an answer
+    do not cut it short once that number has been seen.
+    """
+    markers = []
+    if question_ids:
+        by_number = {}
+        by_label = {}
+        for question_id in question_ids:
+            label = str(question_id)
+            if not label.isdigit():
+                # Plain numbers are matched by the generic markers, which need punctuation
+                by_label[label.casefold()] = question_id
+            number = re.search(r"(\d+)\D*$", label)
+            if number:
+                by_number.setdefault(int(number.group(1)), question_id)
+        if by_label:
+            labels = "|".join(re.escape(label) for label in sorted(by_label, key=len, reverse=True))
+            exact = re.compile(rf"^[ \t]*({labels})(?!\w)[ \t]*[\.\):\-]?", re.IGNORECASE | re.MULTILINE)
+            for match in exact.finditer(text):
+                markers.append((match.start(), match.end(), by_label[match.group(1).casefold()]))
+    else:
+        by_number = None
+
+    for match in ANSWER_MARKER.finditer(text):
+        number = int(match.group(1) or match.group(2))
+        if by_number is None:
+            markers.append((match.start(), match.end(), str(number)))
+        elif number in by_number:
+            markers.append((match.start(), match.end(), by_number[number]))
+
+    chosen = []
+    seen = set()
+    last_end = -1
+    for start, end, question_id in sorted(markers):
+        if question_id in seen or start < last_end:
+            continue
+        seen.add(question_id)
+        chosen.append((start, end, question_id))
+        last_end = end
+
+    answers = {}
+    for position, (start, end, question_id) in enumerate(chosen):
+        stop = chosen[position + 1][0] if position + 1 < len(chosen) else len(text)
+        answers[question_id] = text[end:stop].strip()
+    return answers
+
+
+# Function to grade a scanned answer sheet through the normal evaluation path
+def grade_scan(data, pages, default_mode, concurrency=None):
+    """
+    Transcribe the pages, split the text into answers and grade them.
+    Returns (evaluations, answers) in question order; questions whose answer was not
+    found in the scan get an ungraded "answer_not_found" result.
+    """
+    # Check the payload before the expensive OCR step
+    evaluator = get_evaluator(data.get("mode") or default_mode)
+    questions = data.get("questions")
+    if questions is not None:
+        if not isinstance(questions, list) or not questions or \
+                any(not isinstance(q, dict) or "ID" not in q or "Text" not in q for q in questions):
+            raise InvalidRequest("Invalid input. Expected a list of questions with 'ID' and 'Text'.")
+    elif evaluator.requires_questions:
+        raise InvalidRequest(f"Mode {evaluator.name} needs the list of questions.")
+
+    texts = transcribe_pages(pages, data.get("ocr_concurrency"))
+    text = "\n".join(texts)
+    with stage("answer_split"):
+        found = split_answers(text, [question["ID"] for question in questions] if questions else None)
+    answers = [{"ID": question_id, "Text": answer} for question_id, answer in found.items()]
+
+    if questions is None:
+        if not answers:
+            raise InvalidRequest("No numbered answers were found in the scan.")
+        return grade_submission(dict(data, answers=answers), default_mode, concurrency), answers
+
+    matched = [question for question in questions if question["ID"] in found]
+    graded = {}
+    if matched:
+        payload = dict(data, questions=matched, answers=[{"ID": q["ID"], "Text": found[q["ID"]]} for q in matched])
+        graded = {record["ID"]: record["Evaluation"] for record in grade_submission(payload, default_mode, concurrency)}
+    evaluations = [
+        {
+            "ID": question["ID"],
+            "Evaluation": graded.get(question["ID"])
+            or error_evaluation("No answer for this question was found in the scan", "answer_not_found"),
+        }
+        for question in questions
+    ]
+    return evaluations, answers
@@ -0,0 +1,169 @@
+import math
+import re
+import unicodedata
+from fractions import Fraction
+
+# Relative tolerance for numeric answers when the question gives no "Tolerance"
+DEFAULT_RELATIVE_TOLERANCE = 1e-6
+
+# Zero-width joiners that Hindi keyboards insert inconsistently
+ZERO_WIDTH = dict.fromkeys(map(ord, "\u200b\u200c\u200d\u2060\ufeff"), None)
+PUNCTUATION = re.compile(r"[^\w\s\.\-/]", re.UNICODE)
+OPTION_ANSWER = re.compile(
+    r"^\s*(?:option|opt|ans|answer|विकल्प|उत्तर)?\s*[:\-]?\s*[\(\[]?([a-h])[\)\]\.:]?(?:\s+(.*))?$",
+    re.IGNORECASE | re.DOTALL,
+)
+NUMBER = re.compile(r"^[+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:/\d+)?$")
+
+
+def has_devanagari(text):
+    return any("\u0900" <= char <= "\u097f" for char in str(text))
+
+
+def normalize(text):
+    """
+    Normalize an answer for comparison: Unicode NFKC, no zero-width joiners, Indic digits
+    as ASCII, case folded, punctuation (including the danda) dropped, spacing collapsed.
+    """
+    text = unicodedata.normalize("NFKC", str(text)).translate(ZERO_WIDTH)
+    text = "".join(
+        str(unicodedata.digit(char)) if char.isdigit() and not char.isascii() else char
+        for char in text
+    )
+    text = text.casefold().replace("\u0964", " ").replace("\u0965", " ")
+    text = PUNCTUATION.sub(" ", text)
+    return " ".join(text.split()).strip(" .")
+
+
+# Answers that only say the student did not answer, compared after normalize()
+PLACEHOLDERS = {
+    "n/a", "idk", "i don't know", "i dont know", "dont know", "don't know", "do not know", "not known",
+    "no answer", "not attempted", "no idea", "pata nahi", "pata nahin", "malum nahi",
+    "पता नहीं", "नहीं पता", "मालूम नहीं", "नहीं मालूम", "उत्तर नहीं", "कोई उत्तर नहीं", "पता नही",
+}
+_PLACEHOLDER_FORMS = {normalize(text) for text in PLACEHOLDERS}
+
+
+def is_blank(answer):
+    """
+    True for an answer with no letters or digits at all, or one that is only a
+    placeholder such as "N/A", "idk" or "पता नहीं".
+    """
+    text = normalize(answer)
+    if not any(char.isalnum() for char in text):
+        return True
+    return text in _PLACEHOLDER_FORMS
+
+
+def blank_result(question):
+    if has_devanagari(question):
+        return {"Score": 0, "Feedback": "कोई उत्तर नहीं दिया गया।"}
+    return {"Score": 0, "Feedback": "No answer was given."}
+
+
+def parse_number(text):
+    """
+    Return the value of an answer that is just a number (allowing thousands separators
+    and simple fractions), or None.
+    """
+    value = normalize(str(text).replace(",", ""))
+    if not NUMBER.match(value):
+        return None
+    try:
+        return float(Fraction(value))
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def parse_tolerance(value):
+    """
+    Return a question's "Tolerance" as a non-negative float, or None when it is not a number.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return abs(float(value)) if math.isfinite(value) else None
+    number = parse_number(value) if isinstance(value, str) else None
+    return abs(number) if number is not None else None
+
+
+def parse_options(options):
+    """
+    Accept options as {"A": "Delhi", ...} or ["Delhi", ...] and return {"a": "delhi", ...}.
+    """
+    if isinstance(options, dict):
+        items = options.items()
+    elif isinstance(options, list):
+        items = zip("abcdefgh", options)
+    else:
+        return {}
+    return {str(letter).strip().casefold(): normalize(text) for letter, text in items}
+
+
+def chosen_option(answer, options):
+    """
+    Work out which option letter an answer picks, e.g. "B", "(b)", "Option B", "b) Paris"
+    or the option text itself. Returns None when the answer names no option.
+    """
+    text = str(answer).strip()
+    match = OPTION_ANSWER.match(text)
+    if match and match.group(1).casefold() in options:
+        letter = match.group(1).casefold()
+        rest = normalize(match.group(2) or "")
+        # "B Paris" only counts when the text agrees with option B
+        if not rest or rest == options[letter]:
+            return letter
+    normalized = normalize(text)
+    for letter, option_text in options.items():
+        if normalized and normalized == option_text:
+            return letter
+    return None
+
+
+def result(correct, question, expected):
+    if has_devanagari(question):
+        feedback = "सही उत्तर।" if correct else f"गलत उत्तर। सही उत्तर है: {expected}"
+    else:
+        feedback = "Correct answer." if correct else f"Incorrect answer. The correct answer is: {expected}"
+    return {"Score": 100 if correct else 0, "Feedback": feedback}
+
+
+def pregrade(question, user_answer, reference=None, options=None, tolerance=None):
+    """
+    Grade an objective answer locally against its reference answer or option key.
+    Returns an evaluation ({"Score", "Feedback"}) when the outcome is certain, or None
+    when the answer is ambiguous and needs the model. Blank answers score 0 in every mode.
+    """
+    if is_blank(user_answer):
+        return blank_result(question)
+    if reference is None or str(reference).strip() == "":
+        return None
+
+    option_map = parse_options(options) if options else {}
+    if option_map:
+        expected = chosen_option(reference, option_map)
+        if expected is not None:
+            picked = chosen_option(user_answer, option_map)
+            if picked is not None:
+                return result(picked == expected, question, expected.upper())
+            # Free text that names no option is left to the model
+            return None
+
+    expected_number = parse_number(reference)
+    if expected_number is not None:
+        given_number = parse_number(user_answer)
+        if given_number is None:
+            return None
+        allowed = parse_tolerance(tolerance) if tolerance is not None else None
+        if allowed is None:
+            # No usable tolerance (read_payload refuses bad ones): an exact comparison
+            allowed = abs(expected_number) * DEFAULT_RELATIVE_TOLERANCE
+        return result(abs(given_number - expected_number) <= allowed, question, reference)
+
+    if normalize(user_answer) == normalize(reference):
+        return result(True, question, reference)
+
+    # A single letter against a single letter reference is an MCQ without options listed
+    if len(normalize(reference)) == 1 and len(normalize(user_answer)) == 1:
+        return result(False, question, str(reference).strip().upper())
+    return None
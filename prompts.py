@@ -0,0 +1,51 @@
+import functools
+import os
+import re
+
+# Set to 0 to send prompt templates exactly as written, e.g. to measure what compaction saves
+PROMPT_COMPACTION = os.environ.get("PROMPT_COMPACTION", "1") != "0"
+
+# Question "Type" values whose answers are a word, a line or a choice; they get the
+# short instruction list and the fast model tier
+SHORT_TYPES = ("one mark", "1 mark", "mcq", "objective", "very short", "fill in")
+
+NESTED_BULLET = re.compile(r"^\s+[-*•]\s")
+
+
+def is_short_type(data):
+    """
+    True when the payload's question type expects a one-word or one-line answer.
+    """
+    question_type = str(data.get("Type") or "").casefold()
+    return any(short in question_type for short in SHORT_TYPES)
+
+
+@functools.lru_cache(maxsize=256)
+def compact(text):
+    """
+    Strip what a template's layout adds but the model does not need: indentation
+    (nested bullets keep two spaces), trailing spaces, runs of blank lines and lines
+    repeated word for word. Only ever applied to templates, never to answers or excerpts.
+    """
+    if not PROMPT_COMPACTION:
+        return text
+    lines = []
+    seen = set()
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            if lines and lines[-1]:
+                lines.append("")
+            continue
+        if stripped.casefold() in seen:
+            continue
+        seen.add(stripped.casefold())
+        lines.append("  " + stripped if NESTED_BULLET.match(line) else stripped)
+    return "\n".join(lines).strip()
+
+
+def fill(template, **values):
+    """
+    Compact a str.format template, then fill it in. Values are inserted as they are.
+    """
+    return compact(template).format(**values)
@@ -0,0 +1,234 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+
+# Gemini quota for the whole process
+REQUESTS_PER_MINUTE = float(os.environ.get("GEMINI_RPM", "1000"))
+TOKENS_PER_MINUTE = float(os.environ.get("GEMINI_TPM", "1000000"))
+# Model calls allowed in flight at once; the limit moves between the bounds
+MIN_CONCURRENCY = int(os.environ.get("MODEL_MIN_CONCURRENCY", "1"))
+MAX_CONCURRENCY = int(os.environ.get("MODEL_MAX_CONCURRENCY", "32"))
+INITIAL_CONCURRENCY = int(os.environ.get("MODEL_INITIAL_CONCURRENCY", "8"))
+# A call this many times slower than the running average counts as a latency spike
+LATENCY_SPIKE_FACTOR = float(os.environ.get("MODEL_LATENCY_SPIKE_FACTOR", "3"))
+# Retries of transient errors, with jittered exponential backoff
+RETRY_ATTEMPTS = int(os.environ.get("MODEL_RETRY_ATTEMPTS", "4"))
+RETRY_BASE_SECONDS = float(os.environ.get("MODEL_RETRY_BASE_SECONDS", "0.5"))
+RETRY_MAX_SECONDS = float(os.environ.get("MODEL_RETRY_MAX_SECONDS", "20"))
+# Longest a single model call may take before it is abandoned (and retried if time allows)
+CALL_TIMEOUT_SECONDS = float(os.environ.get("MODEL_CALL_TIMEOUT_SECONDS", "30"))
+# Send a duplicate call when the first is slower than this percentile of recent calls; 0 disables hedging
+HEDGE_PERCENTILE = float(os.environ.get("MODEL_HEDGE_PERCENTILE", "0"))
+# Recent call latencies the percentile is taken over, and how many are needed before hedging starts
+HEDGE_WINDOW = int(os.environ.get("MODEL_HEDGE_WINDOW", "200"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("MODEL_HEDGE_MIN_SAMPLES", "20"))
+
+# Errors worth retrying: quota, overload and timeouts. Matched by name so the
+# google api_core exceptions do not have to be imported here.
+TRANSIENT_ERRORS = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "DeadlineExceeded", "GatewayTimeout", "Aborted", "TimeoutError", "ConnectionError",
+}
+TRANSIENT_CODES = {408, 429, 500, 502, 503, 504}
+THROTTLE_ERRORS = {"ResourceExhausted", "TooManyRequests"}
+
+
+def is_transient(error):
+    code = getattr(error, "code", None)
+    return type(error).__name__ in TRANSIENT_ERRORS or (isinstance(code, int) and code in TRANSIENT_CODES)
+
+
+def is_throttle(error):
+    return type(error).__name__ in THROTTLE_ERRORS or getattr(error, "code", None) == 429
+
+
+def backoff_delay(attempt):
+    """
+    Full-jitter exponential backoff: a random delay up to base * 2^attempt, capped.
+    """
+    return random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * (2 ** attempt)))
+
+
+class TokenBucket:
+    """
+    Refills `rate` units per minute up to `rate` units; take() blocks until enough are available.
+    """
+
+    def __init__(self, rate_per_minute):
+        self.capacity = max(1.0, rate_per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount=1.0, timeout=None):
+        """
+        Take `amount` units, waiting for them at most `timeout` seconds (forever if None).
+        Returns False if they did not become available in time.
+        """
+        amount = min(float(amount), self.capacity)
+        give_up = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return True
+                wait = (amount - self.tokens) / self.rate
+            if give_up is not None:
+                left = give_up - time.monotonic()
+                if left <= 0 or wait > left:
+                    return False
+                wait = min(wait, left)
+            time.sleep(min(wait, 1.0))
+
+    def adjust(self, amount):
+        """
+        Charge (or refund, if negative) units after the fact, e.g. output tokens.
+        The balance may go negative, which delays the next callers.
+        """
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on concurrent model calls: grows by one slot per window of successful
+    calls, halves on a 429 and shrinks by a tenth on a latency spike.
+    """
+
+    def __init__(self, initial=INITIAL_CONCURRENCY, minimum=MIN_CONCURRENCY, maximum=MAX_CONCURRENCY):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.in_flight = 0
+        self.average_latency = None
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout=None):
+        """
+        Wait for a free slot, at most `timeout` seconds; returns False if none freed up.
+        timeout=0 takes a slot only if one is free now.
+        """
+        give_up = time.monotonic() + timeout if timeout is not None else None
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                left = give_up - time.monotonic() if give_up is not None else None
+                if left is not None and left <= 0:
+                    return False
+                self._condition.wait(left)
+            self.in_flight += 1
+            return True
+
+    def release(self, latency=None, throttled=False):
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit / 2)
+            elif latency is not None:
+                if self.average_latency is not None and latency > self.average_latency * LATENCY_SPIKE_FACTOR:
+                    self.limit = max(self.minimum, self.limit * 0.9)
+                else:
+                    self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                # Exponentially weighted average of recent latencies
+                if self.average_latency is None:
+                    self.average_latency = latency
+                else:
+                    self.average_latency = 0.9 * self.average_latency + 0.1 * latency
+            self._condition.notify_all()
+
+
+class LatencyWindow:
+    """
+    The most recent successful call latencies, for percentile estimates.
+    """
+
+    def __init__(self, size=HEDGE_WINDOW, min_samples=HEDGE_MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent):
+        """
+        Latency below which `percent` % of recent calls finished, or None with too few samples.
+        """
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+class RateLimiter:
+    """
+    Process-wide gate in front of the model: requests-per-minute and tokens-per-minute
+    buckets plus an adaptive concurrency limit.
+    """
+
+    def __init__(self):
+        self.requests = TokenBucket(REQUESTS_PER_MINUTE)
+        self.tokens = TokenBucket(TOKENS_PER_MINUTE)
+        self.concurrency = AdaptiveConcurrency()
+        self.latencies = LatencyWindow()
+        self._lock = threading.Lock()
+        self.stats = {
+            "calls": 0, "retries": 0, "throttled": 0, "failures": 0,
+            "timeouts": 0, "deadline_exceeded": 0, "hedges": 0, "hedge_wins": 0,
+        }
+
+    def acquire(self, input_tokens, timeout=None):
+        """
+        Wait for quota and a concurrency slot, at most `timeout` seconds (forever if None).
+        Returns False, with nothing taken, if they were not available in time.
+        """
+        give_up = time.monotonic() + timeout if timeout is not None else None
+
+        def left():
+            return max(0.0, give_up - time.monotonic()) if give_up is not None else None
+
+        if not self.requests.take(1, left()):
+            return False
+        if not self.tokens.take(input_tokens, left()):
+            self.requests.adjust(-1)
+            return False
+        if not self.concurrency.acquire(left()):
+            self.requests.adjust(-1)
+            self.tokens.adjust(-input_tokens)
+            return False
+        return True
+
+    def release(self, latency=None, output_tokens=0, error=None):
+        throttled = error is not None and is_throttle(error)
+        self.concurrency.release(None if error is not None else latency, throttled)
+        if output_tokens:
+            self.tokens.adjust(output_tokens)
+        if latency is not None and error is None:
+            self.latencies.add(latency)
+        with self._lock:
+            self.stats["calls"] += 1
+            if throttled:
+                self.stats["throttled"] += 1
+
+    def count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["concurrency_limit"] = round(self.concurrency.limit, 2)
+        stats["in_flight"] = self.concurrency.in_flight
+        stats["average_latency_ms"] = round((self.concurrency.average_latency or 0) * 1000, 1)
+        return stats
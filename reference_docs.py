@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from storage import LazyConnection
+
+# Directory holding the answer keys; an answer key's ID is its file name without extension
+REFERENCE_DIR = os.environ.get("REFERENCE_DIR", ".")
+# Answer key used when a request does not name one
+DEFAULT_ANSWER_KEY = os.environ.get("DEFAULT_ANSWER_KEY", "answer")
+# SQLite file recording uploaded handles so other workers and restarts reuse them
+REFERENCE_DB = os.environ.get("REFERENCE_DB", "reference_docs.sqlite3")
+# Uploaded files expire after 48 hours; re-upload when less than this many seconds remain
+REFRESH_MARGIN = int(os.environ.get("REFERENCE_REFRESH_MARGIN", "3600"))
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md")
+
+
+class UnknownAnswerKey(KeyError):
+    pass
+
+
+def file_hash(path):
+    """
+    SHA-256 of a file's content, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ReferenceRegistry:
+    """
+    Answer keys by ID, uploaded lazily and shared by content hash.
+    The same document is uploaded once however many IDs, workers or restarts refer to it,
+    and is uploaded again shortly before the remote copy expires.
+    backend_getter() returns the model backend that uploads the files (see llm).
+    """
+
+    def __init__(self, backend_getter, directory=REFERENCE_DIR, db_path=REFERENCE_DB):
+        self.backend_getter = backend_getter
+        self.directory = directory
+        self._paths = {}
+        self._hashes = {}
+        self._handles = {}
+        self._lock = threading.Lock()
+        self._upload_locks = {}
+        self._connection = LazyConnection(db_path, self._create_tables)
+        self._db_lock = threading.Lock()
+
+    @staticmethod
+    def _create_tables(db):
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS reference_files ("
+            "hash TEXT PRIMARY KEY, name TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        db.execute("CREATE TABLE IF NOT EXISTS reference_text (hash TEXT PRIMARY KEY, pages TEXT)")
+        db.commit()
+
+    @property
+    def _db(self):
+        return self._connection.get()
+
+    def register(self, doc_id, path):
+        """
+        Make a document available under doc_id, in addition to the files in the directory.
+        """
+        with self._lock:
+            self._paths[doc_id] = path
+
+    def resolve(self, doc_id=None):
+        """
+        Return the local path of an answer key.
+        """
+        doc_id = doc_id or DEFAULT_ANSWER_KEY
+        with self._lock:
+            path = self._paths.get(doc_id)
+        if path is None and os.path.basename(doc_id) == doc_id:
+            for extension in SUPPORTED_EXTENSIONS:
+                candidate = os.path.join(self.directory, doc_id + extension)
+                if os.path.isfile(candidate):
+                    path = candidate
+                    break
+        if path is None or not os.path.isfile(path):
+            raise UnknownAnswerKey(doc_id)
+        return path
+
+    def content_hash(self, doc_id=None):
+        """
+        Content hash of an answer key, recomputed only when the file changes.
+        """
+        path = self.resolve(doc_id)
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._hashes.get(path)
+            if cached is not None and cached[0] == stamp:
+                return cached[1]
+        digest = file_hash(path)
+        with self._lock:
+            self._hashes[path] = (stamp, digest)
+        return digest
+
+    def load_text(self, digest):
+        """
+        Return (found, pages) for text extracted earlier from this content, by any worker.
+        pages is None for documents without extractable text.
+        """
+        with self._db_lock:
+            row = self._db.execute("SELECT pages FROM reference_text WHERE hash = ?", (digest,)).fetchone()
+        if row is None:
+            return False, None
+        return True, json.loads(row[0]) if row[0] is not None else None
+
+    def save_text(self, digest, pages):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO reference_text (hash, pages) VALUES (?, ?)",
+                (digest, json.dumps(pages, ensure_ascii=False) if pages is not None else None),
+            )
+            self._db.commit()
+
+    def get_handle(self, doc_id=None):
+        """
+        Return an uploaded file handle for the answer key, uploading through the model
+        backend only when no live upload of the same content exists.
+        """
+        backend = self.backend_getter()
+        path = self.resolve(doc_id)
+        digest = self.content_hash(doc_id)
+
+        with self._lock:
+            cached = self._handles.get(digest)
+            if cached is not None and cached[1] - time.time() > REFRESH_MARGIN:
+                return cached[0]
+            upload_lock = self._upload_locks.setdefault(digest, threading.Lock())
+
+        with upload_lock:
+            with self._lock:
+                cached = self._handles.get(digest)
+                if cached is not None and cached[1] - time.time() > REFRESH_MARGIN:
+                    return cached[0]
+
+            # Another worker or an earlier run may already have uploaded this content
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT name, expires FROM reference_files WHERE hash = ?", (digest,)
+                ).fetchone()
+            handle = None
+            if row is not None and row[1] - time.time() > REFRESH_MARGIN:
+                try:
+                    handle = backend.get_file(row[0])
+                    expires = row[1]
+                except Exception:
+                    handle = None
+
+            if handle is None:
+                handle, expires = backend.upload_file(path, f"{os.path.basename(path)}:{digest[:12]}")
+                with self._db_lock:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO reference_files (hash, name, expires) VALUES (?, ?, ?)",
+                        (digest, handle.name, expires),
+                    )
+                    self._db.commit()
+
+            with self._lock:
+                self._handles[digest] = (handle, expires)
+            return handle
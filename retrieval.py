@@ -0,0 +1,147 @@
+import importlib.util
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+# Passages put in the prompt for each question
+RETRIEVAL_TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", "3"))
+# Target passage size in words when a page has no question markers to split on
+CHUNK_WORDS = int(os.environ.get("RETRIEVAL_CHUNK_WORDS", "120"))
+CHUNK_OVERLAP = int(os.environ.get("RETRIEVAL_CHUNK_OVERLAP", "30"))
+
+# Lines that start a new question / answer in an answer key, e.g. "Q1.", "Question 3", "4)", "प्रश्न 2"
+QUESTION_MARKER = re.compile(
+    r"^\s*(?:(?:q|que|ques|question|ans|answer|प्रश्न|उत्तर)\s*[\.:]?\s*\d+|\d+\s*[\.\)])",
+    re.IGNORECASE | re.MULTILINE,
+)
+TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN.findall(text.casefold())
+
+
+def extract_text(path):
+    """
+    Return the text of every page of a PDF or text file, or None when no text can be
+    extracted (e.g. a scanned PDF, or pypdf is not installed).
+    """
+    if not path.lower().endswith(".pdf"):
+        with open(path, encoding="utf-8", errors="replace") as handle:
+            return [handle.read()]
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return None
+    try:
+        pages = [page.extract_text() or "" for page in PdfReader(path).pages]
+    except Exception:
+        return None
+    return pages if any(page.strip() for page in pages) else None
+
+
+def chunk_pages(pages):
+    """
+    Split the answer key into passages, one per question where the document marks
+    questions, otherwise into overlapping word windows.
+    """
+    text = "\n".join(pages)
+    starts = [match.start() for match in QUESTION_MARKER.finditer(text)]
+    if len(starts) >= 2:
+        bounds = ([0] if starts[0] > 0 else []) + starts + [len(text)]
+        pieces = [text[start:end] for start, end in zip(bounds, bounds[1:])]
+    else:
+        pieces = [text]
+
+    passages = []
+    for piece in pieces:
+        words = piece.split()
+        if not words:
+            continue
+        if len(words) <= CHUNK_WORDS * 2:
+            passages.append(" ".join(words))
+            continue
+        step = max(1, CHUNK_WORDS - CHUNK_OVERLAP)
+        for start in range(0, len(words), step):
+            passages.append(" ".join(words[start:start + CHUNK_WORDS]))
+            if start + CHUNK_WORDS >= len(words):
+                break
+    return passages
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a list of passages.
+    """
+
+    def __init__(self, passages, k1=1.5, b=0.75):
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+        self._terms = [Counter(tokenize(passage)) for passage in passages]
+        self._lengths = [sum(terms.values()) for terms in self._terms]
+        self._average = (sum(self._lengths) / len(self._lengths)) if passages else 0
+        document_frequency = Counter()
+        for terms in self._terms:
+            document_frequency.update(terms.keys())
+        count = len(passages)
+        self._idf = {
+            term: math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+
+    def search(self, query, k=RETRIEVAL_TOP_K):
+        """
+        Return up to k passages ranked by relevance to the query.
+        """
+        query_terms = set(tokenize(query))
+        scored = []
+        for index, terms in enumerate(self._terms):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[index] / (self._average or 1))
+            for term in query_terms:
+                frequency = terms.get(term)
+                if frequency:
+                    score += self._idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+            if score > 0:
+                scored.append((score, index))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [self.passages[index] for _, index in scored[:k]]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(references, doc_id=None):
+    """
+    Return the BM25 index of an answer key, built once per document content.
+    None means the document has no extractable text and must be attached whole.
+    Extracted text is kept by the registry, so other workers and restarts skip the
+    (slow, for scanned PDFs) extraction.
+    """
+    digest = references.content_hash(doc_id)
+    with _indexes_lock:
+        if digest in _indexes:
+            return _indexes[digest]
+    found, pages = references.load_text(digest)
+    if not found:
+        pages = extract_text(references.resolve(doc_id))
+        # Without pypdf "no text" is not a property of the document, so it is not kept
+        if pages is not None or importlib.util.find_spec("pypdf") is not None:
+            references.save_text(digest, pages)
+    index = BM25Index(chunk_pages(pages)) if pages else None
+    with _indexes_lock:
+        _indexes[digest] = index
+    return index
+
+
+def format_excerpts(passages):
+    """
+    Render retrieved passages for a prompt.
+    """
+    if not passages:
+        return "(no matching passage found in the answer key)"
+    return "\n\n".join(f"[Excerpt {number}]\n{passage}" for number, passage in enumerate(passages, 1))
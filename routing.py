@@ -0,0 +1,240 @@
+import json
+import os
+import re
+import threading
+import time
+
+import answer_facts
+import metrics
+import prompts
+from llm import MODEL_NAME
+from ratelimit import LatencyWindow
+
+# Model behind each tier; "standard" is the model every mode used before routing
+MODEL_TIERS = {
+    "fast": os.environ.get("GEMINI_MODEL_FAST", "gemini-1.5-flash-8b"),
+    "standard": MODEL_NAME,
+    "large": os.environ.get("GEMINI_MODEL_LARGE", "gemini-1.5-pro"),
+}
+# Tiers tried, in order, when a pair's tier has its circuit open
+FALLBACKS = {
+    "fast": ["standard", "large"],
+    "standard": ["fast", "large"],
+    "large": ["standard", "fast"],
+}
+# Routing rules: a JSON list, or the path of a JSON file holding one (see DEFAULT_RULES)
+ROUTING_RULES = os.environ.get("MODEL_ROUTING_RULES", "")
+# Consecutive failed or slow calls that open a tier's circuit, and seconds before it is tried again
+BREAKER_FAILURES = int(os.environ.get("ROUTING_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN_SECONDS = float(os.environ.get("ROUTING_BREAKER_COOLDOWN_SECONDS", "30"))
+# A call slower than this counts against its tier like a failure
+BREAKER_SLOW_SECONDS = float(os.environ.get("ROUTING_BREAKER_SLOW_SECONDS", "15"))
+
+# First matching rule wins. Conditions: types / subjects / modes (case-insensitive
+# substrings of the payload's "Type", "Subject" and the mode), math (the question or
+# answer holds a math expression), min_words / max_words (answer length) and
+# min_expected_words (the payload's word_count). A rule without conditions always matches.
+DEFAULT_RULES = [
+    {"tier": "fast", "types": list(prompts.SHORT_TYPES)},
+    {"tier": "large", "math": True},
+    {"tier": "large", "subjects": ["math", "गणित"]},
+    {"tier": "large", "min_words": 150},
+    {"tier": "large", "min_expected_words": 150},
+    {"tier": "fast", "max_words": 15},
+    {"tier": "standard"},
+]
+
+MATH_EXPRESSION = re.compile(
+    r"\d\s*[+*×÷^=<>≤≥]\s*[\d(a-z]|[a-z]\s*[=^]\s*[\d(a-z]|[√∫∑∏π∞≈≠]|\\(?:frac|sqrt|int|sum)"
+    r"|\b(?:sin|cos|tan|log|ln|lim|dx|dy)\b",
+    re.IGNORECASE,
+)
+
+
+def load_rules(setting=ROUTING_RULES):
+    if not setting:
+        return DEFAULT_RULES
+    if os.path.isfile(setting):
+        with open(setting, encoding="utf-8") as handle:
+            return json.load(handle)
+    return json.loads(setting)
+
+
+def has_math(text):
+    return bool(MATH_EXPRESSION.search(str(text)))
+
+
+def features(mode, question, user_answer, data):
+    """
+    Local facts a routing rule can test, worked out without the model.
+    """
+    return {
+        "mode": mode,
+        "type": str(data.get("Type") or ""),
+        "subject": str(data.get("Subject") or data.get("subject") or ""),
+        "math": has_math(question) or has_math(user_answer),
+        "words": len(answer_facts.words(user_answer)),
+        "expected_words": answer_facts.expected_words(data.get("word_count")),
+    }
+
+
+def matches(rule, facts):
+    for field, key in (("types", "type"), ("subjects", "subject"), ("modes", "mode")):
+        if field in rule:
+            value = facts[key].casefold()
+            if not any(str(option).casefold() in value for option in rule[field]):
+                return False
+    if "math" in rule and facts["math"] != rule["math"]:
+        return False
+    if "min_words" in rule and facts["words"] < rule["min_words"]:
+        return False
+    if "max_words" in rule and facts["words"] > rule["max_words"]:
+        return False
+    if "min_expected_words" in rule and (facts["expected_words"] or 0) < rule["min_expected_words"]:
+        return False
+    return True
+
+
+class CircuitBreaker:
+    """
+    Stops routing to a tier after BREAKER_FAILURES consecutive failed or slow calls.
+    After the cooldown one trial pair is let through; its outcome closes the circuit
+    again or restarts the cooldown. A trial that never reports back (it ran out of
+    request time, or failed before the model was called) is replaced by another one
+    after a further cooldown, so the tier is never shut out for good.
+    """
+
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN_SECONDS):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self.trial_started = 0.0
+        self.opened = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            now = time.monotonic()
+            if self.state == "open" and now - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+                self.trial_started = now
+                return True
+            if self.state == "half_open" and now - self.trial_started >= self.cooldown:
+                # The last trial was lost, let another one through
+                self.trial_started = now
+                return True
+            return False
+
+    def abandon(self):
+        """
+        Settle a trial that ended without an outcome for the tier: the next pair is the new trial.
+        """
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+
+    def record(self, ok):
+        with self._lock:
+            if ok:
+                self.state = "closed"
+                self.consecutive = 0
+                return
+            self.consecutive += 1
+            if self.state == "half_open" or (self.state == "closed" and self.consecutive >= self.failures):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.opened += 1
+
+
+class Router:
+    """
+    Picks the model tier for each question-answer pair from its local features, skipping
+    tiers whose circuit is open, and keeps per-tier volume and latency.
+    """
+
+    def __init__(self, tiers=None, rules=None, fallbacks=None):
+        self.tiers = dict(tiers or MODEL_TIERS)
+        self.rules = rules if rules is not None else load_rules()
+        self.fallbacks = fallbacks or FALLBACKS
+        unknown = {rule.get("tier") for rule in self.rules} - set(self.tiers)
+        if unknown:
+            raise ValueError(f"Routing rules name unknown tiers: {', '.join(map(str, unknown))}")
+        self.breakers = {tier: CircuitBreaker() for tier in self.tiers}
+        self.latencies = {tier: LatencyWindow(min_samples=1) for tier in self.tiers}
+        self._lock = threading.Lock()
+        self.stats = {
+            tier: {"routed": 0, "fallback_in": 0, "calls": 0, "failures": 0, "slow": 0, "seconds": 0.0}
+            for tier in self.tiers
+        }
+
+    def tier_for(self, mode, question, user_answer, data):
+        """
+        The tier the rules pick for a pair. Evaluations are cached under this tier's model.
+        """
+        facts = features(mode, question, user_answer, data)
+        return next((rule["tier"] for rule in self.rules if matches(rule, facts)), "standard")
+
+    def admit(self, wanted, pairs=1):
+        """
+        Return the tier that actually grades pairs the rules sent to `wanted`: that tier,
+        or its first fallback whose circuit is closed (the wanted tier if all are open).
+        """
+        tier = next(
+            (candidate for candidate in [wanted] + self.fallbacks.get(wanted, []) if self.breakers[candidate].allow()),
+            wanted,
+        )
+        metrics.MODEL_TIER_PAIRS.inc(pairs, tier=tier)
+        with self._lock:
+            self.stats[tier]["routed"] += pairs
+            if tier != wanted:
+                self.stats[tier]["fallback_in"] += pairs
+        return tier
+
+    def model(self, tier):
+        return self.tiers[tier]
+
+    def record(self, tier, seconds, error=None):
+        """
+        Count one model call of a tier and feed its outcome to the tier's circuit breaker.
+        """
+        slow = error is None and seconds > BREAKER_SLOW_SECONDS
+        self.breakers[tier].record(error is None and not slow)
+        metrics.MODEL_TIER_SECONDS.observe(seconds, tier=tier)
+        if error is None:
+            self.latencies[tier].add(seconds)
+        with self._lock:
+            stats = self.stats[tier]
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            if error is not None:
+                stats["failures"] += 1
+            if slow:
+                stats["slow"] += 1
+
+    def abandon(self, tier):
+        """
+        A call of the tier ended without saying anything about it (e.g. the request's deadline passed).
+        """
+        self.breakers[tier].abandon()
+
+    def get_stats(self):
+        with self._lock:
+            stats = {tier: dict(values) for tier, values in self.stats.items()}
+        for tier, values in stats.items():
+            seconds = values.pop("seconds")
+            values["model"] = self.tiers[tier]
+            values["circuit"] = self.breakers[tier].state
+            values["circuit_opened"] = self.breakers[tier].opened
+            values["average_latency_ms"] = round(seconds / values["calls"] * 1000, 1) if values["calls"] else 0
+            for percent in (50, 95):
+                latency = self.latencies[tier].percentile(percent)
+                values[f"p{percent}_latency_ms"] = round(latency * 1000, 1) if latency is not None else None
+        return stats
+
+
+# Shared by every mode and request in the process
+router = Router()
@@ -0,0 +1,144 @@
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from executor import map_ordered
+from timing import stage
+
+# Which search backend to use: "serpapi" for live results, "stub" for local testing
+SEARCH_PROVIDER = os.environ.get("SEARCH_PROVIDER", "serpapi")
+# Seconds a search result is reused
+SEARCH_CACHE_TTL = int(os.environ.get("SEARCH_CACHE_TTL", "3600"))
+# Number of distinct queries kept in memory
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", "4096"))
+# Longer queries are cut, search engines ignore most of a long text anyway
+SEARCH_QUERY_MAX_CHARS = int(os.environ.get("SEARCH_QUERY_MAX_CHARS", "256"))
+
+
+def normalize_query(text):
+    """
+    Normalize a query so answers that differ only in case, spacing or trailing
+    punctuation share one search.
+    """
+    text = unicodedata.normalize("NFKC", str(text)).casefold()
+    text = " ".join(text.split())
+    text = re.sub(r"^[\W_]+|[\W_]+$", "", text)
+    if len(text) > SEARCH_QUERY_MAX_CHARS:
+        # Cut on a word boundary
+        text = text[:SEARCH_QUERY_MAX_CHARS].rsplit(" ", 1)[0]
+    return text
+
+
+class SerpAPIProvider:
+    """
+    Live search through langchain's SerpAPIWrapper, created on first use.
+    """
+
+    def __init__(self):
+        self._search = None
+        self._lock = threading.Lock()
+
+    def run(self, query):
+        if self._search is None:
+            with self._lock:
+                if self._search is None:
+                    from langchain_community.utilities import SerpAPIWrapper
+                    os.environ["SERPAPI_API_KEY"]
+                    self._search = SerpAPIWrapper()
+        return self._search.run(query)
+
+
+class StubSearchProvider:
+    """
+    Offline provider returning a deterministic result, for tests and load runs.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    def run(self, query):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return f"Stub search result for: {query}"
+
+
+def make_provider(name=SEARCH_PROVIDER):
+    if name == "stub":
+        return StubSearchProvider(float(os.environ.get("SEARCH_STUB_DELAY", "0")))
+    if name == "serpapi":
+        return SerpAPIProvider()
+    raise ValueError(f"Unknown search provider: {name}")
+
+
+class SearchCache:
+    """
+    TTL cache in front of a search provider. Concurrent lookups of one query share a
+    single search call.
+    """
+
+    def __init__(self, provider=None, ttl=SEARCH_CACHE_TTL, size=SEARCH_CACHE_SIZE):
+        self.provider = provider or make_provider()
+        self.ttl = ttl
+        self.size = size
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "errors": 0}
+
+    def search(self, text):
+        """
+        Return the search result for text, from the cache when still fresh.
+        """
+        query = normalize_query(text)
+        if not query:
+            return ""
+
+        with self._lock:
+            entry = self._entries.get(query)
+            if entry is not None and time.time() - entry[1] <= self.ttl:
+                self._entries.move_to_end(query)
+                self.stats["hits"] += 1
+                return entry[0]
+            waiter = self._inflight.get(query)
+            owner = waiter is None
+            if owner:
+                waiter = {"event": threading.Event(), "result": None}
+                self._inflight[query] = waiter
+                self.stats["misses"] += 1
+            else:
+                self.stats["hits"] += 1
+
+        if not owner:
+            waiter["event"].wait()
+            return waiter["result"] or ""
+
+        try:
+            with stage("search"):
+                result = self.provider.run(query)
+            with self._lock:
+                self._entries[query] = (result, time.time())
+                self._entries.move_to_end(query)
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+            waiter["result"] = result
+            return result
+        except Exception:
+            # Failed searches are not cached; the model grades without them
+            with self._lock:
+                self.stats["errors"] += 1
+            return ""
+        finally:
+            with self._lock:
+                self._inflight.pop(query, None)
+            waiter["event"].set()
+
+    def prefetch(self, texts, concurrency=None):
+        """
+        Run the searches for every text concurrently and return the results in input order.
+        """
+        return map_ordered(self.search, [(text,) for text in texts], concurrency=concurrency)
@@ -0,0 +1,569 @@
+from flask import Flask, Response, g, request, jsonify, url_for
+from werkzeug.exceptions import RequestEntityTooLarge
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+import deadline
+import llm
+import metrics
+import ocr
+import prompts
+import retrieval
+import routing
+import summarize
+from evaluators import EVALUATORS, InvalidRequest, evaluation_cache, references, search
+from eventlog import LOG_SAMPLE_RATE, SLOW_REQUEST_SECONDS, log_event
+from grading import DEFAULT_MODE, iter_evaluations, read_payload, run_job
+from jobs import JobQueue, is_callback_url
+from reference_docs import UnknownAnswerKey
+from submissions import SubmissionConflict, SubmissionStore
+from timing import stage, start_request
+
+# Largest request body accepted: the upload limit of scans and documents, plus room for
+# the payload field and the multipart framing. Larger bodies get a 413 before they are read.
+MAX_REQUEST_BYTES = ocr.OCR_MAX_UPLOAD_BYTES + 1024 * 1024
+
+# One job queue per process, shared by every mode
+job_queue = None
+# Every /evaluate submission and its evaluations, by submission ID
+submission_store = SubmissionStore()
+# Background work (job workers, warmup) runs in the process that serves requests,
+# which for pre-fork servers is not the one that imported the app
+_started_pid = None
+_start_lock = threading.Lock()
+# Set once the warmup has finished; /ready reports 503 until then
+warmed_up = threading.Event()
+warmup_errors = {}
+
+# Counters kept by the shared caches and the rate limiter, read on every scrape
+metrics.Collected(
+    "eval_evaluation_cache_total", "Evaluation cache lookups by result.", "event",
+    lambda: {key: value for key, value in evaluation_cache.get_stats().items()
+             if key in ("memory_hits", "disk_hits", "misses", "coalesced", "evictions")},
+)
+metrics.Collected("eval_search_cache_total", "Search cache lookups by result.", "event", lambda: dict(search.stats))
+metrics.Collected(
+    "eval_context_cache_total", "Cached prompt context lookups by result.", "event",
+    lambda: {key: value for key, value in llm.contexts.get_stats().items() if key != "entries"},
+)
+metrics.Collected(
+    "eval_model_calls_total", "Model calls, retries, 429 responses, calls that ran out of retries or time, and hedges.", "event",
+    lambda: {key: value for key, value in llm.limiter.get_stats().items()
+             if key in ("calls", "retries", "throttled", "failures", "timeouts", "deadline_exceeded",
+                        "hedges", "hedge_wins")},
+)
+metrics.Collected(
+    "eval_model_concurrency", "Current adaptive concurrency limit and calls in flight.", "value",
+    lambda: {key: value for key, value in llm.limiter.get_stats().items() if key in ("concurrency_limit", "in_flight")},
+    kind="gauge",
+)
+metrics.Collected(
+    "eval_model_tier_circuit_open", "1 while a model tier's circuit breaker keeps pairs away from it.", "tier",
+    lambda: {tier: int(breaker.state != "closed") for tier, breaker in routing.router.breakers.items()},
+    kind="gauge",
+)
+
+
+# Streaming response format requested by the client, if any
+def requested_stream_format():
+    stream = request.args.get("stream", "")
+    accept = request.headers.get("Accept", "")
+    if stream == "sse" or "text/event-stream" in accept:
+        return "sse"
+    if stream in ("1", "true", "ndjson") or "application/x-ndjson" in accept:
+        return "ndjson"
+    return None
+
+
+# Function to stream evaluations as NDJSON lines or Server-Sent Events
+def stream_evaluations(events, questions, stream_format):
+    """
+    Send every {"ID", "Evaluation"} record as soon as it is ready, then a summary record.
+    If the client disconnects the generator is closed and the unfinished work is cancelled.
+    """
+    started = time.time()
+    scores = []
+    timed_out = []
+
+    def encode(record, event):
+        text = json.dumps(record, ensure_ascii=False)
+        if stream_format == "sse":
+            return f"event: {event}\ndata: {text}\n\n"
+        return text + "\n"
+
+    try:
+        for index, evaluation in events:
+            if evaluation.get("Score") is not None:
+                scores.append(evaluation["Score"])
+            elif evaluation.get("Error") == "deadline_exceeded":
+                timed_out.append(questions[index]["ID"])
+            yield encode({"ID": questions[index]["ID"], "Evaluation": evaluation}, "evaluation")
+        yield encode({"summary": {
+            "count": len(questions),
+            "graded": len(scores),
+            "average_score": round(sum(scores) / len(scores), 2) if scores else 0,
+            "timed_out": timed_out,
+            "elapsed_ms": int((time.time() - started) * 1000),
+        }}, "summary")
+    finally:
+        events.close()
+
+
+# Function to claim a submission ID, waiting while another request grades the same submission
+def begin_submission(submission_id, data, mode, total):
+    """
+    Return (status, graded) from SubmissionStore.begin. A retry that arrives while the
+    first attempt is still grading waits for it, until the request's deadline.
+    """
+    while True:
+        status, graded = submission_store.begin(submission_id, data, mode, total)
+        if status != "running" or deadline.remaining(0) < 0.25:
+            return status, graded
+        time.sleep(0.25)
+
+
+# Function to store evaluations as they are produced
+def stored_evaluations(submission_id, data, questions, graded, pending, events):
+    """
+    Yield the answers graded by an earlier attempt, then the new evaluations as they
+    finish, writing each to the submission store. events yields (position in pending, evaluation).
+    """
+    finished = False
+    try:
+        for index, evaluation in graded.items():
+            yield index, evaluation
+        for position, evaluation in events:
+            index = pending[position]
+            submission_store.save(submission_id, index, questions[index]["ID"], evaluation, data)
+            yield index, evaluation
+        finished = True
+    finally:
+        events.close()
+        if finished:
+            submission_store.finish(submission_id)
+        else:
+            submission_store.release(submission_id)
+
+
+# Function to load what the first evaluation would otherwise wait for
+def warm_up():
+    """
+    Create the model client (importing its SDK) and index the default answer key, or
+    upload it when it is a scanned PDF. Failures are recorded, not raised: the
+    request that needs the resource retries it.
+    """
+    started = time.perf_counter()
+    steps = [("model_backend", llm.get_backend), ("answer_key", warm_answer_key)]
+    for name, step in steps:
+        try:
+            step()
+        except Exception as e:
+            warmup_errors[name] = str(e)
+    log_event("warmup_done", duration_ms=round((time.perf_counter() - started) * 1000, 1), errors=warmup_errors)
+    warmed_up.set()
+
+
+def warm_answer_key():
+    if retrieval.get_index(references) is None:
+        references.get_handle()
+
+
+def start_background():
+    """
+    Start the job workers and the warmup of this process, once.
+    """
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+        warmed_up.clear()
+        job_queue.start()
+        threading.Thread(target=warm_up, name="warmup", daemon=True).start()
+
+
+def create_app(default_mode=DEFAULT_MODE):
+    """
+    Build the evaluation service. Every mode is available on every instance;
+    default_mode only applies to requests that do not send "mode".
+    """
+    global job_queue
+    app = Flask(__name__)
+    app.config["MAX_CONTENT_LENGTH"] = MAX_REQUEST_BYTES
+
+    if job_queue is None:
+        # Queued submissions survive restarts; workers pick up unfinished jobs once started
+        job_queue = JobQueue(run_job)
+
+    @app.before_request
+    def begin_request():
+        # Nothing runs at import; the first request (usually the /ready probe) starts the workers
+        start_background()
+        # Correlation ID from the caller (or a new one), echoed back and attached to every log line
+        g.started = time.perf_counter()
+        g.timings = start_request(request.headers.get("X-Request-ID") or uuid.uuid4().hex)
+        # A body declared too large is refused before any route reads it; Werkzeug stops
+        # bodies without a length at the same limit while they are read
+        if request.content_length is not None and request.content_length > app.config["MAX_CONTENT_LENGTH"]:
+            return request_too_large(None)
+
+    @app.errorhandler(RequestEntityTooLarge)
+    def request_too_large(e):
+        return jsonify({"error": f"Request too large, the limit is {app.config['MAX_CONTENT_LENGTH']} bytes."}), 413
+
+    @app.after_request
+    def finish_request(response):
+        elapsed = time.perf_counter() - g.started
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.REQUEST_SECONDS.observe(elapsed, route=route, method=request.method)
+        metrics.REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+        response.headers["X-Request-ID"] = g.timings.request_id
+        if elapsed > SLOW_REQUEST_SECONDS:
+            log_event(
+                "slow_request", logging.WARNING, route=route, status=response.status_code,
+                duration_ms=round(elapsed * 1000, 1), stages=g.timings.server_timing(),
+            )
+        return response
+
+    # Flask route to evaluate user answers
+    @app.route('/evaluate', methods=['POST'])
+    def evaluate():
+        """
+        Endpoint to evaluate question-answer pairs.
+        Expects a JSON payload with the format:
+        {
+            "mode": "class_board",  (optional: class_board, plain, search or reference)
+            "Class": "10th",
+            "Board": "CBSE",
+            "Type": "one mark",
+            "questions": [
+                {"ID": "1", "Text": "Where is India located?"},
+                {"ID": "2", "Text": "Capital of France?", "Options": {"A": "Delhi", "B": "Paris"}, "Answer": "B"}
+            ],
+            "answers": [
+                {"ID": "1", "Text": "India is in USA"},
+                {"ID": "2", "Text": "B"}
+            ],
+            "answer_key": "answer", (reference mode, document to grade against)
+            "concurrency": 4,       (optional, pairs evaluated at the same time)
+            "batch": true,          (optional, several pairs per model call, also ?batch=1)
+            "deadline_seconds": 20, (optional, at most REQUEST_DEADLINE_SECONDS)
+            "submission_id": "...", (optional, also the Idempotency-Key header)
+            "exam_id": "...", "student_id": "..."  (optional, for looking results up later)
+        }
+        The plain and search modes also accept just a list of "answers".
+        Answers still ungraded when the deadline passes come back with Score null and
+        Error "deadline_exceeded", and their IDs are listed in "timed_out".
+        A submission sent with a submission ID is stored under it (echoed in "submission_id"
+        and the Submission-ID header) for SUBMISSION_TTL. Sending the same ID again returns
+        the stored evaluations without grading anything, or grades only the answers an
+        interrupted attempt did not finish; reusing an ID for a different payload is a 422.
+        Submissions without an ID are graded but not stored.
+        With "Accept: application/x-ndjson" (or ?stream=ndjson) each evaluation is streamed as one
+        JSON line as soon as it is ready; "Accept: text/event-stream" (or ?stream=sse) sends
+        Server-Sent Events. Both end with a {"summary": ...} record.
+        """
+        timings = g.timings
+        try:
+            # Get the JSON data from the request
+            with stage("request_parse"):
+                data = request.get_json(silent=True)
+                if isinstance(data, dict) and request.args.get("mode"):
+                    data = dict(data, mode=request.args["mode"])
+                evaluator, questions, answers = read_payload(data, default_mode)
+            deadline.start(data.get("deadline_seconds"))
+
+            # Only a submission the client can send again under the same ID is worth storing
+            submission_id = request.headers.get("Idempotency-Key") or data.get("submission_id")
+            status, graded = "new", {}
+            if submission_id:
+                submission_id = str(submission_id)
+                with stage("submission_store"):
+                    status, graded = begin_submission(submission_id, data, evaluator.name, len(questions))
+            if status == "running":
+                return jsonify({"error": f"Submission {submission_id} is still being graded.",
+                                "submission_id": submission_id}), 409
+            if status == "done":
+                # A retry of a finished submission: nothing is graded again
+                response = jsonify({
+                    "evaluations": [
+                        {"ID": question["ID"], "Evaluation": graded[index]} for index, question in enumerate(questions)
+                    ],
+                    "submission_id": submission_id,
+                })
+                response.headers["Idempotent-Replayed"] = "true"
+                response.headers["Submission-ID"] = submission_id
+                return response, 200
+
+            batch_mode = data.get("batch") or request.args.get("batch") in ("1", "true")
+            pending = [index for index in range(len(questions)) if index not in graded]
+            events = iter_evaluations(
+                evaluator, data, [questions[index] for index in pending], [answers[index] for index in pending],
+                batch_mode, data.get("concurrency"),
+            )
+            if submission_id:
+                events = stored_evaluations(submission_id, data, questions, graded, pending, events)
+
+            stream_format = requested_stream_format()
+            if stream_format:
+                mimetype = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+                response = Response(stream_evaluations(events, questions, stream_format), mimetype=mimetype)
+                if submission_id:
+                    response.headers["Submission-ID"] = submission_id
+                return response
+
+            # Collect the evaluations back into input order
+            results = [None] * len(questions)
+            for index, evaluation in events:
+                results[index] = evaluation
+            evaluations = [
+                {"ID": question["ID"], "Evaluation": evaluation}
+                for question, evaluation in zip(questions, results)
+            ]
+
+            log_event("evaluations", sample_rate=LOG_SAMPLE_RATE, mode=evaluator.name, evaluations=evaluations)
+            body = {"evaluations": evaluations}
+            if submission_id:
+                body["submission_id"] = submission_id
+            timed_out = [
+                record["ID"] for record in evaluations if record["Evaluation"].get("Error") == "deadline_exceeded"
+            ]
+            if timed_out:
+                body["timed_out"] = timed_out
+            with stage("serialize"):
+                response = jsonify(body)
+            # Per-stage time for this request, read by the benchmark suite
+            response.headers["Server-Timing"] = timings.server_timing()
+            if submission_id:
+                response.headers["Submission-ID"] = submission_id
+            return response, 200
+
+        except InvalidRequest as e:
+            return jsonify({"error": str(e)}), 400
+        except SubmissionConflict as e:
+            return jsonify({"error": str(e)}), 422
+        except Exception as e:
+            log_event("evaluate_error", logging.ERROR, error=str(e))
+            return jsonify({"error": str(e)}), 500
+
+    # Flask route to grade a scanned answer sheet
+    @app.route('/evaluate/scan', methods=['POST'])
+    def evaluate_scan():
+        """
+        Accepts a scanned answer sheet as multipart "file" fields (one multi-page PDF or one
+        image per page) with the usual /evaluate payload, minus "answers", as a JSON "payload"
+        field. A single PDF or image may also be sent as the raw request body, with the
+        payload in ?payload=.
+        Pages are transcribed in parallel, split into answers at the question markers
+        ("Q1.", "Ans 2", "3)", "प्रश्न 4" or the question IDs) and graded as in /evaluate.
+        Uploads are spooled to disk and removed afterwards.
+        """
+        try:
+            with stage("request_parse"):
+                try:
+                    data = json.loads(request.form.get("payload") or request.args.get("payload") or "{}")
+                except ValueError:
+                    raise InvalidRequest("Invalid JSON in payload.")
+                if not isinstance(data, dict):
+                    raise InvalidRequest("Invalid JSON payload.")
+                if request.args.get("mode"):
+                    data = dict(data, mode=request.args["mode"])
+            deadline.start(data.get("deadline_seconds"))
+
+            with ocr.Spool() as spool:
+                with stage("upload_spool"):
+                    files = request.files.getlist("file")
+                    if files:
+                        paths = [spool.save(upload.stream, upload.mimetype, upload.filename) for upload in files]
+                    elif request.mimetype in ocr.EXTENSIONS:
+                        paths = [spool.save(request.stream, request.mimetype)]
+                    else:
+                        raise InvalidRequest("No scan uploaded. Send a PDF or page images as 'file'.")
+                    pages = spool.split_pages(paths)
+                evaluations, answers = ocr.grade_scan(data, pages, default_mode, data.get("concurrency"))
+
+            with stage("serialize"):
+                response = jsonify({"evaluations": evaluations, "answers": answers, "pages": len(pages)})
+            response.headers["Server-Timing"] = g.timings.server_timing()
+            return response, 200
+
+        except RequestEntityTooLarge as e:
+            return request_too_large(e)
+        except InvalidRequest as e:
+            return jsonify({"error": str(e)}), 400
+        except deadline.DeadlineExceeded as e:
+            # The pages could not all be read in time, so there are no answers to grade
+            return jsonify({"error": str(e)}), 504
+        except Exception as e:
+            log_event("evaluate_scan_error", logging.ERROR, error=str(e))
+            return jsonify({"error": str(e)}), 500
+
+    # Flask route to summarize a document
+    @app.route('/summarize', methods=['POST'])
+    def summarize_document():
+        """
+        Accepts a PDF or text file as a multipart "file" field or as the raw request body,
+        or names a document already on the server (e.g. an answer key) as "document".
+        Options ("words", default 50, "concurrency", "deadline_seconds") come from the
+        query string, form fields or a JSON body.
+        Summaries are cached by the document's content hash; large documents are
+        summarized in page-range chunks in parallel and the partial summaries combined.
+        """
+        try:
+            with stage("request_parse"):
+                options = dict(request.args.items())
+                options.update(request.form.items())
+                body = request.get_json(silent=True)
+                if isinstance(body, dict):
+                    options.update(body)
+            deadline.start(options.get("deadline_seconds"))
+
+            with ocr.Spool() as spool:
+                with stage("upload_spool"):
+                    upload = request.files.get("file")
+                    if upload is not None:
+                        path = spool.save(upload.stream, upload.mimetype, upload.filename)
+                    elif request.mimetype in ocr.EXTENSIONS:
+                        path = spool.save(request.stream, request.mimetype)
+                    elif options.get("document"):
+                        try:
+                            path = references.resolve(str(options["document"]))
+                        except UnknownAnswerKey as e:
+                            return jsonify({"error": f"Unknown document: {e.args[0]}"}), 404
+                    else:
+                        raise InvalidRequest("No document. Send a PDF or text file as 'file', or a document ID as 'document'.")
+                    if not path.lower().endswith((".pdf",) + summarize.TEXT_EXTENSIONS):
+                        raise InvalidRequest("Only PDF and text documents can be summarized.")
+                result = summarize.summarize_file(path, options.get("words"), options.get("concurrency"))
+
+            response = jsonify(result)
+            response.headers["Server-Timing"] = g.timings.server_timing()
+            return response, 200
+
+        except RequestEntityTooLarge as e:
+            return request_too_large(e)
+        except InvalidRequest as e:
+            return jsonify({"error": str(e)}), 400
+        except deadline.DeadlineExceeded as e:
+            return jsonify({"error": str(e)}), 504
+        except llm.ModelUnavailable as e:
+            return jsonify({"error": str(e)}), 503
+        except Exception as e:
+            log_event("summarize_error", logging.ERROR, error=str(e))
+            return jsonify({"error": str(e)}), 500
+
+    # Flask route to queue a whole answer sheet for background grading
+    @app.route('/evaluate/jobs', methods=['POST'])
+    def create_job():
+        """
+        Accepts the same payload as /evaluate, plus an optional "callback_url" (http or https)
+        that receives the finished job as a JSON POST. Returns a job ID immediately.
+        """
+        try:
+            data = request.get_json(silent=True)
+            if isinstance(data, dict):
+                data = dict(data, mode=request.args.get("mode") or data.get("mode") or default_mode)
+            evaluator, questions, answers = read_payload(data, default_mode)
+            callback_url = data.get("callback_url")
+            if callback_url is not None and not is_callback_url(callback_url):
+                raise InvalidRequest("callback_url must be an http or https URL.")
+
+            job_id = job_queue.submit(data, len(questions), callback_url)
+            return jsonify({
+                "job_id": job_id,
+                "status": "queued",
+                "status_url": url_for("get_job", job_id=job_id),
+            }), 202
+
+        except InvalidRequest as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    # Flask route to check progress and partial results of a job
+    @app.route('/evaluate/jobs/<job_id>', methods=['GET'])
+    def get_job(job_id):
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found."}), 404
+        return jsonify(job), 200
+
+    # Flask route to read back a stored submission
+    @app.route('/submissions/<submission_id>', methods=['GET'])
+    def get_submission(submission_id):
+        submission = submission_store.get(submission_id)
+        if submission is None:
+            return jsonify({"error": "Submission not found."}), 404
+        return jsonify(submission), 200
+
+    # Flask route to look up stored evaluations by exam, student and question
+    @app.route('/submissions', methods=['GET'])
+    def search_submissions():
+        filters = {name: request.args.get(name) for name in ("exam_id", "student_id", "question_id")}
+        if not any(filters.values()):
+            return jsonify({"error": "Give at least one of exam_id, student_id or question_id."}), 400
+        try:
+            limit = int(request.args.get("limit", 100))
+        except ValueError:
+            return jsonify({"error": "limit must be an integer."}), 400
+        return jsonify({"evaluations": submission_store.search(limit=limit, **filters)}), 200
+
+    @app.route("/modes", methods=["GET"])
+    def modes():
+        return jsonify({"default": default_mode, "modes": sorted(EVALUATORS)})
+
+    @app.route("/cache/stats", methods=["GET"])
+    def cache_stats():
+        return jsonify({
+            "evaluations": evaluation_cache.get_stats(),
+            "search": search.stats,
+            "contexts": llm.contexts.get_stats(),
+        })
+
+    @app.route("/search/stats", methods=["GET"])
+    def search_stats():
+        return jsonify(search.stats)
+
+    @app.route("/limits/stats", methods=["GET"])
+    def limits_stats():
+        return jsonify(llm.limiter.get_stats())
+
+    # Pairs, calls, failures, latency and circuit state per model tier
+    @app.route("/routing/stats", methods=["GET"])
+    def routing_stats():
+        return jsonify({"tiers": routing.router.get_stats(), "rules": routing.router.rules})
+
+    # Prompt and reply tokens per evaluation mode, to see where prompt size goes
+    @app.route("/tokens/stats", methods=["GET"])
+    def token_stats():
+        return jsonify({"modes": llm.token_usage.get_stats(), "prompt_compaction": prompts.PROMPT_COMPACTION})
+
+    @app.route("/metrics", methods=["GET"])
+    def prometheus_metrics():
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    # Readiness probe: 503 until the warmup has finished, unlike /hello which only shows the process is up
+    @app.route("/ready", methods=["GET"])
+    def ready():
+        if not warmed_up.is_set():
+            return jsonify({"status": "warming_up"}), 503
+        return jsonify({"status": "ready", "warmup_errors": warmup_errors}), 200
+
+    @app.route("/hello", methods=["GET"])
+    def hello():
+        return jsonify({"message": "hello"})
+
+    return app
+
+
+# Run the Flask app
+if __name__ == '__main__':
+    app = create_app()
+    start_background()
+    app.run(host='0.0.0.0', port=9000, threaded=True)
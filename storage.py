@@ -0,0 +1,32 @@
+import os
+import sqlite3
+import threading
+
+
+class LazyConnection:
+    """
+    SQLite connection opened on first use rather than when its owner is created, so
+    importing a module does no file I/O. A process forked after the connection was
+    opened (pre-fork servers) gets a fresh connection of its own.
+
+    setup(connection) runs once per connection, e.g. to create tables.
+    """
+
+    def __init__(self, path, setup=None, timeout=5.0):
+        self.path = path
+        self.setup = setup
+        self.timeout = timeout
+        self._connection = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._connection is None or self._pid != os.getpid():
+            with self._lock:
+                if self._connection is None or self._pid != os.getpid():
+                    connection = sqlite3.connect(self.path, check_same_thread=False, timeout=self.timeout)
+                    if self.setup is not None:
+                        self.setup(connection)
+                    self._connection = connection
+                    self._pid = os.getpid()
+        return self._connection
@@ -0,0 +1,246 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from storage import LazyConnection
+
+# SQLite file keeping submissions sent with an ID, so retries and downstream systems can read results back
+SUBMISSION_DB = os.environ.get("SUBMISSION_DB", "submissions.sqlite3")
+# Seconds a submission is kept after its last update, 0 keeps it forever
+SUBMISSION_TTL = int(os.environ.get("SUBMISSION_TTL", str(30 * 24 * 3600)))
+# A submission still marked running after this many seconds without progress is taken over by a retry
+SUBMISSION_STALE_SECONDS = int(os.environ.get("SUBMISSION_STALE_SECONDS", "120"))
+# Most results returned by one search
+SEARCH_LIMIT = 1000
+
+# Payload fields that change how a submission is processed, not what is graded
+VOLATILE_FIELDS = ("concurrency", "deadline_seconds", "batch")
+
+
+class SubmissionConflict(Exception):
+    """
+    Raised when a submission ID is reused for a different payload (HTTP 422).
+    """
+
+
+def fingerprint(data):
+    """
+    Hash of what a payload asks to grade, so a retry can be told apart from a new paper
+    sent under the same ID.
+    """
+    content = {key: value for key, value in data.items() if key not in VOLATILE_FIELDS}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class SubmissionStore:
+    """
+    Graded submissions by ID, with every evaluation stored as soon as it is ready and
+    indexed by exam, student and question.
+
+    A submission is "running" while it is graded, then "done" when every answer got a
+    score, or "partial" when some could not be graded (model errors, deadline); a retry
+    of a partial submission only grades the answers that are missing.
+    Submissions not updated for ttl seconds are deleted with their evaluations.
+    """
+
+    def __init__(self, path=SUBMISSION_DB, ttl=SUBMISSION_TTL):
+        self.ttl = ttl
+        self._connection = LazyConnection(path, self._create_tables, timeout=30)
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    @staticmethod
+    def _create_tables(db):
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS submissions (
+                id TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                exam_id TEXT,
+                student_id TEXT,
+                mode TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS submissions_exam ON submissions (exam_id, student_id);
+            CREATE INDEX IF NOT EXISTS submissions_updated ON submissions (updated);
+            CREATE TABLE IF NOT EXISTS submission_results (
+                submission_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                question_id TEXT NOT NULL,
+                exam_id TEXT,
+                student_id TEXT,
+                evaluation TEXT NOT NULL,
+                graded INTEGER NOT NULL,
+                PRIMARY KEY (submission_id, idx)
+            );
+            CREATE INDEX IF NOT EXISTS submission_results_lookup
+                ON submission_results (exam_id, student_id, question_id);
+            """
+        )
+        db.commit()
+
+    @property
+    def _db(self):
+        return self._connection.get()
+
+    def begin(self, submission_id, data, mode, total):
+        """
+        Register a submission before grading it. Returns (status, graded) where status is
+        "new", "done" (answer from the store), "running" (another request is grading it
+        right now) or "resume", and graded maps the index of every answer already
+        graded to its evaluation.
+        Raises SubmissionConflict if the ID was used for a different payload.
+        """
+        digest = fingerprint(data)
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT fingerprint, status, updated FROM submissions WHERE id = ?", (submission_id,)
+                ).fetchone()
+                if row is None:
+                    self._db.execute(
+                        "INSERT INTO submissions (id, fingerprint, exam_id, student_id, mode, total, status, "
+                        "created, updated) VALUES (?, ?, ?, ?, ?, ?, 'running', ?, ?)",
+                        (submission_id, digest, data.get("exam_id"), data.get("student_id"), mode, total, now, now),
+                    )
+                    self._writes += 1
+                    # Drop old submissions now and then rather than on every new one
+                    if self._writes % 100 == 0:
+                        self._prune(now)
+                    return "new", {}
+                if row[0] != digest:
+                    raise SubmissionConflict(f"Submission {submission_id} was already used for a different payload.")
+                if row[1] == "running" and row[2] > now - SUBMISSION_STALE_SECONDS:
+                    return "running", {}
+                if row[1] != "done":
+                    self._db.execute(
+                        "UPDATE submissions SET status = 'running', updated = ? WHERE id = ?", (now, submission_id)
+                    )
+                graded = {
+                    index: json.loads(evaluation)
+                    for index, evaluation in self._db.execute(
+                        "SELECT idx, evaluation FROM submission_results WHERE submission_id = ? AND graded = 1",
+                        (submission_id,),
+                    )
+                }
+                return ("done" if row[1] == "done" else "resume"), graded
+            finally:
+                self._db.commit()
+
+    def _prune(self, now):
+        if not self.ttl:
+            return
+        cutoff = now - self.ttl
+        self._db.execute(
+            "DELETE FROM submission_results WHERE submission_id IN (SELECT id FROM submissions WHERE updated < ?)",
+            (cutoff,),
+        )
+        self._db.execute("DELETE FROM submissions WHERE updated < ?", (cutoff,))
+
+    def save(self, submission_id, index, question_id, evaluation, data):
+        """
+        Store one evaluation of a running submission.
+        """
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO submission_results "
+                "(submission_id, idx, question_id, exam_id, student_id, evaluation, graded) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    submission_id, index, str(question_id), data.get("exam_id"), data.get("student_id"),
+                    json.dumps(evaluation, ensure_ascii=False), int(evaluation.get("Score") is not None),
+                ),
+            )
+            self._db.execute("UPDATE submissions SET updated = ? WHERE id = ?", (time.time(), submission_id))
+            self._db.commit()
+
+    def finish(self, submission_id):
+        """
+        Mark a submission done, or partial if any answer is still ungraded.
+        """
+        with self._lock:
+            self._db.execute(
+                "UPDATE submissions SET updated = ?, status = CASE WHEN "
+                "(SELECT COUNT(*) FROM submission_results WHERE submission_id = ? AND graded = 1) >= total "
+                "THEN 'done' ELSE 'partial' END WHERE id = ?",
+                (time.time(), submission_id, submission_id),
+            )
+            self._db.commit()
+
+    def release(self, submission_id):
+        """
+        Give up a running submission without finishing it (the client went away), so a retry can resume it.
+        """
+        with self._lock:
+            self._db.execute(
+                "UPDATE submissions SET status = 'partial', updated = ? WHERE id = ? AND status = 'running'",
+                (time.time(), submission_id),
+            )
+            self._db.commit()
+
+    def get(self, submission_id):
+        """
+        Return a stored submission with its evaluations in question order, or None.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT exam_id, student_id, mode, total, status, created, updated FROM submissions WHERE id = ?",
+                (submission_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            results = self._db.execute(
+                "SELECT question_id, evaluation FROM submission_results WHERE submission_id = ? ORDER BY idx",
+                (submission_id,),
+            ).fetchall()
+        exam_id, student_id, mode, total, status, created, updated = row
+        return {
+            "submission_id": submission_id,
+            "exam_id": exam_id,
+            "student_id": student_id,
+            "mode": mode,
+            "status": status,
+            "total": total,
+            "evaluations": [{"ID": question_id, "Evaluation": json.loads(evaluation)} for question_id, evaluation in results],
+            "created": created,
+            "updated": updated,
+        }
+
+    def search(self, exam_id=None, student_id=None, question_id=None, limit=SEARCH_LIMIT):
+        """
+        Stored evaluations matching every filter given, newest submissions first, at most
+        limit (clamped to 1..SEARCH_LIMIT) of them.
+        """
+        conditions = []
+        params = []
+        for column, value in (("r.exam_id", exam_id), ("r.student_id", student_id), ("r.question_id", question_id)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(str(value))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT r.submission_id, r.exam_id, r.student_id, r.question_id, r.evaluation "
+                "FROM submission_results r JOIN submissions s ON s.id = r.submission_id "
+                f"{where} ORDER BY s.created DESC, r.idx LIMIT ?",
+                # SQLite reads a negative LIMIT as no limit at all
+                params + [max(1, min(int(limit), SEARCH_LIMIT))],
+            ).fetchall()
+        return [
+            {
+                "submission_id": submission_id,
+                "exam_id": exam,
+                "student_id": student,
+                "ID": question,
+                "Evaluation": json.loads(evaluation),
+            }
+            for submission_id, exam, student, question, evaluation in rows
+        ]
@@ -0,0 +1,244 @@
+import hashlib
+import itertools
+import json
+import os
+
+import llm
+import prompts
+from eval_cache import EvaluationCache
+from evaluators import InvalidRequest
+from executor import iter_completed, map_ordered
+from reference_docs import file_hash
+from timing import stage
+
+# SQLite file keeping document summaries and the partial summaries they were built from
+SUMMARY_CACHE_PATH = os.environ.get("SUMMARY_CACHE_PATH", "summaries.sqlite3")
+# Seconds a summary is reused
+SUMMARY_CACHE_TTL = int(os.environ.get("SUMMARY_CACHE_TTL", str(30 * 24 * 3600)))
+# Model that writes the summaries
+SUMMARY_MODEL = os.environ.get("SUMMARY_MODEL", llm.MODEL_NAME)
+# Summary length when the request does not ask for one (context.py asked for 50 words)
+SUMMARY_WORDS = int(os.environ.get("SUMMARY_WORDS", "50"))
+# A chunk is a run of consecutive pages: at most this many pages and about this many tokens
+SUMMARY_CHUNK_PAGES = int(os.environ.get("SUMMARY_CHUNK_PAGES", "10"))
+SUMMARY_CHUNK_TOKENS = int(os.environ.get("SUMMARY_CHUNK_TOKENS", "8000"))
+# Length of the partial summaries of chunks and groups, before the final one
+SUMMARY_PARTIAL_WORDS = int(os.environ.get("SUMMARY_PARTIAL_WORDS", "150"))
+# Partial summaries combined by one reduce call
+SUMMARY_FAN_IN = int(os.environ.get("SUMMARY_FAN_IN", "8"))
+# Chunks of one document summarized at the same time
+SUMMARY_CONCURRENCY = int(os.environ.get("SUMMARY_CONCURRENCY", "8"))
+# Largest number of pages read from one document
+SUMMARY_MAX_PAGES = int(os.environ.get("SUMMARY_MAX_PAGES", "1000"))
+# Text files have no pages; they are cut into pages of about this many characters
+TEXT_PAGE_CHARS = 3000
+# Documents without extractable text are sent whole, inline, up to this size
+INLINE_MAX_BYTES = 20 * 1024 * 1024
+
+# Bump whenever the prompts change so summaries from the old prompts are not reused
+SUMMARY_PROMPT_VERSION = "summary-1"
+
+TEXT_EXTENSIONS = (".txt", ".md")
+
+MAP_PROMPT = """
+Summarize pages {first}-{last} of a document in at most {words} words. Keep names, numbers and key terms.
+Reply with only the summary.
+"""
+
+REDUCE_PROMPT = """
+Below are summaries of consecutive parts of one document, in page order.
+Combine them into one summary of the whole document in at most {words} words.
+Reply with only the summary.
+"""
+
+# The original context.py prompt, for documents the model has to read whole
+WHOLE_DOCUMENT_PROMPT = """
+Give me a summary of this pdf file in {words} words.
+Reply with only the summary.
+"""
+
+# Summaries and partial summaries, by document hash or by prompt
+summaries = EvaluationCache(path=SUMMARY_CACHE_PATH, ttl=SUMMARY_CACHE_TTL)
+
+
+def cache_key(*parts):
+    parts = [SUMMARY_PROMPT_VERSION, SUMMARY_MODEL] + [str(part) for part in parts]
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def text_pages(path):
+    with open(path, encoding="utf-8", errors="replace") as handle:
+        page = []
+        size = 0
+        for line in handle:
+            # A form feed starts a new page, as in text exported from a PDF
+            while "\f" in line:
+                before, line = line.split("\f", 1)
+                page.append(before)
+                yield "".join(page)
+                page, size = [], 0
+            page.append(line)
+            size += len(line)
+            if size >= TEXT_PAGE_CHARS:
+                yield "".join(page)
+                page, size = [], 0
+        if page:
+            yield "".join(page)
+
+
+def pdf_pages(path):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        # Without pypdf the document is sent whole
+        return
+    with open(path, "rb") as handle:
+        try:
+            reader = PdfReader(handle)
+            count = len(reader.pages)
+        except Exception:
+            raise InvalidRequest("The PDF could not be read.")
+        # Refuse before any page is summarized
+        if count > SUMMARY_MAX_PAGES:
+            raise InvalidRequest(f"Too many pages, the limit is {SUMMARY_MAX_PAGES}.")
+        for page in reader.pages:
+            try:
+                yield page.extract_text() or ""
+            except Exception:
+                yield ""
+
+
+def iter_pages(path):
+    """
+    Yield the text of a PDF or text file one page at a time, read from disk as it goes.
+    Pages without extractable text (scans) come out empty.
+    """
+    pages = text_pages(path) if path.lower().endswith(TEXT_EXTENSIONS) else pdf_pages(path)
+    for number, page in enumerate(pages, 1):
+        if number > SUMMARY_MAX_PAGES:
+            raise InvalidRequest(f"Too many pages, the limit is {SUMMARY_MAX_PAGES}.")
+        yield page
+
+
+def iter_chunks(pages, max_pages=None, max_tokens=None):
+    """
+    Group pages into (first page, last page, text) chunks of consecutive pages. Pages
+    without text are skipped; a single page over the token budget is a chunk of its own.
+    """
+    max_pages = max_pages or SUMMARY_CHUNK_PAGES
+    max_tokens = max_tokens or SUMMARY_CHUNK_TOKENS
+    chunk = []
+    first = last = None
+    tokens = 0
+    for number, text in enumerate(pages, 1):
+        text = text.strip()
+        if not text:
+            continue
+        cost = llm.estimate_tokens(text)
+        if chunk and (len(chunk) >= max_pages or tokens + cost > max_tokens):
+            yield first, last, "\n\n".join(chunk)
+            chunk, tokens, first = [], 0, None
+        first = first or number
+        last = number
+        chunk.append(text)
+        tokens += cost
+    if chunk:
+        yield first, last, "\n\n".join(chunk)
+
+
+def generate(prompt):
+    """
+    One summarization call, reused when the exact same prompt was answered before.
+    """
+    def call():
+        with llm.charge("summary"):
+            return llm.generate(prompt, SUMMARY_MODEL).strip()
+
+    return summaries.get_or_compute(cache_key("call", prompt), call, cacheable=bool)
+
+
+def summarize_chunk(first, last, text, words):
+    with stage("summary_map"):
+        return first, last, generate(f"{prompts.fill(MAP_PROMPT, first=first, last=last, words=words)}\n\n{text}")
+
+
+def combine(parts, words):
+    """
+    Summarize a run of partial summaries, given as (first page, last page, summary), into one.
+    """
+    listed = "\n\n".join(f"[pages {first}-{last}]\n{summary}" for first, last, summary in parts)
+    with stage("summary_reduce"):
+        summary = generate(f"{prompts.fill(REDUCE_PROMPT, words=words)}\n\n{listed}")
+    return parts[0][0], parts[-1][1], summary
+
+
+def summarize_whole(path, words):
+    """
+    context.py's one-shot summary, for PDFs without extractable text: the model reads the file itself.
+    """
+    if os.path.getsize(path) > INLINE_MAX_BYTES:
+        raise InvalidRequest("The document has no extractable text and is too large to send whole.")
+    with open(path, "rb") as handle:
+        document = {"mime_type": "application/pdf", "data": handle.read()}
+    with stage("summary_map"), llm.charge("summary"):
+        return llm.generate([prompts.fill(WHOLE_DOCUMENT_PROMPT, words=words), document], SUMMARY_MODEL).strip()
+
+
+def build_summary(path, words, concurrency=None):
+    """
+    Map-reduce summary of a document: chunks are summarized in parallel as their pages
+    are read, then the partial summaries are combined SUMMARY_FAN_IN at a time, level by
+    level, until one is left. A document that fits one chunk takes a single call.
+    """
+    concurrency = concurrency or SUMMARY_CONCURRENCY
+    chunks = iter_chunks(iter_pages(path))
+    head = list(itertools.islice(chunks, 2))
+    if not head:
+        if path.lower().endswith(TEXT_EXTENSIONS):
+            raise InvalidRequest("The document is empty.")
+        return {"summary": summarize_whole(path, words), "chunks": 1, "levels": 0}
+    if len(head) == 1:
+        _, _, summary = summarize_chunk(*head[0], words)
+        return {"summary": summary, "chunks": 1, "levels": 0}
+
+    parts = {}
+    for index, part in iter_completed(
+        lambda first, last, text: summarize_chunk(first, last, text, SUMMARY_PARTIAL_WORDS),
+        itertools.chain(head, chunks), concurrency,
+    ):
+        parts[index] = part
+    parts = [parts[index] for index in range(len(parts))]
+    chunk_count = len(parts)
+
+    levels = 0
+    while len(parts) > 1:
+        final = len(parts) <= SUMMARY_FAN_IN
+        groups = [(parts[start:start + SUMMARY_FAN_IN],) for start in range(0, len(parts), SUMMARY_FAN_IN)]
+        parts = map_ordered(
+            lambda group: combine(group, words if final else SUMMARY_PARTIAL_WORDS), groups, concurrency,
+        )
+        levels += 1
+    return {"summary": parts[0][2], "chunks": chunk_count, "levels": levels}
+
+
+def summarize_file(path, words=None, concurrency=None):
+    """
+    Summarize a PDF or text file in about `words` words, served from the cache when the
+    same content was summarized at the same length before. Returns the summary with the
+    document hash, chunk count, reduce levels and whether it came from the cache.
+    """
+    try:
+        words = int(words) if words is not None else SUMMARY_WORDS
+    except (TypeError, ValueError):
+        raise InvalidRequest("words must be a number.")
+    if not 10 <= words <= 1000:
+        raise InvalidRequest("words must be between 10 and 1000.")
+
+    with stage("summary_hash"):
+        digest = file_hash(path)
+    key = cache_key("document", digest, words)
+    result = summaries.lookup(key)
+    cached = result is not None
+    if not cached:
+        result = summaries.get_or_compute(key, lambda: build_summary(path, words, concurrency))
+    return dict(result, document_hash=digest, words=words, cached=cached)
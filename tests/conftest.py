@@ -0,0 +1,20 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep every store out of the working tree and never call a real model
+_scratch = tempfile.mkdtemp(prefix="tests-")
+os.environ.setdefault("LLM_BACKEND", "stub")
+os.environ.setdefault("SEARCH_PROVIDER", "stub")
+os.environ.setdefault("EVAL_CACHE_PATH", "")
+for name, filename in (
+    ("SUBMISSION_DB", "submissions.sqlite3"),
+    ("JOB_DB", "jobs.sqlite3"),
+    ("REFERENCE_DB", "reference_docs.sqlite3"),
+    ("CONTEXT_CACHE_DB", "context_cache.sqlite3"),
+    ("SUMMARY_CACHE_PATH", "summaries.sqlite3"),
+):
+    os.environ.setdefault(name, os.path.join(_scratch, filename))
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+import batching
+import grading
+import llm
+import ratelimit
+from evaluators import get_evaluator
+
+
+BATCH = [(str(number), f"Question {number}?", f"Answer {number}") for number in range(1, 4)]
+
+
+def single(question, answer):
+    return {"Score": 50, "Feedback": f"Graded alone: {answer}"}
+
+
+def test_failed_batch_call_is_not_retried_pair_by_pair():
+    calls = []
+
+    def generate(prompt, pairs):
+        calls.append(pairs)
+        raise llm.ModelUnavailable("quota")
+
+    def must_not_run(question, answer):
+        raise AssertionError("a failed batch must not fall back to single pairs")
+
+    results = batching.evaluate_batch("Grade it.", BATCH, generate, must_not_run)
+    assert calls == [3]
+    assert [result["Error"] for result in results] == ["model_unavailable"] * 3
+    assert all(result["Score"] is None for result in results)
+
+
+def test_pairs_missing_from_the_reply_are_graded_alone():
+    def generate(prompt, pairs):
+        return json.dumps([{"ID": "1", "Score": 80, "Feedback": "Good."}, {"ID": "3", "Score": "?", "Feedback": ""}])
+
+    results = batching.evaluate_batch("Grade it.", BATCH, generate, single)
+    assert results[0] == {"Score": 80, "Feedback": "Good."}
+    assert results[1]["Feedback"] == "Graded alone: Answer 2"
+    assert results[2]["Feedback"] == "Graded alone: Answer 3"
+
+
+@pytest.fixture
+def throttled_backend(monkeypatch):
+    backend = llm.StubBackend(latency_ms=0, distribution="fixed", error_rate=1)
+    backend.error_code = 429
+    monkeypatch.setattr(llm, "_backend", backend)
+    monkeypatch.setattr(ratelimit, "backoff_delay", lambda attempt: 0)
+    return backend
+
+
+def test_quota_storm_costs_one_batch_worth_of_calls(throttled_backend):
+    evaluator = get_evaluator("class_board")
+    pairs = [(f"Unique question {number}?", f"Unique answer {number}") for number in range(10)]
+
+    results = dict(grading.iter_pairs_batched(evaluator, {"Class": "8"}, pairs, concurrency=1))
+
+    assert len(results) == 10
+    assert all(evaluation["Score"] is None for evaluation in results.values())
+    # Only the batch call and its retries, never ten single calls on top
+    assert throttled_backend.calls == ratelimit.RETRY_ATTEMPTS + 1
@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+import bulk_grade
+
+
+@pytest.fixture
+def graded(monkeypatch):
+    # Grading itself is not under test; every payload gets one fixed evaluation
+    monkeypatch.setattr(bulk_grade, "grade_submission", lambda data, *args: [{"ID": "1", "Evaluation": {"Score": 1}}])
+    monkeypatch.setattr(
+        bulk_grade, "grade_submissions", lambda payloads, *args: [[{"ID": "1", "Evaluation": {"Score": 1}}]] * len(payloads),
+    )
+
+
+def write_input(path, lines):
+    path.write_text("".join(line + "\n" for line in lines), encoding="utf-8")
+
+
+@pytest.mark.parametrize("window", [0, 4])
+def test_blank_lines_do_not_hold_the_checkpoint_back(tmp_path, graded, window):
+    payload = json.dumps({"answers": [{"ID": "1", "Text": "x"}]})
+    source = tmp_path / "in.jsonl"
+    write_input(source, ["", payload] + [payload] * 10 + ["  ", payload, payload, ""])
+    output = tmp_path / "out.jsonl"
+
+    assert bulk_grade.run(str(source), str(output), workers=2, dedupe_window=window) == 13
+
+    state = json.loads((tmp_path / "out.jsonl.checkpoint").read_text())
+    assert state["done"] == []
+    assert state["watermark"] == 16
+    # A second run has nothing left to grade
+    assert bulk_grade.run(str(source), str(output), workers=2, dedupe_window=window) == 0
@@ -0,0 +1,51 @@
+import threading
+import time
+
+import jobs
+
+
+def test_slow_running_job_is_not_claimed_twice(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_STALE_SECONDS", 0.4)
+    monkeypatch.setattr(jobs, "JOB_HEARTBEAT_SECONDS", 0.1)
+    release = threading.Event()
+
+    def handler(payload, done):
+        # A model call stuck in the rate limiter, well past the stale limit
+        release.wait(5)
+        yield 0, {"ID": "1"}
+
+    queue = jobs.JobQueue(handler, path=str(tmp_path / "jobs.sqlite3"), workers=0)
+    job_id = queue.submit({"answers": []}, 1)
+    claimed = queue._claim()
+    assert claimed[0] == job_id
+    worker = threading.Thread(target=queue._run, args=claimed)
+    worker.start()
+    try:
+        time.sleep(1.0)
+        assert queue._claim() is None
+    finally:
+        release.set()
+        worker.join(5)
+    assert queue.get(job_id)["status"] == "done"
+
+
+def test_callback_url_must_be_http():
+    assert jobs.is_callback_url("https://lms.example.com/hooks/graded")
+    assert jobs.is_callback_url("http://10.0.0.5:8080/cb")
+    for url in ("file:///etc/passwd", "ftp://example.com/x", "/relative/path", "http://", 42):
+        assert not jobs.is_callback_url(url)
+
+
+def test_job_with_a_file_callback_is_refused():
+    import service
+
+    client = service.create_app().test_client()
+    payload = {
+        "mode": "plain",
+        "questions": [{"ID": "1", "Text": "Capital of France?"}],
+        "answers": [{"ID": "1", "Text": "Paris"}],
+        "callback_url": "file:///etc/passwd",
+    }
+    response = client.post("/evaluate/jobs", json=payload)
+    assert response.status_code == 400
+    assert "callback_url" in response.get_json()["error"]
@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+import llm
+from evaluators import get_evaluator
+
+
+class FeedbackFirstBackend(llm.StubBackend):
+    """
+    A model that writes "Feedback" before "Score" and is cut off at its token cap.
+    """
+
+    def __init__(self):
+        super().__init__(latency_ms=0, distribution="fixed")
+        self.caps = []
+
+    def generate(self, contents, model_name, response_schema=None, max_output_tokens=None, context=None,
+                 timeout=None):
+        self.caps.append(max_output_tokens)
+        reply = json.dumps({"Feedback": "The answer is mostly right. " * 40, "Score": 72})
+        return reply[:max_output_tokens * 4]
+
+
+def test_score_is_recovered_from_a_truncated_score_first_reply():
+    evaluation = llm.parse_evaluation('{"Score": 64, "Feedback": "Good start, but the second law is miss')
+    assert evaluation["Score"] == 64
+    assert evaluation["Feedback"].startswith("Good start")
+
+
+def test_truncated_feedback_first_reply_has_no_score():
+    with pytest.raises(llm.ResponseParseError):
+        llm.parse_evaluation('{"Feedback": "Good start, but the second law is miss')
+
+
+def test_prompt_asks_for_the_score_first():
+    prompt = get_evaluator("plain").build_prompt("Define force.", "A push or pull.", {}, None)
+    assert '"Score" first' in prompt
+    assert prompt.index('"Score"') < prompt.index('"Feedback"')
+
+
+def test_truncated_feedback_first_reply_is_retried_with_more_room(monkeypatch):
+    backend = FeedbackFirstBackend()
+    monkeypatch.setattr(llm, "_backend", backend)
+    evaluator = get_evaluator("plain")
+    cap = llm.FEEDBACK_TIERS[evaluator.feedback_length({})][1]
+
+    evaluation = evaluator.evaluate_llm("Define force.", "A push or pull on an object.", {})
+
+    assert evaluation["Score"] == 72
+    assert backend.caps == [cap, 2 * cap]
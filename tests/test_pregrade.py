@@ -0,0 +1,37 @@
+import pytest
+
+from evaluators import InvalidRequest
+from grading import read_payload
+from pregrade import parse_tolerance, pregrade
+
+
+def payload(tolerance):
+    return {
+        "mode": "plain",
+        "questions": [{"ID": "1", "Text": "g in m/s²?", "Answer": "9.8", "Tolerance": tolerance}],
+        "answers": [{"ID": "1", "Text": "9.81"}],
+    }
+
+
+def test_numeric_tolerance_is_applied():
+    assert pregrade("g in m/s²?", "9.81", "9.8", tolerance="0.05")["Score"] == 100
+    assert pregrade("g in m/s²?", "9.81", "9.8", tolerance=0.001)["Score"] == 0
+
+
+def test_bad_tolerance_falls_back_to_an_exact_comparison():
+    assert pregrade("g in m/s²?", "9.81", "9.8", tolerance="abc")["Score"] == 0
+    assert pregrade("g in m/s²?", "9.8", "9.8", tolerance="abc")["Score"] == 100
+
+
+@pytest.mark.parametrize("tolerance", ["abc", "", True, float("nan"), [0.1]])
+def test_bad_tolerance_is_an_invalid_request(tolerance):
+    assert parse_tolerance(tolerance) is None
+    with pytest.raises(InvalidRequest, match="Tolerance"):
+        read_payload(payload(tolerance))
+
+
+def test_bad_tolerance_is_a_400():
+    import service
+
+    response = service.create_app().test_client().post("/evaluate", json=payload("abc"))
+    assert response.status_code == 400
@@ -0,0 +1,30 @@
+import pytest
+
+import service
+import submissions
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = submissions.SubmissionStore(path=str(tmp_path / "submissions.sqlite3"))
+    for number in range(5):
+        data = {"exam_id": "exam", "student_id": f"s{number}"}
+        store.begin(f"sub-{number}", data, "plain", 1)
+        store.save(f"sub-{number}", 0, "1", {"Score": 50, "Feedback": "ok"}, data)
+    monkeypatch.setattr(service, "submission_store", store)
+    return store
+
+
+def test_search_limit_is_clamped(store, monkeypatch):
+    monkeypatch.setattr(submissions, "SEARCH_LIMIT", 3)
+    assert len(store.search(exam_id="exam", limit=-1)) == 1
+    assert len(store.search(exam_id="exam", limit=0)) == 1
+    assert len(store.search(exam_id="exam", limit=100)) == 3
+
+
+@pytest.mark.parametrize("limit, status, count", [("-1", 200, 1), ("2", 200, 2), ("abc", 400, None), ("1.5", 400, None)])
+def test_search_route_limit(store, limit, status, count):
+    response = service.create_app().test_client().get(f"/submissions?exam_id=exam&limit={limit}")
+    assert response.status_code == status
+    if count is not None:
+        assert len(response.get_json()["evaluations"]) == count
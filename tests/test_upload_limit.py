@@ -0,0 +1,44 @@
+import io
+import json
+
+import pytest
+
+import ocr
+import service
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(service, "MAX_REQUEST_BYTES", 64 * 1024)
+
+    def spool_not_reached(*args, **kwargs):
+        raise AssertionError("an oversized upload must be refused before it is spooled")
+
+    monkeypatch.setattr(ocr, "Spool", spool_not_reached)
+    return service.create_app().test_client()
+
+
+def test_oversized_multipart_scan_is_a_413(client):
+    response = client.post(
+        "/evaluate/scan",
+        data={"payload": json.dumps({"mode": "plain"}), "file": (io.BytesIO(b"%PDF" + b"0" * 200 * 1024), "sheet.pdf")},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 413
+    assert "too large" in response.get_json()["error"]
+
+
+def test_oversized_raw_scan_is_a_413(client):
+    response = client.post("/evaluate/scan", data=b"%PDF" + b"0" * 200 * 1024, content_type="application/pdf")
+    assert response.status_code == 413
+
+
+def test_oversized_document_summary_is_a_413(client):
+    response = client.post("/summarize", data=b"word " * 50 * 1024, content_type="text/plain")
+    assert response.status_code == 413
+
+
+@pytest.mark.parametrize("route", ["/evaluate", "/evaluate/jobs"])
+def test_oversized_json_is_a_413(client, route):
+    response = client.post(route, json={"mode": "plain", "answers": [{"ID": "1", "Text": "x" * 200 * 1024}]})
+    assert response.status_code == 413
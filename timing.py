@@ -0,0 +1,67 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+# Stage timings of the request being handled; worker threads see the same recorder
+# because the executor runs every task in a copy of the submitting context.
+_current = contextvars.ContextVar("stage_timings", default=None)
+
+
+class StageTimings:
+    """
+    Total seconds and call count per pipeline stage for one request.
+    request_id correlates the request's log lines.
+    """
+
+    def __init__(self, request_id=None):
+        self.request_id = request_id
+        self._lock = threading.Lock()
+        self.stages = {}
+
+    def add(self, name, seconds):
+        with self._lock:
+            total, count = self.stages.get(name, (0.0, 0))
+            self.stages[name] = (total + seconds, count + 1)
+
+    def server_timing(self):
+        """
+        Render the timings as a Server-Timing header value (durations in milliseconds).
+        """
+        with self._lock:
+            return ", ".join(
+                f"{name};dur={total * 1000:.1f};desc=\"{count}\"" for name, (total, count) in self.stages.items()
+            )
+
+
+def start_request(request_id=None):
+    """
+    Begin collecting stage timings for the current request and return the recorder.
+    """
+    timings = StageTimings(request_id)
+    _current.set(timings)
+    return timings
+
+
+def current_request_id():
+    timings = _current.get()
+    return timings.request_id if timings is not None else None
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a block of work as one occurrence of stage `name`, for the current request's
+    Server-Timing header and the process-wide stage histogram.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.STAGE_SECONDS.observe(elapsed, stage=name)
+        timings = _current.get()
+        if timings is not None:
+            timings.add(name, elapsed)